@@ -0,0 +1,51 @@
+import numpy as np
+
+from yurena_age_classes import (
+    assign_age_classes,
+    capacity_factors,
+    class_of_age,
+    class_shares,
+)
+
+
+def soh_progression(lifespans, years):
+    """Linear SoH curves of depots x vehicle types that reach 0 at their lifespan and drop below it afterwards."""
+    age = np.arange(years + 1)
+    return 1 - age / np.asarray(lifespans, dtype=np.float64)[..., None]
+
+
+def test_capacity_factors_are_remaining_capacity():
+    lifespans = np.array([[4, 8, 12], [6, 9, 12]])
+    classes = class_of_age(lifespans, 3)
+    progression = soh_progression(lifespans, 12)
+    progression[1, 2] = np.nan  # pair without vehicles
+    factors = capacity_factors(progression, classes, 3)
+
+    assert np.all((factors >= 0.8) & (factors <= 1))
+    # older classes have less capacity
+    assert np.all(np.diff(factors, axis=1) <= 0)
+    # the youngest class of the third vehicle type holds the ages 0 to 3, with a SoH of 2/3 at the end of age 3
+    assert np.isclose(factors[2, 0], 0.8 + 0.2 * 2 / 3)
+
+
+def test_capacity_factors_of_classes_without_vehicles():
+    classes = class_of_age(np.array([[5]]), 2)
+    factors = capacity_factors(np.full((1, 1, 6), np.nan), classes, 2)
+    assert np.all(factors == 1)
+
+
+def test_rotations_follow_vehicle_shares():
+    """The rotations are split by the shares of the vehicles, not at the mean duration."""
+    lifespans = np.array([[5]])
+    classes = class_of_age(lifespans, 2)
+    # three quarters of the vehicles are young
+    age_distribution = np.array([[[3, 3, 1, 1]]])
+    shares = class_shares(age_distribution, classes, 2)
+    assert np.allclose(shares, [[[0.75, 0.25]]])
+
+    duration = np.array([1.0, 10.0, 2.0, 3.0, 100.0, 4.0, 5.0, 6.0])
+    rotation_classes = assign_age_classes(
+        np.zeros(duration.size, dtype=int), duration, shares.reshape(-1, 2)
+    )
+    # only the shortest quarter gets the old vehicles, although most are below the mean duration
+    assert rotation_classes.tolist() == [1, 0, 1, 0, 0, 0, 0, 0]
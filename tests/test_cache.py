@@ -0,0 +1,19 @@
+import os
+
+import numpy as np
+
+from yurena_cache import SnapshotCache
+
+
+def test_leftover_temporary_file_is_not_loaded(tmp_path):
+    cache = SnapshotCache(str(tmp_path))
+    cache.save(7, {"rows": 1}, {"vehicle_id": np.array([1, 2])})
+    # an interrupted save of a newer snapshot
+    leftover = os.path.join(str(tmp_path), "sc7_0123456789abcdef.tmp.npz")
+    with open(leftover, "wb") as file:
+        file.write(b"broken")
+
+    assert cache.load(7)["vehicle_id"].tolist() == [1, 2]
+
+    cache.invalidate(7)
+    assert os.listdir(str(tmp_path)) == []
@@ -0,0 +1,149 @@
+"""
+Compares the backends of yurena_degradation with calc_cap_fade of yurena_example, which processes one charging event
+of one vehicle at a time and is the reference of the degeneration model.
+"""
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from yurena_degradation import (
+    HAS_NUMBA,
+    T_DEFAULT,
+    WEEKS_PER_YEAR,
+    load_temperature_profile,
+    simulate_years,
+)
+
+YEARS = 8
+
+
+@pytest.fixture(scope="module")
+def fleet():
+    """Small fleet with random charging events, about half of the vehicles reach the EoL within YEARS."""
+    rng = np.random.default_rng(42)
+    n_vehicles = 12
+    events_per_vehicle = rng.integers(2, 30, n_vehicles)
+    events_per_vehicle[0] = 0
+    vehicle_index = np.repeat(np.arange(n_vehicles), events_per_vehicle)
+    soc_start = rng.uniform(0.05, 0.6, vehicle_index.size)
+    soc_end = np.minimum(soc_start + rng.uniform(0.1, 0.6, vehicle_index.size), 1)
+    full_capacity = rng.uniform(200, 800, n_vehicles)
+    return SimpleNamespace(
+        vehicle_index=vehicle_index,
+        soc_start=soc_start,
+        soc_end=soc_end,
+        full_capacity=full_capacity,
+    )
+
+
+@pytest.fixture(scope="module")
+def reference(fleet):
+    """State after every year from calc_cap_fade, with the first week in which each vehicle needs a replacement."""
+    from yurena_example import calc_cap_fade
+
+    vehicles = [
+        SimpleNamespace(
+            id=i,
+            battery_capacity=capacity,
+            full_capacity=capacity,
+            cap_fade=0.0,
+            cap_fade_abs=0.0,
+            soh=1.0,
+            needs_replacement=False,
+        )
+        for i, capacity in enumerate(fleet.full_capacity.tolist())
+    ]
+    events = [
+        [
+            SimpleNamespace(soc_start=soc_start, soc_end=soc_end)
+            for soc_start, soc_end in zip(
+                fleet.soc_start[fleet.vehicle_index == i].tolist(),
+                fleet.soc_end[fleet.vehicle_index == i].tolist(),
+            )
+        ]
+        for i in range(len(vehicles))
+    ]
+    cap_fade = np.zeros((YEARS + 1, len(vehicles)))
+    soh = np.ones((YEARS + 1, len(vehicles)))
+    eol_week = np.full((YEARS + 1, len(vehicles)), -1)
+    for year in range(1, YEARS + 1):
+        for i, veh in enumerate(vehicles):
+            for week in range((year - 1) * WEEKS_PER_YEAR, year * WEEKS_PER_YEAR):
+                for event in events[i]:
+                    calc_cap_fade(event, veh, T_DEFAULT)
+                if veh.needs_replacement and eol_week[year - 1, i] < 0:
+                    eol_week[year:, i] = week
+                    break
+            else:
+                continue
+            # aging goes on after the EoL, only the week of the EoL is recorded
+            for _ in range(week + 1, year * WEEKS_PER_YEAR):
+                for event in events[i]:
+                    calc_cap_fade(event, veh, T_DEFAULT)
+        cap_fade[year] = [veh.cap_fade for veh in vehicles]
+        soh[year] = [veh.soh for veh in vehicles]
+    return {"cap_fade": cap_fade, "soh": soh, "eol_week": eol_week}
+
+
+def simulate(fleet, **kwargs):
+    return simulate_years(
+        fleet.soc_start,
+        fleet.soc_end,
+        fleet.vehicle_index,
+        fleet.full_capacity,
+        fleet.full_capacity,
+        YEARS,
+        **kwargs,
+    )
+
+
+def assert_matches(trajectories, reference, rtol):
+    np.testing.assert_allclose(
+        trajectories["cap_fade"], reference["cap_fade"], rtol=rtol, atol=1e-12
+    )
+    np.testing.assert_allclose(
+        trajectories["soh"], reference["soh"], rtol=rtol, atol=1e-9
+    )
+    np.testing.assert_array_equal(trajectories["eol_week"], reference["eol_week"])
+
+
+def test_reference_reaches_eol(reference):
+    # otherwise eol_week would not be compared at all
+    assert 0 < (reference["eol_week"][-1] >= 0).sum() < reference["eol_week"].shape[1]
+
+
+@pytest.mark.parametrize(
+    "backend",
+    [
+        "python",
+        "numpy",
+        pytest.param(
+            "numba",
+            marks=pytest.mark.skipif(not HAS_NUMBA, reason="numba is not installed"),
+        ),
+    ],
+)
+def test_backend_matches_reference(fleet, reference, backend):
+    assert_matches(simulate(fleet, backend=backend), reference, rtol=1e-10)
+
+
+def test_folded_weeks_match_reference(fleet, reference):
+    assert_matches(simulate(fleet, fold_weeks=True), reference, rtol=1e-8)
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{"backend": "python"}, {"backend": "numpy"}, {"fold_weeks": True}],
+)
+def test_short_temperature_profile_is_rejected(fleet, options):
+    with pytest.raises(ValueError, match="has 12 weeks, expected 52"):
+        simulate(fleet, weekly_T=np.full(12, T_DEFAULT), **options)
+
+
+def test_temperature_profile_file_needs_52_weeks(tmp_path):
+    path = tmp_path / "profile.csv"
+    path.write_text("week,T\n" + "".join(f"{week},20\n" for week in range(12)))
+    with pytest.raises(ValueError, match="has 12 weeks, expected 52"):
+        load_temperature_profile(path, celsius=True)
@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+from yurena_events import EventIndex
+
+
+def test_events_are_sliced_per_vehicle():
+    index = EventIndex.from_sorted_arrays(
+        [3, 1, 2], [1, 1, 3], [10, 11, 12], [0.2, 0.3, 0.4], [0.8, 0.9, 1.0]
+    )
+
+    assert index.event_counts().tolist() == [1, 2, 0]
+    assert index.event_ids[index.events_of(0)].tolist() == [12]
+    assert index.soc_start[index.events_of(1)].tolist() == [0.2, 0.3]
+
+
+def test_duplicate_events_are_rejected():
+    with pytest.raises(ValueError, match="duplicate"):
+        EventIndex.from_sorted_arrays(
+            [1, 2], [1, 1, 2], [10, 10, 11], [0.2, 0.2, 0.3], [0.8, 0.8, 0.9]
+        )
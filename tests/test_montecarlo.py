@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from yurena_degradation import WEEKS_PER_YEAR, simulate_years
+from yurena_events import EventIndex
+from yurena_montecarlo import run_monte_carlo, sample_parameters
+
+YEARS = 10
+
+
+@pytest.fixture(scope="module")
+def event_index():
+    rng = np.random.default_rng(7)
+    counts = rng.integers(0, 30, 16)
+    offsets = np.r_[0, np.cumsum(counts)]
+    soc_start = rng.uniform(0.05, 0.6, offsets[-1])
+    soc_end = np.minimum(soc_start + rng.uniform(0.1, 0.6, offsets[-1]), 1)
+    return EventIndex(
+        np.arange(counts.size), offsets, np.arange(offsets[-1]), soc_start, soc_end
+    )
+
+
+@pytest.mark.parametrize("drop_eol", [False, True])
+@pytest.mark.parametrize("seasonal", [False, True])
+def test_without_spread_matches_simulation(event_index, drop_eol, seasonal):
+    """Without spread of the parameters, every sample is the main simulation with the same options."""
+    n_vehicles = event_index.n_vehicles
+    capacity = np.linspace(200, 800, n_vehicles)
+    group_index = np.arange(n_vehicles) % 3 - 1
+    weekly_T = None
+    if seasonal:
+        weekly_T = 295 + 12 * np.sin(np.arange(WEEKS_PER_YEAR) / WEEKS_PER_YEAR * np.pi)
+
+    parameters = sample_parameters(3, rel_std=0, T_std=0, seed=1)
+    _, avg_soh = run_monte_carlo(
+        event_index,
+        capacity,
+        capacity,
+        group_index,
+        2,
+        YEARS,
+        parameters,
+        weekly_T=weekly_T,
+        drop_eol=drop_eol,
+    )
+    trajectories = simulate_years(
+        event_index.soc_start,
+        event_index.soc_end,
+        event_index.vehicle_index,
+        capacity,
+        capacity,
+        YEARS,
+        fold_weeks=True,
+        weekly_T=weekly_T,
+        drop_eol=drop_eol,
+    )
+    cap_fade = trajectories["cap_fade"]
+    expected = np.stack(
+        [1 - cap_fade[:, group_index == g].mean(axis=1) for g in range(2)]
+    )
+    # otherwise drop_eol would not change anything
+    assert trajectories["needs_replacement"][-1].any()
+    for sample in avg_soh:
+        np.testing.assert_allclose(sample, expected, rtol=1e-9, atol=1e-9)
+
+
+def test_temperature_offsets_are_centered():
+    parameters = sample_parameters(20000, T_std=2.0, seed=3)
+    assert abs(parameters["dT"].mean()) < 0.05
+    assert parameters["dT"].std() == pytest.approx(2.0, rel=0.05)
+
+
+def test_short_temperature_profile_is_rejected(event_index):
+    capacity = np.full(event_index.n_vehicles, 300.0)
+    with pytest.raises(ValueError, match="has 12 weeks, expected 52"):
+        run_monte_carlo(
+            event_index,
+            capacity,
+            capacity,
+            np.zeros(event_index.n_vehicles, dtype=int),
+            1,
+            2,
+            sample_parameters(2, seed=0),
+            weekly_T=np.full(12, 300.15),
+        )
@@ -0,0 +1,11 @@
+from yurena_tables import render_soh_progression_table
+
+
+def test_soh_progression_of_empty_pair_starts_at_one(tmp_path):
+    """Vehicle types without vehicles in the depot show 1.000 at age 0 and --- afterwards, like the former tables."""
+    records = {(1, 10, age): {"mean_cap_fade": 0.4 * age} for age in range(4)}
+    path = tmp_path / "table.csv"
+    render_soh_progression_table(records, 1, "A", {10: "EN", 11: "GN"}, 3, path)
+    lines = path.read_text().splitlines()
+    assert lines[2] == "EN,1.000,0.600,0.200,0"
+    assert lines[3] == "GN,1.000,---,---,0"
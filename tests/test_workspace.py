@@ -0,0 +1,136 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import (
+    JSON,
+    Column,
+    ForeignKey,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    create_engine,
+    insert,
+    select,
+    text,
+)
+from sqlalchemy.dialects import postgresql
+
+from yurena_workspace import (
+    _copy_rows,
+    _foreign_key_ddl,
+    check_depot_simulation_mode,
+    copy_scenario_to_sqlite,
+)
+
+
+@pytest.fixture
+def source(tmp_path):
+    """SQLite database with two scenarios, a table related to them through a foreign key and a shared table."""
+    metadata = MetaData()
+    scenario = Table(
+        "Scenario",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("name", String),
+    )
+    rotation = Table(
+        "Rotation",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("scenario_id", ForeignKey("Scenario.id", ondelete="CASCADE")),
+        Column("name", String),
+        Column("options", JSON),
+    )
+    trip = Table(
+        "Trip",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("rotation_id", ForeignKey("Rotation.id", ondelete="CASCADE")),
+    )
+    unit = Table("Unit", metadata, Column("id", Integer, primary_key=True))
+    engine = create_engine(f"sqlite:///{tmp_path / 'source.sqlite'}")
+    metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(
+            insert(scenario), [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}]
+        )
+        connection.execute(
+            insert(rotation),
+            [
+                {"id": 10, "scenario_id": 1, "name": "r10", "options": {"x": [1, 2]}},
+                {"id": 11, "scenario_id": 1, "name": "r11", "options": None},
+                {"id": 20, "scenario_id": 2, "name": "r20", "options": None},
+            ],
+        )
+        connection.execute(
+            insert(trip),
+            [{"id": 100, "rotation_id": 10}, {"id": 200, "rotation_id": 20}],
+        )
+        connection.execute(insert(unit), [{"id": 1}, {"id": 2}])
+    yield SimpleNamespace(engine=engine, metadata=metadata, scenario=scenario)
+    engine.dispose()
+
+
+def test_sqlite_round_trip(source, tmp_path):
+    path = str(tmp_path / "copy.sqlite")
+    counts = copy_scenario_to_sqlite(
+        source.engine, 1, path, source.metadata, source.scenario
+    )
+    assert counts == {"Scenario": 1, "Rotation": 2, "Trip": 1, "Unit": 2}
+
+    copy = create_engine(f"sqlite:///{path}")
+    with source.engine.connect() as original, copy.connect() as copied:
+        for table in source.metadata.sorted_tables:
+            query = select(table).order_by(*table.primary_key.columns)
+            if "scenario_id" in table.c:
+                query = query.where(table.c.scenario_id == 1)
+            elif table.name == "Scenario":
+                query = query.where(table.c.id == 1)
+            elif table.name == "Trip":
+                query = query.where(table.c.rotation_id.in_([10, 11]))
+            assert copied.execute(query).all() == original.execute(query).all()
+    copy.dispose()
+
+    # an existing copy is replaced
+    assert (
+        copy_scenario_to_sqlite(
+            source.engine, 2, path, source.metadata, source.scenario
+        )["Rotation"]
+        == 1
+    )
+
+
+def test_foreign_keys_of_schema_copy(source):
+    engine = SimpleNamespace(dialect=postgresql.dialect())
+    trip = source.metadata.tables["Trip"]
+    (constraint,) = trip.foreign_key_constraints
+    assert _foreign_key_ddl(engine, "work", trip, constraint) == (
+        'ALTER TABLE work."Trip" ADD FOREIGN KEY (rotation_id) REFERENCES work."Rotation" (id) '
+        "ON DELETE CASCADE NOT VALID"
+    )
+
+
+def test_schema_copy_names_the_columns(source, tmp_path):
+    """The rows land in the right columns even if the copy has another column order than the metadata."""
+    rotation = source.metadata.tables["Rotation"]
+    with source.engine.begin() as connection:
+        connection.execute(
+            text(f"ATTACH DATABASE '{tmp_path / 'work.sqlite'}' AS work")
+        )
+        connection.execute(
+            text(
+                'CREATE TABLE work."Rotation" (options JSON, name VARCHAR, scenario_id INTEGER, id INTEGER)'
+            )
+        )
+        connection.execute(_copy_rows(rotation, "work", rotation.c.scenario_id == 1))
+        copied = connection.execute(
+            text('SELECT id, scenario_id, name FROM work."Rotation" ORDER BY id')
+        ).all()
+    assert copied == [(10, 1, "r10"), (11, 1, "r11")]
+
+
+def test_depot_simulation_needs_geometries():
+    check_depot_simulation_mode("schema")
+    with pytest.raises(ValueError, match="geometries"):
+        check_depot_simulation_mode("sqlite")
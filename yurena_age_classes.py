@@ -0,0 +1,116 @@
+"""
+Age classes of the vehicles in the steady state and the assignment of rotations to them.
+
+The ages of the vehicles of a depot x vehicle type pair in the steady state (see age_group_counts) are split into
+n_classes ranges of nearly equal length, class 0 holds the youngest vehicles. Every vehicle type is split into one
+vehicle type per age class, whose capacity is reduced to the remaining capacity of the oldest vehicles of the class.
+
+The rotations of a pair are assigned to the classes by quantiles of a metric, e.g. their duration or driven distance:
+the rotations with the largest values get the youngest vehicles, and every class gets the share of the rotations that
+matches its share of the vehicles. This deliberately replaces the former split at the mean duration (rotations above
+the mean got the young vehicle type), which gave the classes a number of rotations independent of the number of
+vehicles of that age. With two classes of equally many vehicles the split is at the median duration.
+"""
+
+import numpy as np
+
+# share of the full capacity that is lost at the EoL, the SoH is normalized to it (see update_soh in yurena_example)
+EOL_CAPACITY_LOSS = 0.2
+
+
+def class_of_age(max_ages, n_classes):
+    """
+    Age class of each age of the vehicles of each depot x vehicle type in the steady state.
+
+    :param max_ages: max age of each depot x vehicle type, e.g. the lifespans of the results
+    :param n_classes: number of age classes
+    :return: int array (depots x vehicle types x ages), -1 beyond the ages of a pair
+    """
+    age_groups = np.maximum(np.asarray(max_ages, dtype=np.int64) - 1, 0)
+    age = np.arange(int(age_groups.max(initial=0)))
+    classes = age * n_classes // np.maximum(age_groups, 1)[..., None]
+    return np.where(age < age_groups[..., None], classes, -1)
+
+
+def class_shares(age_distribution, classes, n_classes):
+    """
+    Share of the vehicles of each depot x vehicle type in each age class.
+
+    :param age_distribution: number of vehicles of each depot x vehicle type x age, see age_group_counts
+    :param classes: age class of each age, see class_of_age
+    :return: array (depots x vehicle types x classes), equal shares for pairs without vehicles
+    """
+    age_distribution = np.asarray(age_distribution, dtype=np.float64)
+    counts = np.stack(
+        [
+            np.where(classes == k, age_distribution, 0).sum(axis=2)
+            for k in range(n_classes)
+        ],
+        axis=2,
+    )
+    total = counts.sum(axis=2, keepdims=True)
+    return np.where(total > 0, counts / np.maximum(total, 1), 1 / n_classes)
+
+
+def capacity_factors(soh_progression, classes, n_classes):
+    """
+    Capacity factor of each vehicle type and age class.
+
+    The factor is the remaining share of the battery capacity of the oldest vehicles of the class at the end of their
+    year, the minimum over all depots, so the vehicle type of a class can serve the rotations of that class in every
+    depot. The SoH is 0 at the EoL, when 20 % of the full capacity are lost, so the factor is 1 - 0.2 * (1 - SoH)
+    and lies between 0.8 and 1.
+
+    :param soh_progression: average SoH of each depot x vehicle type at the beginning of each year, NaN for pairs
+        without vehicles
+    :param classes: age class of each age, see class_of_age
+    :return: array (vehicle types x classes), 1 for classes without vehicles
+    """
+    n_ages = classes.shape[2]
+    # SoH at the end of each age, which is the beginning of the next one
+    soh_end = np.asarray(soh_progression, dtype=np.float64)[:, :, 1 : n_ages + 1]
+    factors = np.ones((classes.shape[1], n_classes))
+    for k in range(n_classes):
+        in_class = (classes == k) & ~np.isnan(soh_end)
+        soh = np.where(in_class, soh_end, np.inf).min(axis=(0, 2))
+        # the average SoH can drop below 0 in the year of the EoL, the vehicles are replaced at the EoL capacity
+        factors[:, k] = np.where(
+            np.isfinite(soh), 1 - EOL_CAPACITY_LOSS * (1 - np.clip(soh, 0, 1)), 1
+        )
+    return factors
+
+
+def assign_age_classes(group_index, metric, shares):
+    """
+    Assigns rotations to age classes by quantiles of a metric within their group.
+
+    Within each group, the rotations are ranked from the largest metric downwards and class k gets the next share k
+    of them, i.e. the split follows the shares of the vehicles and not the mean of the metric. Ties keep the order of
+    the rotations.
+
+    :param group_index: flat depot x vehicle type index of each rotation, rotations with -1 are not assigned
+    :param metric: value of each rotation, e.g. its duration
+    :param shares: array (groups x classes) with the share of each class, e.g. class_shares reshaped
+    :return: int array with the class of each rotation, -1 for rotations without group
+    """
+    group_index = np.asarray(group_index, dtype=np.intp)
+    metric = np.asarray(metric, dtype=np.float64)
+    shares = np.asarray(shares, dtype=np.float64)
+    classes = np.full(group_index.shape, -1, dtype=np.intp)
+
+    rotations = np.flatnonzero(group_index >= 0)
+    if rotations.size == 0:
+        return classes
+    # rotations sorted by group and then by the metric from the largest downwards, the groups are contiguous ranges
+    order = rotations[np.lexsort((-metric[rotations], group_index[rotations]))]
+    groups = group_index[order]
+    counts = np.bincount(groups, minlength=shares.shape[0])
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+
+    # position of each rotation within its group, between 0 and 1
+    position = (np.arange(order.size) - starts[groups] + 0.5) / counts[groups]
+    bounds = np.cumsum(shares, axis=1)[groups]
+    classes[order] = np.minimum(
+        (position[:, None] >= bounds).sum(axis=1), shares.shape[1] - 1
+    )
+    return classes
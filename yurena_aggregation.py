@@ -0,0 +1,190 @@
+"""
+Aggregation of vehicle values by depot, vehicle type and depot x vehicle type.
+
+Every vehicle gets an integer depot index and vehicle type index once (the indizes of results_array). Averages per
+group are then calculated with np.bincount in one pass over the vehicles, independent of the number of depots and
+vehicle types.
+"""
+
+import numpy as np
+
+
+def group_percentiles(values, group_index, n_groups, q):
+    """
+    Calculates percentiles of the values of each group, with the linear interpolation of np.percentile.
+
+    :param values: value of each element
+    :param group_index: group of each element, elements with a negative group are ignored
+    :param n_groups: number of groups
+    :param q: sequence of percentiles between 0 and 100
+    :return: array (percentiles x groups), NaN for groups without elements
+    """
+    values = np.asarray(values, dtype=np.float64)
+    group_index = np.asarray(group_index, dtype=np.intp)
+    in_group = group_index >= 0
+    values, group_index = values[in_group], group_index[in_group]
+
+    # values sorted within each group, the groups are contiguous ranges
+    order = np.lexsort((values, group_index))
+    sorted_values = values[order]
+    counts = np.bincount(group_index, minlength=n_groups)
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+
+    result = np.full((len(q), n_groups), np.nan)
+    has_values = counts > 0
+    for i, percentile in enumerate(q):
+        position = (counts[has_values] - 1) * (percentile / 100)
+        lower = np.floor(position).astype(np.intp)
+        upper = np.minimum(lower + 1, counts[has_values] - 1)
+        low = sorted_values[starts[has_values] + lower]
+        high = sorted_values[starts[has_values] + upper]
+        result[i, has_values] = low + (high - low) * (position - lower)
+    return result
+
+
+class FleetGroups:
+    """Depot and vehicle type index of every vehicle, vehicles without depot have the depot index -1."""
+
+    def __init__(self, depot_index, type_index, n_depots, n_types):
+        self.depot_index = np.asarray(depot_index, dtype=np.intp)
+        self.type_index = np.asarray(type_index, dtype=np.intp)
+        self.n_depots = n_depots
+        self.n_types = n_types
+
+        self.in_depot = self.depot_index >= 0
+        # flat depot x vehicle type index of each vehicle, like the first two axes of results_array
+        self.pair_index = np.where(
+            self.in_depot, self.depot_index * n_types + self.type_index, -1
+        )
+        self.pair_counts = np.bincount(
+            self.pair_index[self.in_depot], minlength=n_depots * n_types
+        ).reshape(n_depots, n_types)
+
+    @classmethod
+    def from_ids(cls, depot_ids, vehicle_type_ids, depot_indizes, vehicle_type_indizes):
+        """
+        Builds the groups from the depot and vehicle type id of each vehicle, e.g. the columns of a FleetState.
+
+        :param depot_ids: depot id of each vehicle, vehicles with an id that is not in depot_indizes (e.g. -1) have no
+            depot
+        :param depot_indizes: dict with the index of each depot id
+        :param vehicle_type_indizes: dict with the index of each vehicle type id
+        """
+        return cls(
+            index_lookup(list(depot_indizes), depot_ids),
+            index_lookup(list(vehicle_type_indizes), vehicle_type_ids),
+            len(depot_indizes),
+            len(vehicle_type_indizes),
+        )
+
+    def percentiles(self, values, q):
+        """
+        Calculates percentiles of a value per depot x vehicle type, depot, vehicle type and of all vehicles.
+
+        Like aggregate, depots and depot x vehicle type pairs only include vehicles with a depot.
+
+        :param q: sequence of percentiles between 0 and 100
+        :return: dict with pair (percentiles x depots x vehicle types), depot, type and all (percentiles), NaN for
+            groups without vehicles
+        """
+        return {
+            "pair": group_percentiles(
+                values, self.pair_index, self.n_depots * self.n_types, q
+            ).reshape(len(q), self.n_depots, self.n_types),
+            "depot": group_percentiles(values, self.depot_index, self.n_depots, q),
+            "type": group_percentiles(values, self.type_index, self.n_types, q),
+            "all": group_percentiles(values, np.zeros(len(self.type_index)), 1, q)[
+                :, 0
+            ],
+        }
+
+    def aggregate(self, values, weights=None):
+        """
+        Calculates counts, sums and (weighted) averages of a value per depot x vehicle type, depot and vehicle type.
+
+        Like the tables of yurena_example, the depot and vehicle type sums only include vehicles with a depot, the
+        vehicle type averages are divided by the weight of all vehicles of the type and the overall average includes
+        all vehicles.
+
+        :param values: value of each vehicle
+        :param weights: weight of each vehicle, defaults to 1
+        :return: dict with pair_count, pair_sum, pair_mean (depots x vehicle types), depot_mean, type_mean and mean,
+            averages of groups without vehicles are NaN
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if weights is None:
+            weights = np.ones_like(values)
+        weights = np.asarray(weights, dtype=np.float64)
+        n_pairs = self.n_depots * self.n_types
+
+        in_depot = self.in_depot
+        pair_weight = np.bincount(
+            self.pair_index[in_depot], weights[in_depot], minlength=n_pairs
+        ).reshape(self.n_depots, self.n_types)
+        pair_sum = np.bincount(
+            self.pair_index[in_depot],
+            weights[in_depot] * values[in_depot],
+            minlength=n_pairs,
+        ).reshape(self.n_depots, self.n_types)
+        type_weight = np.bincount(self.type_index, weights, minlength=self.n_types)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return {
+                "pair_count": self.pair_counts,
+                "pair_sum": pair_sum,
+                "pair_mean": np.where(
+                    self.pair_counts > 0, pair_sum / pair_weight, np.nan
+                ),
+                "depot_mean": np.where(
+                    self.pair_counts.sum(axis=1) > 0,
+                    pair_sum.sum(axis=1) / pair_weight.sum(axis=1),
+                    np.nan,
+                ),
+                "type_mean": np.where(
+                    self.pair_counts.sum(axis=0) > 0,
+                    pair_sum.sum(axis=0) / type_weight,
+                    np.nan,
+                ),
+                "mean": (
+                    np.sum(weights * values) / np.sum(weights)
+                    if values.size
+                    else np.nan
+                ),
+            }
+
+
+def index_lookup(keys, values):
+    """
+    Position of each value in keys, e.g. the depot index of each depot id.
+
+    :param keys: unique keys, e.g. the depot ids in the order of the depot indizes
+    :param values: values to look up
+    :return: int array with the position of each value, -1 for values that are not in keys
+    """
+    keys = np.asarray(keys)
+    values = np.asarray(values)
+    if keys.size == 0:
+        return np.full(values.shape, -1, dtype=np.intp)
+    order = np.argsort(keys, kind="stable")
+    position = np.minimum(np.searchsorted(keys, values, sorter=order), keys.size - 1)
+    return np.where(keys[order[position]] == values, order[position], -1)
+
+
+def age_group_counts(pair_counts, max_ages):
+    """
+    Distributes the vehicles of each depot x vehicle type evenly over their ages in the steady state.
+
+    Vehicles get replaced when they reach the max age of their pair, so a pair has max age - 1 age groups. The
+    remainder of the division goes to the youngest age groups, pairs without age groups stay empty.
+
+    :param pair_counts: number of vehicles of each depot x vehicle type, e.g. FleetGroups.pair_counts
+    :param max_ages: max age of each depot x vehicle type, e.g. the lifespans of the results
+    :return: int32 array (depots x vehicle types x age groups), zero beyond the age groups of a pair
+    """
+    pair_counts = np.asarray(pair_counts, dtype=np.int64)
+    age_groups = np.maximum(np.asarray(max_ages, dtype=np.int64) - 1, 0)
+    age = np.arange(int(age_groups.max(initial=0)))
+
+    per_group, remainder = np.divmod(pair_counts, np.maximum(age_groups, 1))
+    counts = per_group[..., None] + (age < remainder[..., None])
+    return np.where(age < age_groups[..., None], counts, 0).astype(np.int32)
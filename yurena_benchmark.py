@@ -0,0 +1,488 @@
+#! /usr/bin/env python3
+"""
+Microbenchmarks of the degeneration pipeline on synthetic fleets, without a database.
+
+synthetic_snapshot generates a snapshot with the same arrays as extract_scenario_arrays (vehicle types, depots,
+vehicles with their depot and one week of charging events), so every stage runs on the same data structures as
+yurena_example. The yearly stages call the functions of yurena_example itself. The stages are
+
+    build_fleet         snapshot records, FleetState and FleetGroups (vehicles grouped by depot and vehicle type)
+    event_index         EventIndex of the charging events
+    calc_cap_fade_batch one week of charging events, per backend (weeks=1)
+    calc_weekly_factors weekly factors of the vehicles for --fold-weeks, calculated once per run
+    calc_yearly_degen   one year, per backend and with the year folded into one step (fold)
+    create_cap_fade_array   create_cap_fade_array and the records of the year in the long-format results
+
+Every stage is timed --repeat times on fresh copies of its input, the peak memory is measured in an extra run with
+tracemalloc (which slows Python code down and is therefore not part of the timed runs). The results are written as
+JSON, --compare prints the speed relative to an earlier result file, e.g. of another commit.
+"""
+
+import argparse
+import copy
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from yurena_aggregation import FleetGroups
+from yurena_cache import snapshot_records
+from yurena_degradation import (
+    HAS_NUMBA,
+    T_DEFAULT,
+    WEEKS_PER_YEAR,
+    calc_cap_fade_batch,
+    calc_weekly_factors,
+)
+from yurena_events import EventIndex
+from yurena_example import calc_yearly_degen, create_cap_fade_array
+from yurena_fleet import FleetState
+from yurena_tables import LongResultsWriter
+
+RESULTS_VERSION = 1
+
+
+def synthetic_snapshot(n_vehicles, events_per_week=14, n_depots=4, n_types=3, seed=0):
+    """
+    Generates a snapshot of a fleet in the format of extract_scenario_arrays.
+
+    The number of charging events of each vehicle is Poisson distributed around events_per_week, the SoC of each event
+    drops from a random start SoC to a random lower end SoC. The events are sorted by vehicle id.
+
+    :param n_vehicles: number of vehicles
+    :param events_per_week: average number of charging events of a vehicle in the simulated week
+    :param n_depots: number of depots, every vehicle gets one
+    :param n_types: number of vehicle types
+    """
+    rng = np.random.default_rng(seed)
+    vehicle_type_id = np.arange(1, n_types + 1, dtype=np.int64)
+    depot_id = np.arange(1, n_depots + 1, dtype=np.int64)
+    vehicle_id = np.arange(1, n_vehicles + 1, dtype=np.int64)
+
+    events_of_vehicle = rng.poisson(events_per_week, n_vehicles)
+    event_vehicle_id = np.repeat(vehicle_id, events_of_vehicle)
+    soc_end = rng.uniform(0.05, 0.6, event_vehicle_id.size)
+    soc_start = rng.uniform(soc_end, 1.0)
+
+    return {
+        "vehicle_type_id": vehicle_type_id,
+        "vehicle_type_name": np.array([f"VT {i}" for i in vehicle_type_id]),
+        "vehicle_type_battery_capacity": rng.uniform(250, 550, n_types).round(),
+        "vehicle_type_battery_capacity_reserve": rng.choice([0.0, 10.0, 20.0], n_types),
+        "depot_id": depot_id,
+        "depot_name": np.array([f"Depot {i}" for i in depot_id]),
+        "depot_name_short": np.array([f"D{i}" for i in depot_id]),
+        "depot_station_id": depot_id + 100,
+        "vehicle_id": vehicle_id,
+        "vehicle_vehicle_type_id": rng.choice(vehicle_type_id, n_vehicles),
+        "vehicle_depot_id": rng.choice(depot_id, n_vehicles),
+        "event_vehicle_id": event_vehicle_id,
+        "event_id": np.arange(event_vehicle_id.size, dtype=np.int64),
+        "event_soc_start": soc_start,
+        "event_soc_end": soc_end,
+    }
+
+
+def build_fleet(snapshot, years=1):
+    """Builds the fleet and its groups from a snapshot, like yurena_example."""
+    vehicle_types, depots, vehicles = snapshot_records(snapshot)
+    depot_of_vehicle = {
+        int(vehicle_id): int(depot_id)
+        for vehicle_id, depot_id in zip(
+            snapshot["vehicle_id"], snapshot["vehicle_depot_id"]
+        )
+        if depot_id >= 0
+    }
+    fleet = FleetState.from_records(
+        vehicles, vehicle_types, depots, depot_of_vehicle, years
+    )
+    depot_indizes = {depot_id: i for i, depot_id in enumerate(depots)}
+    vehicle_type_indizes = {vt_id: i for i, vt_id in enumerate(vehicle_types)}
+    groups = FleetGroups.from_ids(
+        fleet.depot_id, fleet.vehicle_type_id, depot_indizes, vehicle_type_indizes
+    )
+    return fleet, groups, depot_indizes, vehicle_type_indizes
+
+
+def build_event_index(snapshot, fleet):
+    return EventIndex.from_sorted_arrays(
+        fleet.id,
+        snapshot["event_vehicle_id"],
+        snapshot["event_id"],
+        snapshot["event_soc_start"],
+        snapshot["event_soc_end"],
+    )
+
+
+def _fresh_state(fleet):
+    """Copies of the state columns the kernels update in place."""
+    return {
+        "battery_capacity": fleet.battery_capacity.copy(),
+        "cap_fade": fleet.cap_fade.copy(),
+        "cap_fade_abs": fleet.cap_fade_abs.copy(),
+        "soh": fleet.soh.copy(),
+        "needs_replacement": fleet.needs_replacement.copy(),
+        "eol_week": fleet.eol_week.copy(),
+    }
+
+
+def _run_batch(event_index, fleet, state, weeks, backend):
+    calc_cap_fade_batch(
+        event_index.soc_start,
+        event_index.soc_end,
+        event_index.vehicle_index,
+        state["battery_capacity"],
+        fleet.full_capacity,
+        state["cap_fade"],
+        state["cap_fade_abs"],
+        state["soh"],
+        state["needs_replacement"],
+        T=T_DEFAULT,
+        weeks=weeks,
+        steps=event_index.steps,
+        backend=backend,
+        eol_week=state["eol_week"],
+    )
+
+
+def _weekly_factors(event_index):
+    return calc_weekly_factors(
+        event_index.soc_start,
+        event_index.soc_end,
+        event_index.vehicle_index,
+        event_index.n_vehicles,
+    )
+
+
+def stages(snapshot, backends, folder):
+    """
+    Stages of the pipeline for one snapshot.
+
+    :return: list of (stage, variant, setup, run), run(setup()) is timed, setup is not
+    """
+    fleet, groups, depot_indizes, vehicle_type_indizes = build_fleet(snapshot)
+    event_index = build_event_index(snapshot, fleet)
+    weekly_factors = _weekly_factors(event_index)
+    # fleet after one year, input of the yearly aggregation
+    aged = copy.deepcopy(fleet)
+    calc_yearly_degen(aged, event_index, weekly_factors=weekly_factors)
+
+    def no_setup():
+        return None
+
+    def fresh_state():
+        return _fresh_state(fleet)
+
+    def fresh_fleet():
+        return copy.deepcopy(fleet)
+
+    def open_results():
+        results_array = np.full(
+            (len(depot_indizes), len(vehicle_type_indizes), 2), np.nan
+        )
+        writer = LongResultsWriter(
+            os.path.join(folder, "cap_fade_long.csv"),
+            depot_indizes,
+            vehicle_type_indizes,
+        )
+        return results_array, writer
+
+    def write_year(results):
+        # the same calls as for every simulated year in yurena_example
+        results_array, writer = results
+        create_cap_fade_array(
+            aged, 1, {}, results_array, groups, depot_indizes, vehicle_type_indizes
+        )
+        writer.write_year(1, groups, aged.cap_fade)
+        writer.close()
+
+    result = [
+        ("build_fleet", "records", no_setup, lambda _: build_fleet(snapshot)),
+        (
+            "event_index",
+            "sorted_arrays",
+            no_setup,
+            lambda _: build_event_index(snapshot, fleet),
+        ),
+    ]
+    for backend in backends:
+        result.append(
+            (
+                "calc_cap_fade_batch",
+                backend,
+                fresh_state,
+                lambda state, backend=backend: _run_batch(
+                    event_index, fleet, state, 1, backend
+                ),
+            )
+        )
+    result.append(
+        (
+            "calc_weekly_factors",
+            "fold",
+            no_setup,
+            lambda _: _weekly_factors(event_index),
+        )
+    )
+    for backend in backends:
+        result.append(
+            (
+                "calc_yearly_degen",
+                backend,
+                fresh_fleet,
+                lambda state, backend=backend: calc_yearly_degen(
+                    state, event_index, backend=backend
+                ),
+            )
+        )
+    result.append(
+        (
+            "calc_yearly_degen",
+            "fold",
+            fresh_fleet,
+            lambda state: calc_yearly_degen(
+                state, event_index, weekly_factors=weekly_factors
+            ),
+        )
+    )
+    result.append(("create_cap_fade_array", "aggregate", open_results, write_year))
+    return result
+
+
+def measure(setup, run, repeat):
+    """
+    Times run(setup()) repeat times and measures its peak memory in an extra run.
+
+    :return: dict with seconds (fastest run), mean_seconds and peak_memory_mb (allocated by the run itself)
+    """
+    times = []
+    for _ in range(repeat):
+        argument = setup()
+        start = time.perf_counter()
+        run(argument)
+        times.append(time.perf_counter() - start)
+
+    argument = setup()
+    tracemalloc.start()
+    try:
+        run(argument)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "seconds": min(times),
+        "mean_seconds": sum(times) / len(times),
+        "peak_memory_mb": peak / 1024**2,
+    }
+
+
+def run_benchmarks(
+    vehicles,
+    events_per_week=14,
+    n_depots=4,
+    n_types=3,
+    backends=("numpy", "numba"),
+    python_limit=1000,
+    repeat=3,
+    seed=0,
+    verbose=True,
+):
+    """
+    Runs all stages for each fleet size.
+
+    :param vehicles: sequence of fleet sizes
+    :param backends: backends of calc_cap_fade_batch, numba is left out if it is not installed
+    :param python_limit: the python backend only runs for fleets up to this size
+    :return: list with a dict for each stage, variant and fleet size
+    """
+    backends = [b for b in backends if b != "numba" or HAS_NUMBA]
+    if "numba" in backends:
+        # compile the kernel before anything is timed
+        snapshot = synthetic_snapshot(10, seed=seed)
+        fleet, *_ = build_fleet(snapshot)
+        event_index = build_event_index(snapshot, fleet)
+        _run_batch(event_index, fleet, _fresh_state(fleet), 1, "numba")
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for n_vehicles in vehicles:
+            snapshot = synthetic_snapshot(
+                n_vehicles, events_per_week, n_depots, n_types, seed
+            )
+            n_events = int(snapshot["event_id"].size)
+            scale_backends = [
+                b for b in backends if b != "python" or n_vehicles <= python_limit
+            ]
+            for stage, variant, setup, run in stages(snapshot, scale_backends, folder):
+                measured = measure(setup, run, repeat)
+                # events processed by the stage: every event once per simulated week
+                weeks = WEEKS_PER_YEAR if stage == "calc_yearly_degen" else 1
+                result = {
+                    "stage": stage,
+                    "variant": variant,
+                    "vehicles": n_vehicles,
+                    "events": n_events,
+                    **measured,
+                    "events_per_sec": n_events * weeks / measured["seconds"],
+                    "vehicles_per_sec": n_vehicles / measured["seconds"],
+                }
+                results.append(result)
+                if verbose:
+                    print(_format(result))
+    return results
+
+
+def _format(result):
+    return (
+        f"{result['stage']:<22} {result['variant']:<14} {result['vehicles']:>8} vehicles "
+        f"{result['seconds'] * 1000:>10.2f} ms {result['events_per_sec']:>14,.0f} events/s "
+        f"{result['peak_memory_mb']:>9.1f} MB"
+    )
+
+
+def git_commit():
+    """Commit of the working directory, None outside of a git repository."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, reference):
+    """
+    Prints the speed of each result relative to a reference run, > 1 is faster than the reference.
+
+    :param reference: results of an earlier run (the "results" of its JSON file)
+    """
+    by_key = {(r["stage"], r["variant"], r["vehicles"]): r for r in reference}
+    for result in results:
+        old = by_key.get((result["stage"], result["variant"], result["vehicles"]))
+        if old is None:
+            continue
+        speedup = old["seconds"] / result["seconds"]
+        memory = result["peak_memory_mb"] - old["peak_memory_mb"]
+        print(
+            f"{result['stage']:<22} {result['variant']:<14} {result['vehicles']:>8} vehicles "
+            f"{speedup:>6.2f}x speed {memory:>+9.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--vehicles",
+        type=int,
+        nargs="+",
+        default=[100, 1000, 10000, 100000],
+        help="Fleet sizes to be benchmarked.",
+    )
+    parser.add_argument(
+        "--events_per_week",
+        "--events-per-week",
+        type=float,
+        default=14,
+        help="Average number of charging events of a vehicle per week.",
+    )
+    parser.add_argument(
+        "--depots", type=int, default=4, help="Number of depots of the fleet."
+    )
+    parser.add_argument(
+        "--vehicle_types",
+        "--vehicle-types",
+        type=int,
+        default=3,
+        help="Number of vehicle types of the fleet.",
+    )
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=("python", "numpy", "numba"),  # BACKENDS of yurena_degradation
+        default=["numpy", "numba"],
+        help="Backends of the degeneration kernel. numba is skipped if it is not installed.",
+    )
+    parser.add_argument(
+        "--python_limit",
+        "--python-limit",
+        type=int,
+        default=1000,
+        help="Largest fleet for which the python backend is benchmarked.",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Number of timed runs of each stage, the fastest one is reported.",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed for the synthetic fleets."
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        help="JSON file for the results. Defaults to benchmark_<commit>.json in the working directory.",
+        required=False,
+    )
+    parser.add_argument(
+        "--compare",
+        type=str,
+        help="JSON file of an earlier run, the results are compared to it.",
+        required=False,
+    )
+
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = run_benchmarks(
+        args.vehicles,
+        args.events_per_week,
+        args.depots,
+        args.vehicle_types,
+        args.backends,
+        args.python_limit,
+        args.repeat,
+        args.seed,
+    )
+
+    output = args.output or os.path.join(
+        os.getcwd(), f"benchmark_{commit or 'results'}.json"
+    )
+    with open(output, "w") as file:
+        json.dump(
+            {
+                "version": RESULTS_VERSION,
+                "commit": commit,
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "numba": HAS_NUMBA,
+                "machine": platform.machine(),
+                "settings": {
+                    "events_per_week": args.events_per_week,
+                    "depots": args.depots,
+                    "vehicle_types": args.vehicle_types,
+                    "repeat": args.repeat,
+                    "seed": args.seed,
+                },
+                "results": results,
+            },
+            file,
+            indent=1,
+        )
+    print(f"Results written to {output}.")
+
+    if args.compare:
+        with open(args.compare) as file:
+            reference = json.load(file)
+        print(f"Compared to {reference.get('commit') or args.compare}:")
+        compare(results, reference["results"])
@@ -0,0 +1,151 @@
+"""
+On-disk cache for the data extracted from the database for a scenario.
+
+A snapshot contains the arrays of extract_scenario_arrays and is stored as a compressed npz file. It is keyed by the
+scenario id and a fingerprint of the database (row counts and largest ids, see query_fingerprint), so a snapshot is
+only used while the data of the scenario has not changed. Old snapshots of a scenario are removed when a new one is
+saved, and the least recently used snapshots are evicted when the cache grows beyond its size limit.
+"""
+
+import hashlib
+import json
+import os
+from types import SimpleNamespace
+
+import numpy as np
+
+# suffix of the file a snapshot is written to before it is moved to its final path
+TEMPORARY_SUFFIX = ".tmp.npz"
+
+
+def fingerprint_hash(fingerprint):
+    """Short, stable hash of a fingerprint dict."""
+    return hashlib.sha1(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()[
+        :16
+    ]
+
+
+class SnapshotCache:
+    """Folder with compressed snapshots of extracted scenario data."""
+
+    def __init__(self, folder, max_bytes=2 * 1024**3):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        os.makedirs(folder, exist_ok=True)
+
+    def _snapshots(self, scenario_id=None, temporary=False):
+        """
+        Returns the paths of the snapshots in the folder.
+
+        :param temporary: return the temporary files left behind by an interrupted save instead of the snapshots
+        """
+        prefix = "" if scenario_id is None else f"sc{scenario_id}_"
+        return [
+            os.path.join(self.folder, name)
+            for name in os.listdir(self.folder)
+            if name.startswith(prefix)
+            and name.endswith(".npz")
+            and name.endswith(TEMPORARY_SUFFIX) == temporary
+        ]
+
+    def path(self, scenario_id, fingerprint):
+        return os.path.join(
+            self.folder, f"sc{scenario_id}_{fingerprint_hash(fingerprint)}.npz"
+        )
+
+    def load(self, scenario_id, fingerprint=None):
+        """
+        Loads the snapshot of a scenario.
+
+        :param fingerprint: current fingerprint of the database. If it is None, the newest snapshot of the scenario is
+            used without checking whether it is still up to date.
+        :return: dict of arrays, or None if there is no matching snapshot
+        """
+        if fingerprint is not None:
+            path = self.path(scenario_id, fingerprint)
+            if not os.path.exists(path):
+                return None
+        else:
+            snapshots = self._snapshots(scenario_id)
+            if not snapshots:
+                return None
+            path = max(snapshots, key=os.path.getmtime)
+
+        with np.load(path, allow_pickle=False) as data:
+            snapshot = {key: data[key] for key in data.files}
+        # mark as recently used for the eviction
+        os.utime(path)
+        return snapshot
+
+    def save(self, scenario_id, fingerprint, snapshot):
+        """Saves a snapshot, replacing outdated snapshots of the same scenario."""
+        path = self.path(scenario_id, fingerprint)
+        self.invalidate(scenario_id)
+        # write to a temporary file first, so an interrupted run does not leave a broken snapshot behind
+        temporary_path = path[: -len(".npz")] + TEMPORARY_SUFFIX
+        np.savez_compressed(temporary_path, **snapshot)
+        os.replace(temporary_path, path)
+        self.evict(keep=path)
+
+    def invalidate(self, scenario_id=None):
+        """Deletes all snapshots of a scenario, or of all scenarios, and the leftovers of interrupted saves."""
+        for path in self._snapshots(scenario_id) + self._snapshots(
+            scenario_id, temporary=True
+        ):
+            os.remove(path)
+
+    def evict(self, keep=None):
+        """Deletes the least recently used snapshots (except keep) until the cache fits into max_bytes."""
+        snapshots = sorted(
+            (path for path in self._snapshots() if path != keep), key=os.path.getmtime
+        )
+        total = sum(os.path.getsize(path) for path in snapshots)
+        if keep is not None:
+            total += os.path.getsize(keep)
+        while snapshots and total > self.max_bytes:
+            path = snapshots.pop(0)
+            total -= os.path.getsize(path)
+            os.remove(path)
+
+
+def snapshot_records(snapshot):
+    """
+    Turns a snapshot back into lightweight records with the attributes of the ORM objects the simulation uses.
+
+    :return: tuple of dicts (vehicle types by id, depots by id) and a list of vehicles
+    """
+    vehicle_types = {
+        int(vt_id): SimpleNamespace(
+            id=int(vt_id),
+            name=str(name),
+            battery_capacity=float(capacity),
+            battery_capacity_reserve=float(reserve),
+        )
+        for vt_id, name, capacity, reserve in zip(
+            snapshot["vehicle_type_id"],
+            snapshot["vehicle_type_name"],
+            snapshot["vehicle_type_battery_capacity"],
+            snapshot["vehicle_type_battery_capacity_reserve"],
+        )
+    }
+    depots = {
+        int(depot_id): SimpleNamespace(
+            id=int(depot_id),
+            name=str(name),
+            name_short=str(name_short) or None,
+            station_id=int(station_id),
+        )
+        for depot_id, name, name_short, station_id in zip(
+            snapshot["depot_id"],
+            snapshot["depot_name"],
+            snapshot["depot_name_short"],
+            snapshot["depot_station_id"],
+        )
+    }
+    vehicles = [
+        SimpleNamespace(id=int(vehicle_id), vehicle_type_id=int(vt_id))
+        for vehicle_id, vt_id in zip(
+            snapshot["vehicle_id"], snapshot["vehicle_vehicle_type_id"]
+        )
+    ]
+    return vehicle_types, depots, vehicles
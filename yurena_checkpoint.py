@@ -0,0 +1,102 @@
+"""
+Checkpoints of the yearly degeneration simulation.
+
+After every simulated year the state of the fleet (the columns of FleetState that the kernels update) and the row of
+results_array for that year are written into a small npz file. A run that crashed resumes after the last written year,
+and a run with a longer horizon continues from the stored years instead of starting again from year 0.
+
+Every checkpoint carries a key of the simulation inputs (charging events, capacities and settings, see
+simulation_key). Checkpoints with a different key are not used and get replaced.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+STATE_COLUMNS = (
+    "battery_capacity",
+    "cap_fade",
+    "cap_fade_abs",
+    "soh",
+    "needs_replacement",
+    "eol_week",
+)
+
+
+def simulation_key(arrays, settings):
+    """
+    Short hash of everything the simulated years depend on.
+
+    :param arrays: arrays with the inputs of the simulation, e.g. the charging events and capacities
+    :param settings: dict with JSON serializable settings, e.g. backend and fold_weeks
+    """
+    digest = hashlib.sha1(json.dumps(settings, sort_keys=True).encode())
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(array.dtype.str.encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()[:16]
+
+
+class CheckpointStore:
+    """Folder with one checkpoint per simulated year."""
+
+    def __init__(self, folder, key):
+        self.folder = folder
+        self.key = key
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, year):
+        return os.path.join(self.folder, f"year_{year:03d}.npz")
+
+    def save(self, year, state, results_row):
+        """
+        Writes the checkpoint of a year.
+
+        :param state: dict or object with the arrays of STATE_COLUMNS after the year
+        :param results_row: results_array[:, :, year]
+        """
+        if not isinstance(state, dict):
+            state = {column: getattr(state, column) for column in STATE_COLUMNS}
+        path = self.path(year)
+        # write to a temporary file first, so a crash does not leave a broken checkpoint behind
+        temporary_path = path[: -len(".npz")] + ".tmp.npz"
+        np.savez(
+            temporary_path,
+            key=np.array(self.key),
+            results_row=results_row,
+            **{column: state[column] for column in STATE_COLUMNS},
+        )
+        os.replace(temporary_path, path)
+
+    def load(self, years):
+        """
+        Loads the checkpoints of the consecutive years 1, 2, ... that match the key, at most the given number of years.
+
+        Checkpoints from the first missing or outdated year on are deleted, since they can not be reached anymore.
+
+        :return: list with a dict of arrays (STATE_COLUMNS and results_row) for each year
+        """
+        checkpoints = []
+        for year in range(1, years + 1):
+            path = self.path(year)
+            if not os.path.exists(path):
+                break
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["key"]) != self.key:
+                    break
+                checkpoints.append({name: data[name] for name in data.files})
+        else:
+            return checkpoints
+        self.clear(from_year=len(checkpoints) + 1)
+        return checkpoints
+
+    def clear(self, from_year=1):
+        """Deletes all checkpoints from the given year on."""
+        for name in os.listdir(self.folder):
+            if name.startswith("year_") and name.endswith(".npz"):
+                year = int(name[len("year_") :].split(".")[0])
+                if year >= from_year:
+                    os.remove(os.path.join(self.folder, name))
@@ -0,0 +1,572 @@
+"""
+Vectorized implementation of the battery degeneration model from yurena_example.py.
+
+calc_cap_fade/update_soh process one charging event of one vehicle at a time. The functions in this file do the same
+calculation for all charging events of the fleet at once, using flat NumPy arrays instead of Event and Vehicle objects.
+"""
+
+import importlib.util
+import math
+import warnings
+from functools import lru_cache
+
+import numpy as np
+
+# numba is optional, without it the "numba" backend falls back to "numpy". It is only imported (and the kernel
+# compiled) when the numba backend is used, importing it takes longer than all other simulation modules together.
+HAS_NUMBA = importlib.util.find_spec("numba") is not None
+
+# Parameters of the degeneration model (see calc_cap_fade in yurena_example.py)
+K_S = (-4.092e-4, -2.167, 1.408e-5, 6.130)
+E_A = 78060  # activation energy in J/mol
+R = 8.314  # gas constant in J/(mol K)
+T_REF = 298.15  # reference temperature in K
+T_DEFAULT = 300.15  # temperature used for all events in K
+
+WEEKS_PER_YEAR = 52
+
+# Backends for the per-vehicle time stepping in calc_cap_fade_batch
+BACKENDS = ("python", "numpy", "numba")
+
+
+@lru_cache(maxsize=None)
+def arrhenius_factor(T):
+    """Temperature dependence exp(-(E_a / R) * (1 / T - 1 / T_ref)) of the model for one temperature in K."""
+    return math.exp(-(E_A / R) * (1 / T - 1 / T_REF))
+
+
+def arrhenius_factors(T, resolution=None):
+    """
+    Looks up the Arrhenius factor for an array of temperatures.
+
+    The factor is calculated only once per distinct temperature and memoized by arrhenius_factor, so a temperature
+    series costs little more than a constant temperature.
+
+    :param T: temperature or array of temperatures in K
+    :param resolution: if given, the temperatures are rounded to bins of this width in K first
+    :return: array of factors with the same shape as T
+    """
+    T = np.asarray(T, dtype=np.float64)
+    if resolution is not None:
+        T = np.round(T / resolution) * resolution
+    bins, inverse = np.unique(T, return_inverse=True)
+    table = np.array([arrhenius_factor(float(t)) for t in bins], dtype=np.float64)
+    return table[inverse].reshape(T.shape)
+
+
+def check_temperature_profile(weekly_T, weeks=WEEKS_PER_YEAR):
+    """Raises a ValueError if a temperature profile does not have one temperature for each week of a year."""
+    if len(weekly_T) != weeks:
+        raise ValueError(
+            f"The temperature profile has {len(weekly_T)} weeks, expected {weeks}."
+        )
+
+
+def load_temperature_profile(path, celsius=False):
+    """
+    Loads a seasonal temperature profile from a CSV file with a header row and one row per week.
+
+    :param path: path of the CSV file, the temperature is taken from the last column
+    :param celsius: True if the temperatures in the file are given in °C instead of K
+    :return: array with the temperature of each week in K
+    """
+    temperatures = np.loadtxt(path, delimiter=",", skiprows=1, ndmin=2)[:, -1]
+    check_temperature_profile(temperatures)
+    if celsius:
+        temperatures = temperatures + 273.15
+    return temperatures
+
+
+def calc_fade_rates(soc_start, soc_end, T=T_DEFAULT):
+    """
+    Calculates the capacity independent part of the degeneration model for each event.
+
+    The capacity fade of an event is d_cf = rate * Ah with Ah = 2 * |soc_start - soc_end| * battery_capacity, so the
+    rate only has to be calculated once per event, no matter how often the event is simulated.
+
+    :param soc_start: array of the SoC at the start of each event
+    :param soc_end: array of the SoC at the end of each event
+    :param T: temperature in K, either one value for all events or an array with the temperature of each event
+    :return: array with the rate of each event
+    """
+    soc_start = np.asarray(soc_start, dtype=np.float64)
+    soc_end = np.asarray(soc_end, dtype=np.float64)
+
+    soc_avg = (soc_start + soc_end) / 2
+    if np.any(soc_avg < 0):
+        raise ValueError("Average SoC of a charging event cannot be below 0.")
+
+    soc_dev = np.abs(soc_end - soc_start) / 2
+    arrhenius = arrhenius_factors(T)
+    return (
+        K_S[0] * soc_dev * np.exp(K_S[1] * soc_avg) + K_S[2] * np.exp(K_S[3] * soc_dev)
+    ) * arrhenius
+
+
+def event_steps(vehicle_index):
+    """
+    Groups events by their position within the event list of their vehicle.
+
+    Step k contains the k-th event of every vehicle with more than k events. Since every vehicle appears at most once
+    per step, all events of a step can be processed at the same time without breaking the sequential dependency on
+    the battery capacity of a vehicle.
+
+    :param vehicle_index: array with the index of the vehicle of each event
+    :return: list of (event indices, vehicle indices) tuples, one per step
+    """
+    vehicle_index = np.asarray(vehicle_index, dtype=np.intp)
+    if vehicle_index.size == 0:
+        return []
+
+    # sort by vehicle, keeping the order of the events of each vehicle
+    order = np.argsort(vehicle_index, kind="stable")
+    sorted_vehicles = vehicle_index[order]
+    group_start = np.flatnonzero(
+        np.r_[True, sorted_vehicles[1:] != sorted_vehicles[:-1]]
+    )
+    group_size = np.diff(np.r_[group_start, sorted_vehicles.size])
+    position = np.arange(sorted_vehicles.size) - np.repeat(group_start, group_size)
+
+    steps = []
+    for k in range(position.max() + 1):
+        event_idx = order[position == k]
+        steps.append((event_idx, vehicle_index[event_idx]))
+    return steps
+
+
+def resolve_backend(backend):
+    """
+    Checks the name of a backend and falls back to "numpy" if numba is requested but not installed.
+
+    :param backend: one of BACKENDS
+    :return: the backend that will actually be used
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend}, choose one of {BACKENDS}.")
+    if backend == "numba" and not HAS_NUMBA:
+        warnings.warn("numba is not installed, using the numpy backend instead.")
+        return "numpy"
+    return backend
+
+
+def _step_events_loop(
+    rates,
+    ah_factor,
+    order,
+    offsets,
+    battery_capacity,
+    full_capacity,
+    cap_fade,
+    cap_fade_abs,
+    soh,
+    needs_replacement,
+    d_cf,
+    week_scale,
+    eol_week,
+    week_offset,
+    drop_eol,
+):
+    """
+    Steps through the events vehicle by vehicle, like calc_cap_fade and update_soh.
+
+    The events of the vehicle at position v are order[offsets[v]:offsets[v + 1]]. The rates of week w are multiplied
+    by week_scale[w]. Used as the pure Python backend and compiled by numba for the numba backend.
+    """
+    for v in range(offsets.size - 1):
+        if drop_eol and needs_replacement[v]:
+            continue
+        for w in range(week_scale.size):
+            for k in range(offsets[v], offsets[v + 1]):
+                e = order[k]
+                Ah = ah_factor[e] * battery_capacity[v]
+                d = (rates[e] * week_scale[w]) * Ah
+                d_cf[e] = d
+
+                cap_fade_abs[v] += d
+                cap_fade[v] += d / (0.2 * full_capacity[v])
+                soh[v] = 1 - cap_fade[v]
+                battery_capacity[v] -= d
+
+                # for when the EoL-condition is met
+                if soh[v] <= 0:
+                    needs_replacement[v] = True
+                    soh[v] = 0
+                    if eol_week[v] < 0:
+                        eol_week[v] = week_offset + w
+                    if drop_eol:
+                        break
+            if drop_eol and needs_replacement[v]:
+                break
+
+
+@lru_cache(maxsize=None)
+def _step_events_numba():
+    """_step_events_loop compiled by numba, numba is imported on the first call."""
+    import numba
+
+    return numba.njit(cache=True)(_step_events_loop)
+
+
+def calc_cap_fade_batch(
+    soc_start,
+    soc_end,
+    vehicle_index,
+    battery_capacity,
+    full_capacity,
+    cap_fade,
+    cap_fade_abs,
+    soh,
+    needs_replacement,
+    T=T_DEFAULT,
+    weeks=1,
+    steps=None,
+    backend="numpy",
+    weekly_T=None,
+    eol_week=None,
+    week_offset=0,
+    drop_eol=False,
+):
+    """
+    Vectorized counterpart of calc_cap_fade and update_soh for the charging events of the whole fleet.
+
+    The events are passed as flat arrays, vehicle_index maps each event to a position in the state arrays. Events of
+    the same vehicle are processed in the order in which they appear. The state arrays (battery_capacity, cap_fade,
+    cap_fade_abs, soh, needs_replacement) are updated in place, with the same operations as update_soh, so the results
+    match the per-event implementation.
+
+    The capacity feedback is sequential for each vehicle. The backend decides how it is stepped through:
+    "numpy" processes the k-th event of all vehicles at once, "python" and "numba" loop over the vehicles one by one.
+    The "python" backend also calculates the rates with math.exp and reproduces calc_cap_fade exactly.
+
+    :param T: temperature in K, one value or an array with the temperature of each event
+    :param weeks: number of times the events get simulated in a row
+    :param steps: precomputed result of event_steps(vehicle_index), e.g. from an EventIndex
+    :param backend: one of BACKENDS
+    :param weekly_T: array with the temperature of each of the weeks in K, replaces T
+    :param eol_week: array with the week in which each vehicle reached its EoL (-1 before), updated in place
+    :param week_offset: number of weeks simulated before, so eol_week counts from the start of the simulation
+    :param drop_eol: vehicles that need a replacement are not simulated any further, their state stays at the event
+        in which they reached the EoL
+    :return: array with d_cf of each event in the last simulated week
+    """
+    backend = resolve_backend(backend)
+    soc_start = np.asarray(soc_start, dtype=np.float64)
+    soc_end = np.asarray(soc_end, dtype=np.float64)
+
+    # with a seasonal profile the temperature only enters through the factor of each week
+    if weekly_T is not None:
+        check_temperature_profile(weekly_T, weeks)
+        T = T_REF
+        week_scale = arrhenius_factors(weekly_T)
+    else:
+        week_scale = np.ones(weeks, dtype=np.float64)
+
+    if backend == "python":
+        arrhenius = np.broadcast_to(arrhenius_factors(T), soc_start.shape)
+        rates = np.array(
+            [
+                (
+                    K_S[0]
+                    * (abs(end - start) / 2)
+                    * math.exp(K_S[1] * ((start + end) / 2))
+                    + K_S[2] * math.exp(K_S[3] * (abs(end - start) / 2))
+                )
+                * arr
+                for start, end, arr in zip(
+                    soc_start.tolist(), soc_end.tolist(), arrhenius.tolist()
+                )
+            ],
+            dtype=np.float64,
+        )
+    else:
+        rates = calc_fade_rates(soc_start, soc_end, T)
+    ah_factor = 2 * np.abs(soc_start - soc_end)
+    d_cf = np.zeros_like(rates)
+    if eol_week is None:
+        eol_week = np.full(len(battery_capacity), -1, dtype=np.int64)
+
+    if backend in ("python", "numba"):
+        vehicle_index = np.asarray(vehicle_index, dtype=np.intp)
+        order = np.argsort(vehicle_index, kind="stable")
+        offsets = np.r_[
+            0, np.cumsum(np.bincount(vehicle_index, minlength=len(battery_capacity)))
+        ]
+        step_events = _step_events_loop if backend == "python" else _step_events_numba()
+        step_events(
+            rates,
+            ah_factor,
+            order,
+            offsets,
+            battery_capacity,
+            full_capacity,
+            cap_fade,
+            cap_fade_abs,
+            soh,
+            needs_replacement,
+            d_cf,
+            week_scale,
+            eol_week,
+            week_offset,
+            drop_eol,
+        )
+        return d_cf
+
+    if steps is None:
+        steps = event_steps(vehicle_index)
+    if drop_eol:
+        steps = _active_steps(steps, needs_replacement)
+    # rates of the events for each distinct temperature of the weeks
+    rates_of_scale = {}
+    for w, scale in enumerate(week_scale.tolist()):
+        if scale not in rates_of_scale:
+            rates_of_scale[scale] = rates * scale
+        week_rates = rates_of_scale[scale]
+
+        # vehicles that reached the EoL in this week drop out of the remaining steps
+        dropped = False
+        for event_idx, veh_idx in steps:
+            if dropped:
+                active = ~needs_replacement[veh_idx]
+                event_idx, veh_idx = event_idx[active], veh_idx[active]
+            Ah = ah_factor[event_idx] * battery_capacity[veh_idx]
+            d_cf_step = week_rates[event_idx] * Ah
+            d_cf[event_idx] = d_cf_step
+
+            # same operations as update_soh
+            cap_fade_abs[veh_idx] += d_cf_step
+            cap_fade[veh_idx] += d_cf_step / (0.2 * full_capacity[veh_idx])
+            soh[veh_idx] = 1 - cap_fade[veh_idx]
+            battery_capacity[veh_idx] -= d_cf_step
+
+            # for when the EoL-condition is met
+            eol = veh_idx[soh[veh_idx] <= 0]
+            needs_replacement[eol] = True
+            soh[eol] = 0
+            if eol.size:
+                eol = eol[eol_week[eol] < 0]
+                eol_week[eol] = week_offset + w
+                dropped = drop_eol
+        if dropped:
+            steps = _active_steps(steps, needs_replacement)
+    return d_cf
+
+
+def _active_steps(steps, needs_replacement):
+    """Removes the events of vehicles that need a replacement from the steps of event_steps."""
+    active_steps = []
+    for event_idx, veh_idx in steps:
+        active = ~needs_replacement[veh_idx]
+        if active.any():
+            active_steps.append((event_idx[active], veh_idx[active]))
+    return active_steps
+
+
+def calc_weekly_factors(
+    soc_start, soc_end, vehicle_index, n_vehicles, T=T_DEFAULT, weekly_T=None
+):
+    """
+    Calculates the share of the battery capacity that is left after one week of charging events for each vehicle.
+
+    Each event reduces the capacity by d_cf = rate * 2 * |soc_start - soc_end| * battery_capacity, so it multiplies
+    the capacity by (1 - rate * 2 * |soc_start - soc_end|). A whole week therefore multiplies the capacity by the
+    product of these factors, independent of the capacity at the start of the week.
+
+    :param n_vehicles: number of vehicles, vehicles without events get a factor of 1
+    :param weekly_T: array with the temperature of each week in K, replaces T
+    :return: array with the weekly factor of each vehicle, or an array (weeks x vehicles) if weekly_T is given
+    """
+    vehicle_index = np.asarray(vehicle_index, dtype=np.intp)
+    ah_factor = 2 * np.abs(
+        np.asarray(soc_start, dtype=np.float64) - np.asarray(soc_end, dtype=np.float64)
+    )
+
+    def factors(rates):
+        weekly_factors = np.ones(n_vehicles, dtype=np.float64)
+        np.multiply.at(weekly_factors, vehicle_index, 1 - rates * ah_factor)
+        return weekly_factors
+
+    if weekly_T is None:
+        return factors(calc_fade_rates(soc_start, soc_end, T))
+
+    check_temperature_profile(weekly_T)
+    # the factors only have to be calculated once for each distinct temperature
+    rates = calc_fade_rates(soc_start, soc_end, T_REF)
+    temperatures, inverse = np.unique(np.asarray(weekly_T), return_inverse=True)
+    table = np.array(
+        [factors(rates * scale) for scale in arrhenius_factors(temperatures)]
+    ).reshape(len(temperatures), n_vehicles)
+    return table[inverse.ravel()]
+
+
+def advance_weeks(
+    weekly_factors,
+    battery_capacity,
+    full_capacity,
+    cap_fade,
+    cap_fade_abs,
+    soh,
+    needs_replacement,
+    weeks=WEEKS_PER_YEAR,
+    eol_week=None,
+    week_offset=0,
+    drop_eol=False,
+):
+    """
+    Advances the whole fleet by a number of weeks in one step.
+
+    Uses the closed form battery_capacity_n = battery_capacity_0 * weekly_factor^n instead of simulating every event
+    of every week. The state arrays are updated in place like in calc_cap_fade_batch. The results match the event by
+    event simulation up to floating point rounding. Since the capacity changes monotonically from week to week, the
+    EoL-condition only has to be checked at the end.
+
+    :param weekly_factors: weekly factors of the vehicles, see calc_weekly_factors. For a seasonal profile an array
+        (weeks x vehicles) with the factors of each week, weeks is ignored then.
+    :param weeks: number of identical weeks to advance, e.g. 52 for a whole year
+    :param eol_week: array with the week in which each vehicle reached its EoL (-1 before), updated in place. The week
+        is found from the capacities at the end of each week of the vehicles that reached the EoL.
+    :param week_offset: number of weeks simulated before, so eol_week counts from the start of the simulation
+    :param drop_eol: vehicles that need a replacement are not advanced any further, the state of vehicles that reach
+        the EoL is the state at the end of their EoL week
+    """
+    if np.ndim(weekly_factors) == 2:
+        weeks = len(weekly_factors)
+        new_capacity = battery_capacity * np.prod(weekly_factors, axis=0)
+    else:
+        new_capacity = battery_capacity * weekly_factors**weeks
+    if drop_eol:
+        new_capacity = np.where(needs_replacement, battery_capacity, new_capacity)
+    d_cf = battery_capacity - new_capacity
+    new_cap_fade = cap_fade + d_cf / (0.2 * full_capacity)
+
+    # vehicles that reach the EoL within these weeks, with the week from the capacities at the end of each week
+    reached = np.flatnonzero((1 - new_cap_fade <= 0) & ~needs_replacement)
+    if reached.size and (eol_week is not None or drop_eol):
+        if np.ndim(weekly_factors) == 2:
+            factors = np.cumprod(weekly_factors[:, reached], axis=0)
+        else:
+            factors = weekly_factors[reached] ** np.arange(1, weeks + 1)[:, np.newaxis]
+        capacity_of_week = battery_capacity[reached] * factors
+        cap_fade_of_week = cap_fade[reached] + (
+            battery_capacity[reached] - capacity_of_week
+        ) / (0.2 * full_capacity[reached])
+        # rounding can shift the crossing past the last week, the EoL is reached in the last week then
+        week = np.minimum(np.argmax(1 - cap_fade_of_week <= 0, axis=0), weeks - 1)
+        week = np.where((1 - cap_fade_of_week <= 0).any(axis=0), week, weeks - 1)
+        if eol_week is not None:
+            first = eol_week[reached] < 0
+            eol_week[reached[first]] = week_offset + week[first]
+        if drop_eol:
+            new_capacity[reached] = capacity_of_week[week, np.arange(reached.size)]
+            d_cf = battery_capacity - new_capacity
+
+    cap_fade_abs += d_cf
+    cap_fade += d_cf / (0.2 * full_capacity)
+    soh[:] = 1 - cap_fade
+    battery_capacity[:] = new_capacity
+
+    # for when the EoL-condition is met
+    eol = soh <= 0
+    needs_replacement[eol] = True
+    soh[eol] = 0
+
+
+def simulate_years(
+    soc_start,
+    soc_end,
+    vehicle_index,
+    battery_capacity,
+    full_capacity,
+    years,
+    T=T_DEFAULT,
+    fold_weeks=False,
+    steps=None,
+    backend="numpy",
+    weekly_T=None,
+    initial_state=None,
+    drop_eol=False,
+    week_offset=0,
+):
+    """
+    Simulates the degeneration of a fleet for several years and records the state at the end of every year.
+
+    :param battery_capacity: initial battery capacity of each vehicle in Ah, is not changed
+    :param full_capacity: full capacity of each vehicle in Ah
+    :param years: number of years to simulate
+    :param fold_weeks: use advance_weeks instead of simulating every event, see calc_weekly_factors
+    :param backend: backend for calc_cap_fade_batch, see BACKENDS
+    :param weekly_T: array with the temperature of each week of a year in K, replaces T
+    :param initial_state: dict with cap_fade, cap_fade_abs, soh, needs_replacement and eol_week of each vehicle to
+        continue an earlier simulation from, battery_capacity is then the capacity at that point. Defaults to new
+        batteries.
+    :param drop_eol: vehicles that need a replacement are not simulated any further, see calc_cap_fade_batch
+    :param week_offset: number of weeks simulated before the initial state, for eol_week
+    :return: dict with arrays of shape (years + 1, vehicles) for battery_capacity, cap_fade, cap_fade_abs, soh,
+        needs_replacement and eol_week. Row 0 is the initial state, row i the state after year i.
+    """
+    n_vehicles = len(full_capacity)
+    full_capacity = np.asarray(full_capacity, dtype=np.float64)
+    state = {
+        "battery_capacity": np.array(battery_capacity, dtype=np.float64),
+        "cap_fade": np.zeros(n_vehicles, dtype=np.float64),
+        "cap_fade_abs": np.zeros(n_vehicles, dtype=np.float64),
+        "soh": np.ones(n_vehicles, dtype=np.float64),
+        "needs_replacement": np.zeros(n_vehicles, dtype=bool),
+        "eol_week": np.full(n_vehicles, -1, dtype=np.int64),
+    }
+    if initial_state is not None:
+        for key, value in initial_state.items():
+            state[key] = np.array(value, dtype=state[key].dtype)
+    trajectories = {
+        key: np.empty((years + 1, n_vehicles), dtype=value.dtype)
+        for key, value in state.items()
+    }
+    for key, value in state.items():
+        trajectories[key][0] = value
+
+    if fold_weeks:
+        weekly_factors = calc_weekly_factors(
+            soc_start, soc_end, vehicle_index, n_vehicles, T, weekly_T
+        )
+    else:
+        backend = resolve_backend(backend)
+        if steps is None and backend == "numpy":
+            steps = event_steps(vehicle_index)
+
+    for year in range(1, years + 1):
+        weeks_before = week_offset + (year - 1) * WEEKS_PER_YEAR
+        if fold_weeks:
+            advance_weeks(
+                weekly_factors,
+                state["battery_capacity"],
+                full_capacity,
+                state["cap_fade"],
+                state["cap_fade_abs"],
+                state["soh"],
+                state["needs_replacement"],
+                eol_week=state["eol_week"],
+                week_offset=weeks_before,
+                drop_eol=drop_eol,
+            )
+        else:
+            calc_cap_fade_batch(
+                soc_start,
+                soc_end,
+                vehicle_index,
+                state["battery_capacity"],
+                full_capacity,
+                state["cap_fade"],
+                state["cap_fade_abs"],
+                state["soh"],
+                state["needs_replacement"],
+                T=T,
+                weeks=WEEKS_PER_YEAR,
+                steps=steps,
+                backend=backend,
+                weekly_T=weekly_T,
+                eol_week=state["eol_week"],
+                week_offset=weeks_before,
+                drop_eol=drop_eol,
+            )
+        for key, value in state.items():
+            trajectories[key][year] = value
+    return trajectories
@@ -0,0 +1,94 @@
+"""
+Precomputed charging event index for the degeneration simulation.
+
+The charging events of a vehicle are the same in every simulated week, so they only have to be checked and converted
+once. EventIndex stores them for the whole fleet in flat arrays with CSR-style offsets: the events of the
+vehicle at position i are the entries offsets[i]:offsets[i + 1].
+"""
+
+import numpy as np
+
+from yurena_degradation import event_steps
+
+
+class EventIndex:
+    """Immutable, unique charging events of all vehicles in flat arrays."""
+
+    def __init__(self, vehicle_ids, offsets, event_ids, soc_start, soc_end):
+        self.vehicle_ids = np.array(vehicle_ids, dtype=np.int64)
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.event_ids = np.array(event_ids, dtype=np.int64)
+        self.soc_start = np.array(soc_start, dtype=np.float64)
+        self.soc_end = np.array(soc_end, dtype=np.float64)
+
+        if (
+            self.offsets.size != self.vehicle_ids.size + 1
+            or self.offsets[-1] != self.event_ids.size
+        ):
+            raise ValueError("Offsets do not match the number of vehicles and events.")
+
+        # position of the vehicle for each event, used by the vectorized kernels
+        self.vehicle_index = np.repeat(
+            np.arange(self.n_vehicles), np.diff(self.offsets)
+        )
+        # events grouped by their position within the events of their vehicle, see event_steps
+        self.steps = event_steps(self.vehicle_index)
+
+        for array in (
+            self.vehicle_ids,
+            self.offsets,
+            self.event_ids,
+            self.soc_start,
+            self.soc_end,
+            self.vehicle_index,
+        ):
+            array.flags.writeable = False
+
+    @classmethod
+    def from_sorted_arrays(
+        cls, vehicle_ids, event_vehicle_ids, event_ids, soc_start, soc_end
+    ):
+        """
+        Builds the index from flat event arrays that are already sorted by vehicle id and free of duplicates.
+
+        This is the case for load_event_arrays with order_by_vehicle=True, the event ids are the primary keys of the
+        events. Both is checked, the events of each vehicle are then a contiguous range that only has to be sliced.
+
+        :param vehicle_ids: ids of the vehicles, in the order of the vehicle positions used in the simulation
+        :param event_vehicle_ids: vehicle id of each event, ascending
+        """
+        vehicle_ids = np.asarray(vehicle_ids, dtype=np.int64)
+        event_vehicle_ids = np.asarray(event_vehicle_ids, dtype=np.int64)
+        if np.any(np.diff(event_vehicle_ids) < 0):
+            raise ValueError("The events are not sorted by vehicle id.")
+        if np.unique(event_ids).size != np.size(event_ids):
+            raise ValueError("The events contain duplicate event ids.")
+
+        # range of the events of each vehicle
+        starts = np.searchsorted(event_vehicle_ids, vehicle_ids, side="left")
+        counts = np.searchsorted(event_vehicle_ids, vehicle_ids, side="right") - starts
+        offsets = np.r_[0, np.cumsum(counts)]
+        positions = np.repeat(starts - offsets[:-1], counts) + np.arange(offsets[-1])
+
+        return cls(
+            vehicle_ids,
+            offsets,
+            np.asarray(event_ids, dtype=np.int64)[positions],
+            np.asarray(soc_start, dtype=np.float64)[positions],
+            np.asarray(soc_end, dtype=np.float64)[positions],
+        )
+
+    @property
+    def n_vehicles(self):
+        return self.vehicle_ids.size
+
+    def __len__(self):
+        return self.event_ids.size
+
+    def events_of(self, i):
+        """Returns the slice of the flat arrays that belongs to the vehicle at position i."""
+        return slice(self.offsets[i], self.offsets[i + 1])
+
+    def event_counts(self):
+        """Returns the number of unique charging events of each vehicle."""
+        return np.diff(self.offsets)
@@ -1,61 +1,18 @@
-import numpy as np
 import math
-import matplotlib.pyplot as plt
-from collections import defaultdict
-import json
 
 ###GIVEN CODE:
 #! /usr/bin/env python3
 import argparse
 import os
-import warnings
 
-from eflips.model import *
-from eflips.model import ConsistencyWarning
-from sqlalchemy import create_engine, distinct, false, or_
+from sqlalchemy import create_engine
 from sqlalchemy.orm import Session
 
+#numpy and the simulation modules are only imported by run_degradation and the functions it calls, so listing the
+#scenarios only loads SQLAlchemy and eflips.model. The modules for the parallel simulation, the Monte Carlo analysis
+#and the plots are imported when these stages run. eflips.model is only imported where the database is read, so the
+#simulation functions below can be used without it (e.g. by yurena_benchmark).
 
-#creates separate classes for Vehicle types and vehicles to change attributes more easily
-class VehicleType_new:
-    def __init__(self, vehicle_type):
-        self.vehicle_type_id = vehicle_type.id
-        #conversion of battery from kWh tp Ah
-        self.battery_capacity = (vehicle_type.battery_capacity * 1000)/(3.2 * 200)
-        self.battery_capacity_reserve = (vehicle_type.battery_capacity_reserve * 1000)/(3.2 * 200)
-        self.full_capacity = self.battery_capacity + self.battery_capacity_reserve
-
-#Klasse für Vehicles definieren, erbt von VehicleType
-class Vehicle_new(VehicleType_new):
-    def __init__(self, vehicle, soh = 1):
-        #inherit properties of their VehicleType
-        self.vehicle_type = all_vehicletypes[vehicle.vehicle_type_id]
-        super().__init__(self.vehicle_type)
-
-        #parameters:
-        self.depot = None
-        self.id = vehicle.id
-        self.soh = 1
-        self.yearly_soh = [self.soh]
-        self.yearly_cap_fade = [0]
-        self.cap_fade_abs = 0
-        self.cap_fade = 0
-        self.age = 0
-        self.needs_replacement = False
-
-        #store all events for the vehicle:
-        self.driving_events = []
-        self.charging_events = []
-
-#helpful function to ensure that there are no duplicates in a list
-def filter_uniques(objects):
-    unique_objects = []
-    logged_obj_ids = set()
-    for obj in objects:
-        if obj.id not in logged_obj_ids:
-            unique_objects.append(obj)
-            logged_obj_ids.add(obj.id)
-    return unique_objects
 
 #updates the SoH and capacity fade for a vehicle object
 def update_soh(veh, d_cf):
@@ -93,113 +50,73 @@ def calc_cap_fade(event, veh, T):
     return(d_cf)
 
 #pass through the battery degeneration simulation for an entire year (52 weeks)
-def calc_yearly_degen(vehicles):
-    weeks_passed = 0
-    while weeks_passed < 52:
-        for vehicle in vehicles:
-            # remove duplicate events before processing
-            unique_charging_events = filter_uniques(vehicle.charging_events)
-            # process each UNIQUE charging event
-            for event in unique_charging_events:
-                # todo: Temperaturabhängigkeit prüfen!!
-                # todo: unrealisitische Annahme der identischen Wochen mit stark unterschiedlicher Belastung zwischen Fahrzeugen umgehen
-                # zu todo: jede Woche driving events zykeln? wöchentlichen Durchschnitt nehmen?
-                d_cf = calc_cap_fade(event, vehicle, T=300.15)  # in Kelvin)
-        weeks_passed += 1
-
-    #increase age of all vehicles
-    for vehicle in vehicles:
-        vehicle.age +=1
-        vehicle.yearly_soh.append(vehicle.soh)
-        vehicle.yearly_cap_fade.append(vehicle.cap_fade)
+#uses the vectorized kernel from yurena_degradation, calc_cap_fade is kept as the reference for a single event
+#the charging events are read from the precomputed event_index, positions in the index match the fleet
+#if weekly_factors are given (see calc_weekly_factors), the year is folded into one closed-form step instead
+#backend selects how the events are stepped through: "python" (reference), "numpy" or "numba" (optional dependency)
+#weekly_T is an optional seasonal temperature profile with one temperature per week, replacing the constant T
+#the week in which a vehicle reaches its EoL is saved in fleet.eol_week, with drop_eol the vehicle is not simulated any
+#further after that (its state stays at the EoL)
+def calc_yearly_degen(fleet, event_index, T=None, weekly_factors=None, backend="numpy", weekly_T=None,
+                      drop_eol=False):
+    #the columns of the FleetState get updated in place by the kernel
+    # todo: unrealisitische Annahme der identischen Wochen mit stark unterschiedlicher Belastung zwischen Fahrzeugen umgehen
+    # zu todo: jede Woche driving events zykeln? wöchentlichen Durchschnitt nehmen?
+    from yurena_degradation import T_DEFAULT, WEEKS_PER_YEAR, advance_weeks, calc_cap_fade_batch
+
+    if T is None:
+        T = T_DEFAULT
+    week_offset = int(fleet.age.max(initial=0)) * WEEKS_PER_YEAR
+    if weekly_factors is not None:
+        advance_weeks(weekly_factors, fleet.battery_capacity, fleet.full_capacity, fleet.cap_fade,
+                      fleet.cap_fade_abs, fleet.soh, fleet.needs_replacement, weeks=WEEKS_PER_YEAR,
+                      eol_week=fleet.eol_week, week_offset=week_offset, drop_eol=drop_eol)
+    else:
+        calc_cap_fade_batch(event_index.soc_start, event_index.soc_end, event_index.vehicle_index,
+                            fleet.battery_capacity, fleet.full_capacity, fleet.cap_fade, fleet.cap_fade_abs,
+                            fleet.soh, fleet.needs_replacement, T=T, weeks=WEEKS_PER_YEAR, steps=event_index.steps,
+                            backend=backend, weekly_T=weekly_T, eol_week=fleet.eol_week, week_offset=week_offset,
+                            drop_eol=drop_eol)
+    fleet.record_year()
+
+#writes the state after a simulated year (e.g. from simulate_years_parallel) into the fleet and increases the age
+def set_yearly_state(fleet, battery_capacity, cap_fade, cap_fade_abs, soh, needs_replacement, eol_week):
+    fleet.battery_capacity[:] = battery_capacity
+    fleet.cap_fade[:] = cap_fade
+    fleet.cap_fade_abs[:] = cap_fade_abs
+    fleet.soh[:] = soh
+    fleet.needs_replacement[:] = needs_replacement
+    fleet.eol_week[:] = eol_week
+    fleet.record_year()
 
 #creates an array to store average ages of the vehicletypes in the depots for that year
-def create_cap_fade_array(vehicles, year, result_dict, results_array):
+def create_cap_fade_array(fleet, year, result_dict, results_array, groups, depot_indizes, vehicle_type_indizes):
+    import numpy as np
+
     #assert that all vehicles have the same age
-    assert all(vehicle.age == year for vehicle in vehicles)
+    assert np.all(fleet.age == year)
     #AFTER year has passed, the age gets updated to number of that year
 
-    # create arrays to store average ages in, for depots and for vehicle types, needed tor table later on
-    avg_cap_fade_dict = defaultdict(list)
-    depot_avg_sums = defaultdict(list)
-    vehicle_type_avg_sums = defaultdict(list)
-
-    # create plots to visualize capacity fade distribution, sorted by depot
-    for depot_id, depot in all_depots.items():
-        vehicles_in_depot = vehicles_of_depot[depot_id]
-
-        # Loop through each vehicle type to generate and save a histogram
-        for v_type in all_vehicletypes.keys():
-            # Filter vehicles of vehicle type out of vehicles of that depot
-            cap_fade_of_vt = [vehicle.cap_fade for vehicle in vehicles_in_depot if vehicle.vehicle_type_id == v_type]
-
-            n = len(cap_fade_of_vt)
-
-            depot_index = depot_indizes[depot_id]
-            vt_index = vehicle_type_indizes[v_type]
-
-            # checks if there are no vehicles assigned to avoid error messages
-            if n > 0:
-                # show other relevant stats in graphs
-                avg_cap_fade = np.mean(cap_fade_of_vt)
-
-                # save the weighted averages for table later on
-                #todo: brauche ich noch für die durchschnittswerte, wie ersetzen?
-                avg_cap_fade_dict[(depot_id, v_type)] = avg_cap_fade  # store in avg_ages_dict
-                depot_avg_sums[depot_id].extend([avg_cap_fade] * n)
-                vehicle_type_avg_sums[v_type].extend([avg_cap_fade] * n)
-
-
-                #results get put in for the next year, due to how indizes work into the index of year
-                #could also be imagined as,
-                result_dict[(depot_id, v_type, year)] = avg_cap_fade
-                results_array[depot_index, vt_index, year] = avg_cap_fade
-            else:
-                avg_cap_fade = None
-                results_array[depot_index, vt_index, year] = np.nan
+    #averages for depots and for vehicle types in one pass over all vehicles
+    stats = groups.aggregate(fleet.cap_fade)
 
-    depot_avg = {depot_id: np.sum(values)/len(vehicles_of_depot[depot_id]) for depot_id, values in depot_avg_sums.items()}
-    vehicle_type_avg = {vt_id: np.sum(values)/len(vehicles_of_vehicletype[vt_id]) for vt_id, values in vehicle_type_avg_sums.items()}
+    #results get put in for the next year, due to how indizes work into the index of year
+    #depot x vehicle type pairs without vehicles stay NaN
+    results_array[:, :, year] = stats["pair_mean"]
 
-    return avg_cap_fade_dict, depot_avg, vehicle_type_avg
+    for depot_id, depot_index in depot_indizes.items():
+        for v_type, vt_index in vehicle_type_indizes.items():
+            if stats["pair_count"][depot_index, vt_index] > 0:
+                result_dict[(depot_id, v_type, year)] = stats["pair_mean"][depot_index, vt_index]
 
-
-
-def create_cap_fade_table(vehicles, avg_cap_fade_dict, depot_avg, vehicle_type_avg, year):
-    # calculate total weighted average
-    sum_cap_fades = sum([veh.cap_fade for veh in vehicles])  # Sum up the ages of all vehicles
-    all_avg_cap_fade = sum_cap_fades / len(vehicles)
-
-    all_avg_file = os.path.join(folder_path, f"average_capacity_fades_in_year{year}.csv")
-    with open(all_avg_file, "w") as file:
-        file.write(f"Average capacity fade for vehicles after {year} years\n")
-        columns = ['Depot'] + [all_vehicletypes[vt_id].name for vt_id in all_vehicletypes.keys()] + [
-            'Depot Weighted Average']
-        file.write(",".join(columns) + "\n")
-
-        for depot_id in all_depots.keys():
-            rows = [all_depots[depot_id].name]
-            for vt_id in all_vehicletypes.keys():
-                avg_cap_fade = avg_cap_fade_dict.get((depot_id, vt_id), None)
-                rows.append(f'{avg_cap_fade:.3f}' if avg_cap_fade is not None else "---")
-            depot_avg_ = depot_avg[depot_id]
-
-            rows.append(f'{depot_avg_:.3f}')
-            file.write(",".join(rows) + "\n")
-
-        # zwischen oneweek und oneday unterscheiden
-        # todo: wieder auf oneweek anpassen!
-        avg_row = ["Vehicle Type Weighted Average"] + [f'{vehicle_type_avg[vt_id]:.3f}' for vt_id in
-                                                       vehicle_type_avg.keys()]
-        avg_row.append(f'{all_avg_cap_fade:.3f}')
-        file.write(",".join(avg_row) + "\n")
-
-    return
+    return stats
 
 
 
 ###GIVEN CODE:
 def list_scenarios(database_url: str):
+    from eflips.model import Rotation, Scenario
+
     engine = create_engine(database_url, echo=False)
     with Session(engine) as session:
         scenarios = session.query(Scenario).all()
@@ -212,7 +129,8 @@ def list_scenarios(database_url: str):
             print(f"{scenario.id}: {scenario.name} with {rotation_count} rotations.")
 ###
 
-if __name__ == "__main__":
+
+def build_parser():
     ###GIVEN CODE:      (pick scenario)
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -235,155 +153,208 @@ if __name__ == "__main__":
         required=False,
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        "--fold_weeks",
+        "--fold-weeks",
+        action="store_true",
+        help="Advance each vehicle by a whole year in one closed-form step instead of replaying the identical week 52 times.",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=("python", "numpy", "numba"),  # BACKENDS of yurena_degradation
+        default="numpy",
+        help="Backend for the degeneration loop. numba is optional, without it the numpy backend is used.",
+    )
+    parser.add_argument(
+        "--temperature_profile",
+        "--temperature-profile",
+        type=str,
+        help="CSV file with a header row and the temperature of each of the 52 weeks of a year in its last column. If it is not specified, a constant temperature of 300.15 K is used.",
+        required=False,
+    )
+    parser.add_argument(
+        "--temperature_celsius",
+        "--temperature-celsius",
+        action="store_true",
+        help="The temperatures in the temperature profile are given in °C instead of K.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of worker processes for the degeneration simulation. If it is not specified, the simulation runs in this process.",
+        required=False,
+    )
+    parser.add_argument(
+        "--shard_by",
+        "--shard-by",
+        choices=["depot", "block"],
+        default="depot",
+        help="How the fleet is split between the worker processes: one shard per depot or blocks of --block-size vehicles.",
+    )
+    parser.add_argument(
+        "--block_size",
+        "--block-size",
+        type=int,
+        default=256,
+        help="Number of vehicles per shard when using --shard-by block.",
+    )
+    parser.add_argument(
+        "--monte_carlo",
+        "--monte-carlo",
+        type=int,
+        help="Number of sampled parameter sets for the Monte Carlo uncertainty analysis. If it is not specified, no analysis is done.",
+        required=False,
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="Seed for sampling the parameter sets of the Monte Carlo analysis.",
+        required=False,
+    )
+    parser.add_argument(
+        "--mc_rel_std",
+        "--mc-rel-std",
+        type=float,
+        default=0.05,
+        help="Relative standard deviation of the model constants and the activation energy in the Monte Carlo analysis.",
+    )
+    parser.add_argument(
+        "--mc_temperature_std",
+        "--mc-temperature-std",
+        type=float,
+        default=2.0,
+        help="Standard deviation in K of the temperature offset in the Monte Carlo analysis, it is added to the temperature of every week (300.15 K or the temperature profile).",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        "--cache-dir",
+        type=str,
+        default=os.path.join(os.getcwd(), "scenario_cache"),
+        help="Folder for the cached snapshots of the data extracted from the database.",
+    )
+    parser.add_argument(
+        "--cache_size_mb",
+        "--cache-size-mb",
+        type=int,
+        default=2048,
+        help="Maximum size of the snapshot cache in MB, the least recently used snapshots are deleted beyond it.",
+    )
+    parser.add_argument(
+        "--no_cache",
+        "--no-cache",
+        action="store_true",
+        help="Always extract the data from the database and do not use the snapshot cache.",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Use the newest cached snapshot of the scenario without connecting to the database.",
+    )
+    parser.add_argument(
+        "--no_tables",
+        "--no-tables",
+        action="store_true",
+        help="Only write the long-format results (sc_id<scenario_id>_cap_fade_long.csv), not the wide CSV tables rendered from them.",
+    )
+    parser.add_argument(
+        "--no_plots",
+        "--no-plots",
+        action="store_true",
+        help="Do not render the SoH progression plots, matplotlib is not loaded at all.",
+    )
+    parser.add_argument(
+        "--plot_workers",
+        "--plot-workers",
+        type=int,
+        help="Number of worker processes for rendering the plots. Defaults to the number of CPUs, with 1 the plots are rendered in this process.",
+        required=False,
+    )
+    parser.add_argument(
+        "--drop_eol",
+        "--drop-eol",
+        action="store_true",
+        help="Stop simulating vehicles once they reach their EoL. Once all vehicles did, the remaining years are not simulated and keep the state of that year. With --fold-weeks a vehicle stops at the end of its EoL week instead of at the charging event that reached the EoL.",
+    )
+    parser.add_argument(
+        "--years",
+        type=int,
+        default=12,
+        help="Number of years to be simulated. Years stored in the checkpoints of an earlier run are not simulated again.",
+    )
+    parser.add_argument(
+        "--checkpoint_dir",
+        "--checkpoint-dir",
+        type=str,
+        help="Folder for the yearly checkpoints of the simulation. Defaults to sc_id<scenario_id>_checkpoints in the working directory.",
+        required=False,
+    )
+    parser.add_argument(
+        "--no_checkpoints",
+        "--no-checkpoints",
+        action="store_true",
+        help="Simulate all years from the beginning and do not write checkpoints.",
+    )
 
-    if args.database_url is None:
-        if "DATABASE_URL" not in os.environ:
-            raise ValueError(
-                "The database url must be specified either as an argument or as the environment variable DATABASE_URL."
-            )
-        args.database_url = os.environ["DATABASE_URL"]
+    return parser
+
+
+def run_degradation(args, engine=None, model=None):
+    """
+    Simulates the capacity fade of all vehicles of the scenario and exports the results for the steady state.
+
+    :param engine: engine of the database, created from args.database_url if it is None
+    :param model: ScenarioModel of the scenario, loaded from the snapshot cache or the database if it is None
+    :return: folder of the exported results
+    """
+    import numpy as np
+
+    from yurena_aggregation import FleetGroups
+    from yurena_cache import SnapshotCache
+    from yurena_checkpoint import STATE_COLUMNS, CheckpointStore, simulation_key
+    from yurena_degradation import (
+        T_DEFAULT,
+        WEEKS_PER_YEAR,
+        advance_weeks,
+        calc_cap_fade_batch,
+        calc_weekly_factors,
+        load_temperature_profile,
+    )
+    from yurena_events import EventIndex
+    from yurena_fleet import FleetState
+    from yurena_model import ScenarioModel
+    from yurena_store import results_folder, write_results
+    from yurena_tables import LongResultsWriter, render_tables
+
+    #the pipeline passes its shared engine and scenario model, see yurena_pipeline
+    if engine is None and args.database_url is not None:
+        engine = create_engine(args.database_url, echo=False)
+    with Session(engine) as session:
+        scenario_id = args.scenario_id
 
-    if args.list_scenarios:
-        list_scenarios(args.database_url)
-        exit()
+        #the data extracted from the database is cached on disk, keyed by a cheap fingerprint of the database
+        #in offline mode the newest snapshot is used without touching the database at all
+        cache = None if args.no_cache else SnapshotCache(args.cache_dir, max_bytes=args.cache_size_mb * 1024**2)
+        if model is None:
+            model = ScenarioModel.load(session, scenario_id, cache, args.offline)
+        snapshot = model.snapshot
 
-    if args.scenario_id is None:
-        raise ValueError(
-            "The scenario id must be specified. Use --list-scenarios to see all available scenarios, then run with "
-            "--scenario-id <id>."
-        )
-    ###
+        #all_vehicletypes and all_depots: dictionaries for easy access, keys are the ids
+        all_vehicletypes, all_depots, all_vehicles = model.vehicle_types, model.depots, model.vehicles
+        depot_of_vehicle = model.depot_of_vehicle
 
-    engine = create_engine(args.database_url, echo=False)
-    with Session(engine) as session:
-        scenario = session.query(Scenario).filter(Scenario.id == args.scenario_id).one()
-        assert isinstance(scenario, Scenario)
-
-        #collect all classes_needed from Dataframe into dictionaries for easy access:
-        classes_needed = ['VehicleType', 'Depot', 'Trip', 'Route']
-        for c in classes_needed:
-            class_type = globals().get(c)   #converts String
-            query_result = session.query(class_type).filter(scenario.id == class_type.scenario_id).all()
-            globals()[f"all_{c.lower()}s"] = {x.id: x for x in query_result}      #e.g. dictionary is called all_vehicletypes, keys are vehicletype ids
-
-        # create helpful dict that references depots by station id instead of depot id:
-        depot_station_ids = {depot.station_id: depot for depot in all_depots.values()}
-
-        #The code interacts with Events and Vehicles in a more complex way, so they get handled separately
-        #collect all DRIVING and CHARGING events:
-        all_driving_events = session.query(Event).filter(Event.scenario_id == scenario.id).filter(Event.event_type == EventType.DRIVING).all()
-        all_charging_events = session.query(Event).filter(Event.scenario_id == scenario.id, or_(Event.event_type == EventType.CHARGING_DEPOT, Event.event_type == EventType.CHARGING_OPPORTUNITY)).all()
-
-        #print(len(all_driving_events))
-        #print(len(all_charging_events))
-
-        #redundant, da Dict danach und davor gleich lang sind
-        #all_charging_events = filter_uniques(all_charging_events)
-        #all_driving_events = filter_uniques(all_driving_events)
-
-        #print(all_driving_events)
-        #print(all_charging_events)
-
-        #sort driving and charging events by vehicle
-        #saves the lists in a dictionary with vehicle_ids as keys:
-        driving_events_by_vehicle = defaultdict(list)
-        for event in all_driving_events:
-            #makes sure there are no duplicates:
-            driving_events_by_vehicle[event.vehicle_id].append(event)
-        charging_events_by_vehicle = defaultdict(list)
-        for event in all_charging_events:
-            charging_events_by_vehicle[event.vehicle_id].append(event)
-
-        #print(charging_events_by_vehicle[920479])
-        #print(driving_events_by_vehicle[920479])
-        #print(len(charging_events_by_vehicle[920479]))
-
-        #remove redundant charging events between weeks to not count them both
-        for veh_id, charging_events in charging_events_by_vehicle.items():
-            if charging_events:  #check if the list is non-empty to avoid errors
-                charging_events.pop()     ##remove last charging event from each list to delete redundancies
-
-        #print(len(charging_events_by_vehicle[920479]))
-
-        #collect all vehicles from Dataframe:
-        all_vehicles = session.query(Vehicle).filter(Vehicle.scenario_id == scenario.id).all()
-
-        #Vehicles will be saved as new objects to modify parameters. All vehicles saved as dict and list for accessibility
-        #since we are altering the objects our list/dict are referencing directly, they can be used interchangeably!
-        all_vehicles_d = {}
-        all_vehicles_l = []
-        vehicles_of_depot = defaultdict(list)   #dict to sort vehicles into lists for each depot
-        vehicles_of_vehicletype = defaultdict(list)  ##dict to sort vehicles into lists for each vehicle type
-
-        #create Vehicle objects, assign events, assign depots:
-        #things are all done in one loop for efficiency
-
-        for v in all_vehicles:
-            vehicle = Vehicle_new(v)
-            #assign driving and charging events from dict:
-            vehicle.driving_events = driving_events_by_vehicle.get(v.id, [])       #needed for depot assignment
-            vehicle.charging_events = charging_events_by_vehicle.get(v.id, [])
-
-            #check if every vehicle has a list of events!!!!!!
-            has_charging_events = bool(vehicle.charging_events)
-            if not vehicle.charging_events:
-                print(f"Warning: Vehicle ID {vehicle.id} has no charging events.")
-
-            #assign vehicles to their depot, dataset only assigns one depot to each vehicle (this was double-checked as well)
-            for event in vehicle.driving_events:
-                r = all_routes[all_trips[event.trip_id].route_id]   #accesses route of event through trip id
-                #checks if route has a start/destination that is a depot, if so depot is assigned and loop can be broken
-                if r.departure_station_id in depot_station_ids.keys():
-                    vehicle.depot = depot_station_ids[r.departure_station_id]  #assigned to attribute depot
-                    break
-                elif r.arrival_station_id in depot_station_ids.keys():
-                    vehicle.depot = depot_station_ids[r.arrival_station_id]
-                    break
-
-            #save in dict and list
-            all_vehicles_d[v.id] = vehicle
-            all_vehicles_l.append(vehicle)
-
-            #group vehicles by depot for visualization thelater
-            if vehicle.depot:
-                vehicles_of_depot[vehicle.depot.id].append(vehicle)
-            else:
-                print(f"Warning: Vehicle {vehicle.id} has no assigned depot.")
-
-            # group vehicles by vehicle_type:
-            vehicles_of_vehicletype[vehicle.vehicle_type.id].append(vehicle)
-
-        #for i in range(5):
-        #    print(all_vehicles_l[i].driving_events)
-        #    print(all_vehicles_l[i].charging_events)
-        #    print(all_vehicles_l[i].depot)
-
-        #print(len(all_vehicles_d), len(all_vehicles_l))
-        #print(len(vehicles_of_vehicletype[12]))
-        #print(len(vehicles_of_vehicletype[13]))
-        #print(len(vehicles_of_vehicletype[14]))
-
-        #check for doubled assignments, auch redundant, Länger verändert sich nicht
-        for vt_id in vehicles_of_vehicletype.keys():
-            vehicles_of_vehicletype[vt_id] = filter_uniques(vehicles_of_vehicletype[vt_id])
-        for depot_id in vehicles_of_depot.keys():
-            vehicles_of_depot[depot_id] = filter_uniques(vehicles_of_depot[depot_id])
-
-
-        """
-        #prints number of vehicles of each vehicletype in depot
-        for depot_id in vehicles_of_depot.keys():
-            v_d = vehicles_of_depot[depot_id]
-            for vt_id in all_vehicletypes.keys():
-                num_vt_in_depot = len([v for v in v_d if v.vehicle_type_id == vt_id])
-                print(f"{num_vt_in_depot} Vehicles of VT {all_vehicletypes[vt_id].name} in {all_depots[depot_id].name}")
-        """
-
-
-        #choose years to be simulated --> todo: turn into argument for running code, like scenario_id
+        #choose years to be simulated with --years
         # todo: check if years/age are always implemented correctly in the code
-        years = 12
+        years = args.years
+
+        #the state of all vehicles is kept in the columns of a FleetState, depots get assigned from depot_of_vehicle
+        #dataset only assigns one depot to each vehicle (this was double-checked as well)
+        fleet = FleetState.from_records(all_vehicles, all_vehicletypes, all_depots, depot_of_vehicle, years)
+
+        #vehicles without depot are left out of the depot averages
+        for vehicle_id in fleet.id[fleet.depot_id < 0].tolist():
+            print(f"Warning: Vehicle {vehicle_id} has no assigned depot.")
+
+
         #note: the age of a vehicle during the year is always year-1 (analogous to birthdays)!
         #to iterate through array
         depot_indizes = {depot_id: i for i, depot_id in enumerate(all_depots.keys())}
@@ -398,128 +369,188 @@ if __name__ == "__main__":
         #index position can be interpreted as vehicle age during that year
         results_array[:, :, 0] = 0  #capacity fade is 0 initially
         result_dict = {}  # saves entries three-dimensionally with depot id, vt_id and year as keys
+        #depot and vehicle type index of every vehicle for the yearly averages
+        groups = FleetGroups.from_ids(fleet.depot_id, fleet.vehicle_type_id, depot_indizes, vehicle_type_indizes)
 
-        folder_path = os.path.join(os.getcwd(), f'sc_id{scenario.id}_capfade_distributions_per_year')
+        folder_path = os.path.join(os.getcwd(), f'sc_id{scenario_id}_capfade_distributions_per_year')
         if not os.path.exists(folder_path):
             os.makedirs(folder_path)
 
-        #simulate capacity fade for 12 years, starting at year 1 where the SoH gets altered first!
-        for year in range(1, years+1):
-            age = year-1
-
-            #calculates yearly degeneration for all vehicles
-            calc_yearly_degen(all_vehicles_l)
-            #todo: create bool if you want distribution printed
-            avg_cap_fade_dict, depot_avg, vehicle_type_avg = create_cap_fade_array(all_vehicles_l, year, result_dict, results_array)
-            create_cap_fade_table(all_vehicles_l, avg_cap_fade_dict, depot_avg, vehicle_type_avg, year)
-
-        #for i in all_vehicles_l[:10]:
-        #    print(i.yearly_cap_fade)
+        #convert the charging events once, the simulation loop only reads from this index
+        event_index = EventIndex.from_sorted_arrays(fleet.id,
+                                                    snapshot["event_vehicle_id"], snapshot["event_id"],
+                                                    snapshot["event_soc_start"], snapshot["event_soc_end"])
+
+        #check if every vehicle has charging events!!!!!!
+        for vehicle_id in fleet.id[event_index.event_counts() == 0].tolist():
+            print(f"Warning: Vehicle ID {vehicle_id} has no charging events.")
+        #battery capacities before the first year, the fleet columns get updated during the simulation
+        initial_capacity = fleet.battery_capacity.copy()
+
+        #seasonal temperatures, one per week of the year
+        weekly_T = None
+        if args.temperature_profile is not None:
+            weekly_T = load_temperature_profile(args.temperature_profile, celsius=args.temperature_celsius)
+
+        #the events are the same every week, so the weekly factors only have to be calculated once
+        weekly_factors = None
+        if args.fold_weeks:
+            weekly_factors = calc_weekly_factors(event_index.soc_start, event_index.soc_end,
+                                                 event_index.vehicle_index, event_index.n_vehicles, weekly_T=weekly_T)
+
+        #averages and percentiles of the capacity fade of all depot and vehicle type groups, one record per group and year
+        #the wide tables are rendered from this file after the simulation
+        long_results_path = os.path.join(os.getcwd(), f"sc_id{scenario_id}_cap_fade_long.csv")
+        #the file is closed when the simulation ends, also if it fails
+        with LongResultsWriter(long_results_path, depot_indizes, vehicle_type_indizes) as results_writer:
+            results_writer.write_year(0, groups, fleet.cap_fade)
+
+            #every simulated year is written into a checkpoint, years that are already stored for the same inputs get restored
+            #instead of simulated again, so a crashed run resumes and a longer horizon extends the earlier run
+            checkpoints = None
+            start_year = 0
+            if not args.no_checkpoints:
+                #the results_row of a checkpoint is restored per depot x vehicle type, so the assignment of the vehicles and
+                #the order of the depots and vehicle types are part of the key as well
+                checkpoint_key = simulation_key([event_index.offsets, event_index.soc_start, event_index.soc_end, fleet.battery_capacity,
+                                      fleet.full_capacity, weekly_T if weekly_T is not None else T_DEFAULT,
+                                      fleet.id, fleet.depot_id, fleet.vehicle_type_id,
+                                      np.array(list(depot_indizes), dtype=np.int64),
+                                      np.array(list(vehicle_type_indizes), dtype=np.int64)],
+                                     {"fold_weeks": args.fold_weeks, "backend": args.backend, "drop_eol": args.drop_eol})
+                checkpoints = CheckpointStore(args.checkpoint_dir or os.path.join(os.getcwd(), f"sc_id{scenario_id}_checkpoints"),
+                                              checkpoint_key)
+                for year, checkpoint in enumerate(checkpoints.load(years), start=1):
+                    set_yearly_state(fleet, *(checkpoint[key] for key in STATE_COLUMNS))
+                    results_array[:, :, year] = checkpoint["results_row"]
+                    for depot_id, depot_index in depot_indizes.items():
+                        for vt_id, vt_index in vehicle_type_indizes.items():
+                            if not np.isnan(results_array[depot_index, vt_index, year]):
+                                result_dict[(depot_id, vt_id, year)] = results_array[depot_index, vt_index, year]
+                    results_writer.write_year(year, groups, fleet.cap_fade)
+                    start_year = year
+                if start_year:
+                    print(f"Restored {start_year} simulated years from {checkpoints.folder}.")
+
+            #with several workers, all remaining years are simulated in parallel first and then applied year by year
+            trajectories = None
+            if args.workers is not None and start_year < years:
+                from yurena_parallel import shard_by_block, shard_by_key, simulate_years_parallel
+
+                if args.shard_by == "depot":
+                    shards = shard_by_key(fleet.depot_id)
+                else:
+                    shards = shard_by_block(len(fleet), args.block_size)
+                trajectories = simulate_years_parallel(event_index, fleet.battery_capacity,
+                                                       fleet.full_capacity,
+                                                       years - start_year, shards, workers=args.workers,
+                                                       fold_weeks=args.fold_weeks, backend=args.backend, weekly_T=weekly_T,
+                                                       initial_state={key: getattr(fleet, key) for key in STATE_COLUMNS[1:]},
+                                                       drop_eol=args.drop_eol, week_offset=start_year * WEEKS_PER_YEAR)
+
+            #simulate capacity fade for the remaining years, starting at year 1 where the SoH gets altered first!
+            frozen = False
+            for year in range(start_year+1, years+1):
+                age = year-1
+
+                #calculates yearly degeneration for all vehicles
+                if trajectories is not None:
+                    set_yearly_state(fleet, *(trajectories[key][year - start_year] for key in STATE_COLUMNS))
+                elif frozen:
+                    #all vehicles are at their EoL, the state stays the same and only the age increases
+                    fleet.record_year()
+                else:
+                    calc_yearly_degen(fleet, event_index, weekly_factors=weekly_factors, backend=args.backend,
+                                      weekly_T=weekly_T, drop_eol=args.drop_eol)
+                #todo: create bool if you want distribution printed
+                create_cap_fade_array(fleet, year, result_dict, results_array, groups, depot_indizes,
+                                              vehicle_type_indizes)
+                results_writer.write_year(year, groups, fleet.cap_fade)
+                if checkpoints is not None:
+                    checkpoints.save(year, fleet, results_array[:, :, year])
+
+                #with --drop-eol the state of vehicles at their EoL does not change anymore, once every vehicle that can age
+                #(has charging events) reached its EoL, the remaining years are not simulated but get the frozen state,
+                #so the results still cover all years
+                if (args.drop_eol and not frozen and trajectories is None
+                        and np.all(fleet.needs_replacement | (event_index.event_counts() == 0))):
+                    if year < years:
+                        print(f"All vehicles reached their EoL after {year} years, the remaining years are not simulated.")
+                    frozen = True
 
         #Todo: nochmal checken, ob Einträge mit Vehicles in Depots übereinstimmen
-        #print(results_array[9::])
 
         #visualize SoH progression of each vehicletype for each depot through the years
-        output_folder = os.path.join(os.getcwd(), f"sc_id{scenario.id}_avg_soh_progression")
+        output_folder = os.path.join(os.getcwd(), f"sc_id{scenario_id}_avg_soh_progression")
         if not os.path.exists(output_folder):
             os.makedirs(output_folder)
 
-        for vt_id, vt_index in vehicle_type_indizes.items():
-            vt_name = all_vehicletypes[vt_id].name
-
-            plt.figure(figsize=(15, 8))
-            #Titel nicht für schriftliche Ausarbeitung
-            #plt.title(f"Average Capacity Fade Progression for {vt_name}", fontsize=25)
-            plt.title(f"Average SoH Progression for {vt_name}")
-            plt.xlabel("Vehicle Age [years]", fontsize = 23)
-            plt.ylabel("State of Health [/]", fontsize = 23)
-            plt.ylim(bottom=0)
-            plt.xlim(left=-0.1, right=12)
-            plt.grid(True)
-
-            plt.tick_params(axis='both', which='major', labelsize=21)
+        #one figure per vehicle type, rendered in worker processes and only if its data changed since the last run
+        if not args.no_plots:
+            from yurena_plots import render_figures
 
+            figures = []
             x_values = list(range(0, years+1))
-
-            for depot_id, depot_index in depot_indizes.items():
-                depot_name = all_depots[depot_id].name_short
-                #todo: anderen Depots auch Spitznamen geben!
-                if depot_name is None:
-                    if all_depots[depot_id].name == "Depot at Betriebshof Köpenicker Landstraße":
-                        depot_name = "BF KL"
-                    elif all_depots[depot_id].name == "Depot at Betriebshof Rummelsburger Landstraße":
-                        depot_name = "BF RL"
-                    elif all_depots[depot_id].name == "Depot at Betriebshof Säntisstraße":
-                        depot_name = "BF SÄ"
-                y_values = 1 - results_array[depot_index, vt_index, :]
-
-                if not np.isnan(y_values).all():  # Only plot if there is valid data
-                    plt.plot(x_values, y_values, label=f"{depot_name}")
-
-            #also plot the overall soh progression!
-            #
-            y_values_all_0 = []
-            y_values_all = []
-            for year in range(0, years+1):
+            for vt_id, vt_index in vehicle_type_indizes.items():
+                vt_name = all_vehicletypes[vt_id].name
+
+                depot_lines = []
+                for depot_id, depot_index in depot_indizes.items():
+                    depot_name = all_depots[depot_id].name_short
+                    #todo: anderen Depots auch Spitznamen geben!
+                    if depot_name is None:
+                        if all_depots[depot_id].name == "Depot at Betriebshof Köpenicker Landstraße":
+                            depot_name = "BF KL"
+                        elif all_depots[depot_id].name == "Depot at Betriebshof Rummelsburger Landstraße":
+                            depot_name = "BF RL"
+                        elif all_depots[depot_id].name == "Depot at Betriebshof Säntisstraße":
+                            depot_name = "BF SÄ"
+                    y_values = 1 - results_array[depot_index, vt_index, :]
+
+                    if not np.isnan(y_values).all():  # Only plot if there is valid data
+                        depot_lines.append((depot_name, y_values))
+
+                #also plot the overall soh progression!
+                #
                 #avg_soh_0 hat keine soh < 0!! (Fahrzeuge scheiden aus)
-                avg_soh =  np.mean([1 - veh.yearly_cap_fade[year] for veh in vehicles_of_vehicletype[vt_id]])
-                y_values_all.append(avg_soh)
-
-            plt.plot(x_values, y_values_all, label = "All Depots", color = "black", linewidth = 3.5)
-
-
-            filename = os.path.join(output_folder, vt_name + ".png")
-            plt.legend(title = "Depot:", loc = 'center left', fontsize="20", bbox_to_anchor=(1, 0.5), title_fontsize=19)
-            plt.tight_layout(rect=[0, 0, 0.8, 1])
-            plt.savefig(filename, bbox_inches="tight")
-            plt.close()
+                y_values_all = np.mean(1 - fleet.cap_fade_trajectory[fleet.vehicle_type_id == vt_id], axis=0)
+
+                figures.append(("soh_progression", vt_name + ".png", {
+                    "title": f"Average SoH Progression for {vt_name}",
+                    "years": years,
+                    "x_values": x_values,
+                    "depot_lines": depot_lines,
+                    "all_depots": y_values_all,
+                }))
+            rendered = render_figures(output_folder, figures, workers=args.plot_workers)
+            print(f"Rendered {rendered} of {len(figures)} SoH progression plots, the others did not change.")
 
         print(results_array)
 
 
-        max_ages = np.full((len(all_depots), len(all_vehicletypes)), None)
+        #max age of each depot x vehicle type group: the age at which the average SoH dips below zero, the vehicles do
+        #not reach the next age. Groups that stay above zero (or have no vehicles) get the number of simulated years
+        below_zero = 1 - results_array[:, :, :years] < 0
+        max_ages = np.where(below_zero.any(axis=2), below_zero.argmax(axis=2), years)
 
-        for depot_id, depot_index in depot_indizes.items():
-            depot_name_short = all_depots[depot_id].name_short
+        #wide tables (capacity fade per year, SoH progression per depot) as views of the long-format results
+        if not args.no_tables:
             #for depots without nickname, take full depot name!
-            if depot_name_short is None:
-                depot_name_short = all_depots[depot_id].name
-
-            #todo: lieber eigener Unterordner, weniger chaotisch
-            filename = os.path.join(output_folder , f"{depot_name_short}_avg_soh_progression_table.csv")
-
-            with open(filename, "w") as file:
-                #Header: Vehicle types as rows and years as columns
-                file.write(f"Average SoH for {depot_name_short} Over {years} Years\n" )
-                columns = ['Vehicle Type'] + [f"Age {year-1}" for year in range(1,years+1)] + ["Lifespan"]
-                file.write(",".join(columns) + "\n")
-
-                for vt_id, vt_index in vehicle_type_indizes.items():
-                    row = [all_vehicletypes[vt_id].name]
-
-                    for age in range(0, years+1):
-                        #set maximum age to 12 years
-                        if age >= years:
-                            row.append("0")
-                            max_ages[depot_index, vt_index] = years
-                            break
-
-                        cap_fade = results_array[depot_index, vt_index, age]
-                        if not np.isnan(cap_fade):
-                            entry = 1 - cap_fade
-                            # if SoH dips elow zero, vehicle does not reach the next age. current age gets set as max_age
-                            if entry < 0:
-                                max_ages[depot_index, vt_index] = age
-                                break
-                            # show SoH progression while SoH is above zero
-                            else:
-                                row.append(f"{entry:.3f}")
-                        #fill rows with blank entries when there are no vehicles assigned
-                        else:
-                            row.append('---')
-
-                    file.write(",".join(row) + "\n")
-
+            render_tables(long_results_path, {depot_id: depot.name for depot_id, depot in all_depots.items()},
+                          {depot_id: depot.name_short or depot.name for depot_id, depot in all_depots.items()},
+                          {vt_id: vt.name for vt_id, vt in all_vehicletypes.items()}, years, folder_path, output_folder)
+
+        #average number of weeks until the EoL of the vehicles of each depot x vehicle type group that reached it
+        #within the simulated years, NaN if none did
+        reached_eol = fleet.eol_week >= 0
+        lifespan_weeks = groups.aggregate(fleet.eol_week + 1, weights=reached_eol)["pair_mean"]
+
+        #with --drop-eol the vehicles do not age after their EoL, so the average SoH of a group stays above zero until
+        #its last vehicle is replaced. The max age is taken from the EoL weeks then: the number of years until the
+        #average EoL, rounded up, so an EoL in the last week of a year gives the age at the end of that year
+        if args.drop_eol:
+            has_lifespan = ~np.isnan(lifespan_weeks)
+            max_ages[has_lifespan] = np.clip(np.ceil(lifespan_weeks[has_lifespan] / WEEKS_PER_YEAR), 1, years)
 
         #Ergebnisse des EoL-Alters:
         for depot_index in range(max_ages.shape[0]):
@@ -531,29 +562,63 @@ if __name__ == "__main__":
                 vt_id = [key for key, idx in vehicle_type_indizes.items() if idx == vt_index][0]
 
                 # Ausgabe
-                print(f"Depot: {depot_id}, Fahrzeugtyp: {vt_id}, Alter: {value}")
-
-        #todo: check if all spots with None correspond with no vehicle of vt in that depot!!!
+                # Lebensdauer aus den EoL-Wochen der Fahrzeuge, genauer als das Alter in ganzen Jahren
+                lifespan = lifespan_weeks[depot_index, vt_index] / WEEKS_PER_YEAR
+                print(f"Depot: {depot_id}, Fahrzeugtyp: {vt_id}, Alter: {value}, Lebensdauer: {lifespan:.2f} Jahre")
+
+
+        #confidence bands of the SoH progression, same depot and vehicle type indizes as results_array
+        arrays = {}
+        metadata = {}
+        if args.monte_carlo:
+            from yurena_montecarlo import run_monte_carlo, sample_parameters
+
+            percentiles = (5, 50, 95)
+            #the temperatures are sampled around the ones of the main simulation (constant or --temperature-profile)
+            parameters = sample_parameters(args.monte_carlo, rel_std=args.mc_rel_std, T_std=args.mc_temperature_std,
+                                           seed=args.seed)
+            soh_percentiles, _ = run_monte_carlo(event_index, initial_capacity,
+                                                 fleet.full_capacity,
+                                                 groups.pair_index, len(depot_indizes) * len(vehicle_type_indizes), years,
+                                                 parameters, percentiles, weekly_T=weekly_T, drop_eol=args.drop_eol)
+            #shape: percentiles x depots x vehicle types x years
+            arrays["soh_percentiles"] = soh_percentiles.reshape(len(percentiles), len(depot_indizes),
+                                                                len(vehicle_type_indizes), years+1).astype(np.float32)
+            metadata["percentiles"] = list(percentiles)
+
+        #export relevant data for our steady state scenario, see yurena_store for the arrays
+        arrays["soh_progression"] = (1 - results_array).astype(np.float32)
+        arrays["vehicle_soh"] = fleet.soh_trajectory.astype(np.float32)
+        arrays["lifespans"] = max_ages.astype(np.int16)
+        #to redo vehicle assignment to depot, vehicle_id: depot_id
+        arrays["vehicle_depot"] = fleet.depot_id.astype(np.int32)
+        arrays["eol_week"] = fleet.eol_week.astype(np.int32)
+        arrays["lifespan_weeks"] = lifespan_weeks.astype(np.float32)
+        write_results(results_folder(scenario_id), arrays, list(depot_indizes), list(vehicle_type_indizes),
+                      fleet.id, years, metadata)
+
+        return results_folder(scenario_id)
 
-        #export relevant data for our steady state scenarion
-        np.save("soh_progression.npy", results_array)
-        np.save("max_ages.npy", max_ages)
 
-        #todo: export does not seem to work
-        #to redo vehicle assignment to depot, create dict with vehicle_id: depot_id
-        veh_to_depot = {}
-        for v_id, veh in all_vehicles_d.items():
-            #convert to ints to separate from attributes of database for easy export
-            veh_to_depot[int(v_id)] = int(veh.depot.id)
+if __name__ == "__main__":
+    args = build_parser().parse_args()
 
-        with open('veh_to_depot.json', 'w') as file:
-            json.dump(veh_to_depot, file)
+    if args.database_url is None and not args.offline:
+        if "DATABASE_URL" not in os.environ:
+            raise ValueError(
+                "The database url must be specified either as an argument or as the environment variable DATABASE_URL."
+            )
+        args.database_url = os.environ["DATABASE_URL"]
 
+    if args.list_scenarios:
+        list_scenarios(args.database_url)
         exit()
 
+    if args.scenario_id is None:
+        raise ValueError(
+            "The scenario id must be specified. Use --list-scenarios to see all available scenarios, then run with "
+            "--scenario-id <id>."
+        )
+    ###
 
-
-
-
-
-
+    run_degradation(args)
@@ -0,0 +1,165 @@
+"""
+State of the simulated fleet as struct of arrays.
+
+FleetState keeps every attribute of the vehicles as one contiguous NumPy column, so the kernels of yurena_degradation
+update the whole fleet in place. The SoH and capacity fade at the beginning of each year are written into matrices
+(vehicles x years + 1) that are allocated once for the whole horizon. VehicleView gives access to one vehicle with the
+attributes of the former vehicle objects, for code that works on single vehicles.
+"""
+
+import numpy as np
+
+
+def kwh_to_ah(capacity):
+    """Converts a battery capacity from kWh to Ah (3.2 V per cell, 200 cells)."""
+    return (capacity * 1000) / (3.2 * 200)
+
+
+class FleetState:
+    """Columns with the state of every vehicle, the position of a vehicle is its index in all columns."""
+
+    def __init__(
+        self,
+        vehicle_ids,
+        vehicle_type_ids,
+        depot_ids,
+        battery_capacity,
+        full_capacity,
+        years,
+        vehicle_types=None,
+        depots=None,
+    ):
+        """
+        :param vehicle_ids: id of each vehicle
+        :param vehicle_type_ids: vehicle type id of each vehicle
+        :param depot_ids: depot id of each vehicle, -1 without depot
+        :param battery_capacity: usable battery capacity of each vehicle in Ah
+        :param full_capacity: battery capacity including the reserve of each vehicle in Ah
+        :param years: number of years the trajectories are allocated for
+        :param vehicle_types: dict with the vehicle type of each id, used by VehicleView
+        :param depots: dict with the depot of each id, used by VehicleView
+        """
+        self.id = np.array(vehicle_ids, dtype=np.int64)
+        self.vehicle_type_id = np.array(vehicle_type_ids, dtype=np.int64)
+        self.depot_id = np.array(depot_ids, dtype=np.int64)
+        self.battery_capacity = np.array(battery_capacity, dtype=np.float64)
+        self.full_capacity = np.array(full_capacity, dtype=np.float64)
+        self.vehicle_types = vehicle_types or {}
+        self.depots = depots or {}
+
+        n_vehicles = self.id.size
+        self.soh = np.ones(n_vehicles, dtype=np.float64)
+        self.cap_fade = np.zeros(n_vehicles, dtype=np.float64)
+        self.cap_fade_abs = np.zeros(n_vehicles, dtype=np.float64)
+        self.age = np.zeros(n_vehicles, dtype=np.int64)
+        self.needs_replacement = np.zeros(n_vehicles, dtype=bool)
+        # week (counted from the start of the simulation) in which the vehicle reached its EoL, -1 before
+        self.eol_week = np.full(n_vehicles, -1, dtype=np.int64)
+
+        # SoH and capacity fade at the beginning of each year, column = age
+        self.years = years
+        self.soh_trajectory = np.full((n_vehicles, years + 1), np.nan)
+        self.cap_fade_trajectory = np.full((n_vehicles, years + 1), np.nan)
+        self.soh_trajectory[:, 0] = self.soh
+        self.cap_fade_trajectory[:, 0] = self.cap_fade
+
+    @classmethod
+    def from_records(cls, vehicles, vehicle_types, depots, depot_of_vehicle, years):
+        """
+        Builds the fleet from vehicle and vehicle type records, see snapshot_records.
+
+        :param vehicles: vehicles with id and vehicle_type_id, in the order of the positions
+        :param vehicle_types: dict with the vehicle types (battery capacities in kWh) by id
+        :param depots: dict with the depots by id
+        :param depot_of_vehicle: dict with the depot id of each vehicle id, vehicles without depot are missing
+        :param years: number of years the trajectories are allocated for
+        """
+        capacity = {
+            vt_id: kwh_to_ah(vt.battery_capacity) for vt_id, vt in vehicle_types.items()
+        }
+        reserve = {
+            vt_id: kwh_to_ah(vt.battery_capacity_reserve)
+            for vt_id, vt in vehicle_types.items()
+        }
+        return cls(
+            [v.id for v in vehicles],
+            [v.vehicle_type_id for v in vehicles],
+            [depot_of_vehicle.get(v.id, -1) for v in vehicles],
+            [capacity[v.vehicle_type_id] for v in vehicles],
+            [
+                capacity[v.vehicle_type_id] + reserve[v.vehicle_type_id]
+                for v in vehicles
+            ],
+            years,
+            vehicle_types,
+            depots,
+        )
+
+    def __len__(self):
+        return self.id.size
+
+    def __getitem__(self, i):
+        return VehicleView(self, i)
+
+    def views(self):
+        """Returns a VehicleView for every vehicle, in the order of the positions."""
+        return [VehicleView(self, i) for i in range(len(self))]
+
+    def record_year(self):
+        """Increases the age of all vehicles after a simulated year and saves their SoH and capacity fade."""
+        self.age += 1
+        ages = self.age
+        if np.any(ages > self.years):
+            raise ValueError(
+                f"The trajectories are only allocated for {self.years} years."
+            )
+        positions = np.arange(len(self))
+        self.soh_trajectory[positions, ages] = self.soh
+        self.cap_fade_trajectory[positions, ages] = self.cap_fade
+
+
+def _column(name):
+    def getter(view):
+        return getattr(view.fleet, name)[view.position].item()
+
+    def setter(view, value):
+        getattr(view.fleet, name)[view.position] = value
+
+    return property(getter, setter)
+
+
+class VehicleView:
+    """One vehicle of a FleetState, reads and writes go directly to the columns."""
+
+    __slots__ = ("fleet", "position")
+
+    def __init__(self, fleet, position):
+        self.fleet = fleet
+        self.position = position
+
+    id = _column("id")
+    vehicle_type_id = _column("vehicle_type_id")
+    battery_capacity = _column("battery_capacity")
+    full_capacity = _column("full_capacity")
+    soh = _column("soh")
+    cap_fade = _column("cap_fade")
+    cap_fade_abs = _column("cap_fade_abs")
+    age = _column("age")
+    needs_replacement = _column("needs_replacement")
+    eol_week = _column("eol_week")
+
+    @property
+    def vehicle_type(self):
+        return self.fleet.vehicle_types.get(self.vehicle_type_id)
+
+    @property
+    def depot(self):
+        return self.fleet.depots.get(self.fleet.depot_id[self.position].item())
+
+    @property
+    def yearly_soh(self):
+        return self.fleet.soh_trajectory[self.position, : self.age + 1]
+
+    @property
+    def yearly_cap_fade(self):
+        return self.fleet.cap_fade_trajectory[self.position, : self.age + 1]
@@ -0,0 +1,69 @@
+"""
+In-memory model of one scenario, shared by the stages of the pipeline.
+
+The model is built from a snapshot (the arrays of extract_scenario_arrays), which is loaded from the SnapshotCache
+when the database did not change and extracted otherwise. The vehicle types, depots and vehicles are available as
+lightweight records (see snapshot_records), so the stages do not have to query them again.
+"""
+
+from yurena_cache import snapshot_records
+
+
+class ScenarioModel:
+    """Vehicle types, depots, vehicles and charging events of one scenario."""
+
+    def __init__(self, scenario_id, snapshot):
+        """
+        :param snapshot: dict of arrays, see extract_scenario_arrays
+        """
+        self.scenario_id = scenario_id
+        self.snapshot = snapshot
+        # dicts by id and list of vehicles, in the order of the snapshot
+        self.vehicle_types, self.depots, self.vehicles = snapshot_records(snapshot)
+        # depot id of each vehicle id, vehicles without depot are missing
+        self.depot_of_vehicle = {
+            int(vehicle_id): int(depot_id)
+            for vehicle_id, depot_id in zip(
+                snapshot["vehicle_id"], snapshot["vehicle_depot_id"]
+            )
+            if depot_id >= 0
+        }
+
+    @classmethod
+    def load(cls, session, scenario_id, cache=None, offline=False):
+        """
+        Loads the model of a scenario from the snapshot cache or the database.
+
+        :param session: open session, may be None with offline
+        :param cache: SnapshotCache, or None to always extract the data from the database
+        :param offline: use the newest cached snapshot of the scenario without touching the database
+        """
+        from yurena_queries import extract_scenario_arrays, query_fingerprint
+
+        fingerprint = None
+        snapshot = None
+        if offline:
+            if cache is not None:
+                snapshot = cache.load(scenario_id)
+            if snapshot is None:
+                raise ValueError(
+                    f"There is no cached snapshot of scenario {scenario_id} for --offline."
+                )
+        else:
+            from eflips.model import Scenario
+
+            scenario = session.query(Scenario).filter(Scenario.id == scenario_id).one()
+            assert isinstance(scenario, Scenario)
+            if cache is not None:
+                fingerprint = query_fingerprint(session, scenario_id)
+                snapshot = cache.load(scenario_id, fingerprint)
+
+        if snapshot is None:
+            # only the needed columns are extracted: the CHARGING events are sorted by vehicle and time, so the
+            # events of a vehicle are one contiguous range, and the last charging event of each vehicle is left out,
+            # so the redundant event between two weeks is not counted twice. The depot of each vehicle is found in
+            # the database through its DRIVING events
+            snapshot = extract_scenario_arrays(session, scenario_id)
+            if cache is not None:
+                cache.save(scenario_id, fingerprint, snapshot)
+        return cls(scenario_id, snapshot)
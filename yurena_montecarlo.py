@@ -0,0 +1,195 @@
+"""
+Monte Carlo uncertainty analysis for the parameters of the degeneration model.
+
+Instead of simulating the fleet once per parameter set, the parameter sets are stacked as an additional axis in front
+of the event arrays and evaluated in one broadcast computation. The years are advanced with the closed form of
+advance_weeks, so the cost per parameter set is one pass over the events per distinct weekly temperature plus one pass
+over the vehicles per year.
+
+The sampled temperatures are offsets to the temperatures of the main simulation, i.e. the constant temperature or the
+temperature profile, so the percentiles bracket the result of the main simulation with the same options.
+"""
+
+import numpy as np
+
+from yurena_degradation import (
+    E_A,
+    K_S,
+    R,
+    T_DEFAULT,
+    T_REF,
+    WEEKS_PER_YEAR,
+    check_temperature_profile,
+)
+
+
+def sample_parameters(n_samples, rel_std=0.05, T_std=2.0, seed=None):
+    """
+    Samples parameter sets of the degeneration model from normal distributions around the nominal values.
+
+    :param n_samples: number of parameter sets
+    :param rel_std: relative standard deviation of k_s and E_a
+    :param T_std: standard deviation of the temperature in K
+    :param seed: seed of the random number generator
+    :return: dict with k_s (n_samples x 4), E_a and dT (n_samples each). dT is the offset in K that is added to the
+        temperature of every week.
+    """
+    rng = np.random.default_rng(seed)
+    k_s = np.asarray(K_S) * (1 + rel_std * rng.standard_normal((n_samples, len(K_S))))
+    return {
+        "k_s": k_s,
+        "E_a": E_A * (1 + rel_std * rng.standard_normal(n_samples)),
+        "dT": T_std * rng.standard_normal(n_samples),
+    }
+
+
+def calc_sampled_fade_rates(soc_start, soc_end, k_s, E_a, T):
+    """
+    Calculates the rates of calc_fade_rates for several parameter sets at once.
+
+    :param k_s: array (samples x 4) with the model constants
+    :param E_a: array with the activation energy of each sample
+    :param T: array with the temperature of each sample
+    :return: array (samples x events)
+    """
+    soc_start = np.asarray(soc_start, dtype=np.float64)
+    soc_end = np.asarray(soc_end, dtype=np.float64)
+    soc_avg = (soc_start + soc_end) / 2
+    soc_dev = np.abs(soc_end - soc_start) / 2
+
+    k_s = np.asarray(k_s, dtype=np.float64)[:, :, np.newaxis]
+    arrhenius = np.exp(-(np.asarray(E_a) / R) * (1 / np.asarray(T) - 1 / T_REF))
+    return (
+        k_s[:, 0] * soc_dev * np.exp(k_s[:, 1] * soc_avg)
+        + k_s[:, 2] * np.exp(k_s[:, 3] * soc_dev)
+    ) * arrhenius[:, np.newaxis]
+
+
+def run_monte_carlo(
+    event_index,
+    battery_capacity,
+    full_capacity,
+    group_index,
+    n_groups,
+    years,
+    parameters,
+    percentiles=(5, 50, 95),
+    max_elements=2**23,
+    T=T_DEFAULT,
+    weekly_T=None,
+    drop_eol=False,
+):
+    """
+    Simulates the fleet for every sampled parameter set and calculates percentiles of the average SoH of each group.
+
+    The groups are the depot x vehicle type combinations of results_array, the average is taken over the capacity
+    fade like in create_cap_fade_array.
+
+    :param event_index: EventIndex of the fleet
+    :param group_index: group of each vehicle, vehicles with a negative group are ignored
+    :param n_groups: number of groups
+    :param years: number of years to simulate
+    :param parameters: parameter sets, see sample_parameters
+    :param percentiles: percentiles of the SoH to calculate
+    :param max_elements: limits the size of the intermediate arrays, the samples are processed in chunks accordingly
+    :param T: temperature in K that the sampled offsets are added to
+    :param weekly_T: array with the temperature of each week of a year in K, replaces T
+    :param drop_eol: vehicles are not aged any further after the week in which they reach their EoL, like with
+        drop_eol of advance_weeks
+    :return: tuple of the percentiles (percentiles x groups x years + 1) and the average SoH of every sample
+        (samples x groups x years + 1), both NaN for groups without vehicles
+    """
+    battery_capacity = np.asarray(battery_capacity, dtype=np.float64)
+    full_capacity = np.asarray(full_capacity, dtype=np.float64)
+    group_index = np.asarray(group_index, dtype=np.intp)
+    n_vehicles = event_index.n_vehicles
+    n_samples = len(parameters["dT"])
+
+    # matrix that turns the capacity fade of the vehicles into the average of each group
+    in_group = group_index >= 0
+    counts = np.bincount(group_index[in_group], minlength=n_groups)
+    group_means = np.zeros((n_vehicles, n_groups), dtype=np.float64)
+    group_means[np.flatnonzero(in_group), group_index[in_group]] = (
+        1 / counts[group_index[in_group]]
+    )
+
+    ah_factor = 2 * np.abs(event_index.soc_start - event_index.soc_end)
+    counts_per_vehicle = event_index.event_counts()
+    with_events = np.flatnonzero(counts_per_vehicle > 0)
+    year_numbers = np.arange(years + 1)
+    # share of the initial capacity at which the capacity fade reaches 1, see update_soh
+    eol_ratio = 1 - 0.2 * full_capacity / np.where(
+        battery_capacity > 0, battery_capacity, np.inf
+    )
+
+    # the rates only have to be calculated once for each distinct temperature of the weeks
+    if weekly_T is None:
+        weekly_T = np.full(WEEKS_PER_YEAR, T, dtype=np.float64)
+    check_temperature_profile(weekly_T)
+    week_temperatures, week_of_temperature = np.unique(
+        np.asarray(weekly_T, dtype=np.float64), return_inverse=True
+    )
+
+    avg_soh = np.empty((n_samples, n_groups, years + 1), dtype=np.float64)
+    chunk_size = max(
+        1,
+        max_elements
+        // max(
+            len(event_index),
+            (len(weekly_T) + years + 1) * n_vehicles,
+            1,
+        ),
+    )
+    for start in range(0, n_samples, chunk_size):
+        chunk = slice(start, min(start + chunk_size, n_samples))
+        n_chunk = chunk.stop - chunk.start
+
+        # weekly factors (samples x temperatures x vehicles), see calc_weekly_factors
+        factors_of_temperature = np.ones(
+            (n_chunk, len(week_temperatures), n_vehicles), dtype=np.float64
+        )
+        for i, week_T in enumerate(week_temperatures.tolist()):
+            rates = calc_sampled_fade_rates(
+                event_index.soc_start,
+                event_index.soc_end,
+                parameters["k_s"][chunk],
+                parameters["E_a"][chunk],
+                week_T + parameters["dT"][chunk],
+            )
+            if with_events.size:
+                factors_of_temperature[:, i, with_events] = np.multiply.reduceat(
+                    1 - rates * ah_factor, event_index.offsets[with_events], axis=1
+                )
+        # share of the capacity at the end of each week of a year (samples x weeks x vehicles)
+        week_ratio = np.cumprod(factors_of_temperature[:, week_of_temperature], axis=1)
+        year_factor = week_ratio[:, -1]
+
+        # share of the capacity at the beginning of each year (samples x years + 1 x vehicles), see advance_weeks
+        ratio = year_factor[:, np.newaxis, :] ** year_numbers[:, np.newaxis]
+        if drop_eol:
+            # the capacity stays at the end of the week in which the vehicle reached its EoL
+            crossed = ratio <= eol_ratio
+            reached = crossed.any(axis=1)
+            eol_year = crossed.argmax(axis=1)
+            ratio_of_week = (year_factor ** np.maximum(eol_year - 1, 0))[
+                :, np.newaxis, :
+            ] * week_ratio
+            below = ratio_of_week <= eol_ratio
+            # rounding can shift the crossing past the last week, the EoL is reached in the last week then
+            week = np.where(
+                below.any(axis=1), below.argmax(axis=1), week_ratio.shape[1] - 1
+            )
+            eol_ratio_reached = np.take_along_axis(
+                ratio_of_week, week[:, np.newaxis, :], axis=1
+            )[:, 0]
+            dropped = reached[:, np.newaxis, :] & (
+                year_numbers[:, np.newaxis] >= eol_year[:, np.newaxis, :]
+            )
+            ratio = np.where(dropped, eol_ratio_reached[:, np.newaxis, :], ratio)
+
+        cap_fade = battery_capacity * (1 - ratio) / (0.2 * full_capacity)
+        avg_soh[chunk] = np.swapaxes(1 - cap_fade @ group_means, 1, 2)
+
+    avg_soh[:, counts == 0, :] = np.nan
+    soh_percentiles = np.percentile(avg_soh, percentiles, axis=0)
+    return soh_percentiles, avg_soh
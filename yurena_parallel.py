@@ -0,0 +1,158 @@
+"""
+Parallel execution of the degeneration simulation.
+
+Vehicles do not interact with each other, so the fleet can be split into shards (one per depot or blocks of a fixed
+number of vehicles) that are simulated in separate processes. The workers only receive compact arrays of their
+vehicles, not ORM objects. Since every vehicle goes through exactly the same floating point operations as in the serial
+run, the merged results are bit-identical to it.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from yurena_degradation import T_DEFAULT, simulate_years
+
+
+def shard_by_block(n_vehicles, block_size):
+    """Splits the vehicle positions 0..n_vehicles-1 into consecutive blocks of block_size vehicles."""
+    if block_size < 1:
+        raise ValueError("The block size must be at least 1.")
+    return [
+        np.arange(start, min(start + block_size, n_vehicles))
+        for start in range(0, n_vehicles, block_size)
+    ]
+
+
+def shard_by_key(keys):
+    """
+    Splits the vehicle positions into one shard per distinct key, e.g. the depot id of each vehicle.
+
+    Shards are ordered by key and the positions within a shard are ascending, so the sharding is deterministic.
+    """
+    keys = np.asarray(keys)
+    _, inverse = np.unique(keys, return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    return np.split(order, np.flatnonzero(np.diff(inverse[order])) + 1)
+
+
+def make_payload(
+    event_index,
+    positions,
+    battery_capacity,
+    full_capacity,
+    years,
+    T,
+    fold_weeks,
+    backend="numpy",
+    weekly_T=None,
+    initial_state=None,
+    drop_eol=False,
+    week_offset=0,
+):
+    """
+    Extracts the arrays a worker needs to simulate the vehicles at the given positions.
+
+    :param event_index: EventIndex of the whole fleet
+    :param positions: positions of the vehicles of the shard
+    :param initial_state: state of the whole fleet to continue from, see simulate_years
+    :return: dict with plain NumPy arrays and scalars
+    """
+    positions = np.asarray(positions, dtype=np.intp)
+    counts = event_index.event_counts()[positions]
+    local_offsets = np.r_[0, np.cumsum(counts)]
+
+    # positions of the events of the shard in the flat arrays of the event index
+    event_positions = np.repeat(
+        event_index.offsets[positions] - local_offsets[:-1], counts
+    ) + np.arange(local_offsets[-1])
+
+    return {
+        "soc_start": event_index.soc_start[event_positions],
+        "soc_end": event_index.soc_end[event_positions],
+        "vehicle_index": np.repeat(np.arange(positions.size), counts),
+        "battery_capacity": np.asarray(battery_capacity, dtype=np.float64)[positions],
+        "full_capacity": np.asarray(full_capacity, dtype=np.float64)[positions],
+        "years": years,
+        "T": T,
+        "fold_weeks": fold_weeks,
+        "backend": backend,
+        "weekly_T": weekly_T,
+        "drop_eol": drop_eol,
+        "week_offset": week_offset,
+        "initial_state": (
+            None
+            if initial_state is None
+            else {
+                key: np.asarray(value)[positions]
+                for key, value in initial_state.items()
+            }
+        ),
+    }
+
+
+def _simulate_shard(payload):
+    return simulate_years(**payload)
+
+
+def simulate_years_parallel(
+    event_index,
+    battery_capacity,
+    full_capacity,
+    years,
+    shards,
+    workers=None,
+    T=T_DEFAULT,
+    fold_weeks=False,
+    backend="numpy",
+    weekly_T=None,
+    initial_state=None,
+    drop_eol=False,
+    week_offset=0,
+):
+    """
+    Runs simulate_years for each shard in a process pool and merges the results.
+
+    :param shards: list of arrays with vehicle positions, see shard_by_block and shard_by_key
+    :param workers: number of worker processes, defaults to the number of CPUs
+    :param backend: backend for calc_cap_fade_batch in the workers, see BACKENDS
+    :param weekly_T: array with the temperature of each week of a year in K, replaces T
+    :param initial_state: state of the whole fleet to continue from, see simulate_years
+    :param drop_eol: vehicles that need a replacement are not simulated any further, see simulate_years
+    :param week_offset: number of weeks simulated before the initial state, see simulate_years
+    :return: the same dict of trajectories as simulate_years for the whole fleet
+    """
+    payloads = [
+        make_payload(
+            event_index,
+            positions,
+            battery_capacity,
+            full_capacity,
+            years,
+            T,
+            fold_weeks,
+            backend,
+            weekly_T,
+            initial_state,
+            drop_eol,
+            week_offset,
+        )
+        for positions in shards
+    ]
+
+    trajectories = None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map returns the results in the order of the shards, so the merge does not depend on the scheduling
+        for positions, shard_result in zip(
+            shards, executor.map(_simulate_shard, payloads)
+        ):
+            if trajectories is None:
+                trajectories = {
+                    key: np.empty(
+                        (years + 1, event_index.n_vehicles), dtype=value.dtype
+                    )
+                    for key, value in shard_result.items()
+                }
+            for key, value in shard_result.items():
+                trajectories[key][:, positions] = value
+    return trajectories
@@ -0,0 +1,291 @@
+#! /usr/bin/env python3
+"""
+Single entry point that runs yurena_example, yurena_steadystate and yurena_results as stages of one process.
+
+The stages, in this order:
+
+    degradation         capacity fade simulation of yurena_example, writes the results container (see yurena_store)
+    steady_state        age distributions of the vehicles of each depot of yurena_steadystate
+    depot_simulation    young and old vehicle types and a new depot simulation on a copy of the scenario, only when it
+                        is selected with --stages
+    results             bar plot of yurena_results, left out by default with --offline and without a database url,
+                        since it reads the scenarios from the database
+
+All stages share one engine with a connection pool and one ScenarioModel, so the vehicle types, depots, vehicles and
+charging events are loaded only once. The depot simulation copies the scenario with the shared engine and then works
+on the copy with the engine of that copy. The options of the three scripts are accepted as well and passed to every
+stage that knows them, e.g. --years to the degradation and --no-plots to the degradation and the steady state.
+
+The degradation and the steady state are skipped when their key matches the one of the previous run and their output
+still exists. The key is a hash of the scenario model, the options of the stage (and the temperature profile) and the
+key of the stage before it, the keys of the last run are stored in sc_id<scenario_id>_pipeline.json.
+"""
+
+import argparse
+import json
+import os
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+STAGES = ("degradation", "steady_state", "depot_simulation", "results")
+DEFAULT_STAGES = ("degradation", "steady_state", "results")
+# stages that are skipped when their inputs did not change
+CACHED_STAGES = ("degradation", "steady_state")
+# options that do not change the output of a stage and are not part of its key
+UNKEYED_OPTIONS = {
+    "database_url",
+    "list_scenarios",
+    "workers",
+    "shard_by",
+    "block_size",
+    "plot_workers",
+    "cache_dir",
+    "cache_size_mb",
+    "no_cache",
+    "offline",
+    "checkpoint_dir",
+    "no_checkpoints",
+    "copy_mode",
+    "workspace",
+    "depot_simulation",
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Runs the stages of the degeneration and steady state analysis in one process. All options of "
+        "yurena_example.py, yurena_steadystate.py and yurena_results.py are accepted as well.",
+        allow_abbrev=False,
+    )
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=STAGES,
+        help="Stages to be run, always in the order degradation, steady_state, depot_simulation, results. Defaults to "
+        "degradation, steady_state and results (without results for --offline runs without a database url).",
+    )
+    parser.add_argument(
+        "--skip",
+        nargs="+",
+        choices=STAGES,
+        default=[],
+        help="Stages that are not run, e.g. the degradation when its results already exist.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Run the cached stages even if their inputs did not change since the last run.",
+    )
+    return parser
+
+
+def stage_parsers():
+    """Parsers of the scripts by stage, the scripts are only imported here."""
+    import yurena_example
+    import yurena_results
+    import yurena_steadystate
+
+    steady_state_parser = yurena_steadystate.build_parser()
+    return {
+        "degradation": yurena_example.build_parser(),
+        "steady_state": steady_state_parser,
+        "depot_simulation": steady_state_parser,
+        "results": yurena_results.build_parser(),
+    }
+
+
+def parse_args(argv=None):
+    """
+    Parses the options of the pipeline and of every stage.
+
+    :return: tuple of the options of the pipeline and a dict with the options of each stage
+    """
+    parser = build_parser()
+    args, rest = parser.parse_known_args(argv)
+    stage_args = {}
+    unknown = None
+    for stage, stage_parser in stage_parsers().items():
+        stage_args[stage], stage_unknown = stage_parser.parse_known_args(rest)
+        unknown = (
+            set(stage_unknown) if unknown is None else unknown & set(stage_unknown)
+        )
+    unknown = [token for token in rest if token in unknown and token.startswith("-")]
+    if unknown:
+        parser.error(f"unrecognized arguments: {' '.join(unknown)}")
+    return args, stage_args
+
+
+def stage_key(stage, args, model, upstream=None):
+    """
+    Key of the inputs of a stage.
+
+    :param args: options of the stage
+    :param model: ScenarioModel of the scenario
+    :param upstream: key of the stage before it
+    """
+    import numpy as np
+
+    from yurena_checkpoint import simulation_key
+
+    arrays = [model.snapshot[name] for name in sorted(model.snapshot)]
+    if getattr(args, "temperature_profile", None):
+        arrays.append(np.fromfile(args.temperature_profile, dtype=np.uint8))
+    settings = {
+        "stage": stage,
+        "upstream": upstream,
+        "options": {
+            name: value
+            for name, value in vars(args).items()
+            if name not in UNKEYED_OPTIONS
+        },
+    }
+    return simulation_key(arrays, settings)
+
+
+def _output_exists(stage, output):
+    if stage == "degradation":
+        # the results container is only complete once its manifest exists
+        from yurena_store import MANIFEST
+
+        return os.path.exists(os.path.join(output, MANIFEST))
+    return os.path.exists(output)
+
+
+def _load_state(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def _save_state(path, state):
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w") as file:
+        json.dump(state, file, indent=1, sort_keys=True)
+    os.replace(temporary_path, path)
+
+
+def run_pipeline(args, stage_args):
+    """
+    Runs the selected stages with a shared engine and scenario model.
+
+    :param args: options of the pipeline, see build_parser
+    :param stage_args: options of each stage, see parse_args
+    :return: dict with the output of each stage that ran or was skipped because its inputs did not change
+    """
+    from yurena_cache import SnapshotCache
+    from yurena_example import run_degradation
+    from yurena_model import ScenarioModel
+    from yurena_results import run_results
+    from yurena_steadystate import run_depot_simulation, run_steady_state
+
+    # the options shared by all scripts are taken from the degradation
+    common = stage_args["degradation"]
+    scenario_id = common.scenario_id
+    if common.database_url is None:
+        common.database_url = os.environ.get("DATABASE_URL")
+
+    stages = args.stages
+    if stages is None:
+        stages = DEFAULT_STAGES
+        if common.offline and common.database_url is None:
+            stages = [stage for stage in stages if stage != "results"]
+            print("Stage results needs the database, it is not run with --offline.")
+    selected = [stage for stage in STAGES if stage in stages and stage not in args.skip]
+    # the depot simulation and the results read from the database also with --offline
+    database_stages = [
+        stage for stage in selected if stage in ("depot_simulation", "results")
+    ]
+    if common.database_url is None and (not common.offline or database_stages):
+        message = "The database url must be specified either as an argument or as the environment variable DATABASE_URL"
+        if common.offline:
+            message += (
+                f", the stages {', '.join(database_stages)} need it also with --offline"
+            )
+        raise ValueError(message + ".")
+    for options in stage_args.values():
+        options.database_url = common.database_url
+    if "depot_simulation" in selected:
+        from yurena_workspace import check_depot_simulation_mode
+
+        check_depot_simulation_mode(stage_args["depot_simulation"].copy_mode)
+
+    if common.list_scenarios:
+        from yurena_example import list_scenarios
+
+        list_scenarios(common.database_url)
+        return {}
+
+    if scenario_id is None:
+        raise ValueError(
+            "The scenario id must be specified. Use --list-scenarios to see all available scenarios, then run with "
+            "--scenario-id <id>."
+        )
+
+    # one engine for all stages, pre_ping replaces connections that broke during a long stage
+    engine = None
+    if common.database_url is not None:
+        engine = create_engine(common.database_url, echo=False, pool_pre_ping=True)
+
+    # the model is only needed by the degradation and the steady state
+    model = None
+    if "degradation" in selected or "steady_state" in selected:
+        cache = (
+            None
+            if common.no_cache
+            else SnapshotCache(
+                common.cache_dir, max_bytes=common.cache_size_mb * 1024**2
+            )
+        )
+        with Session(engine) as session:
+            model = ScenarioModel.load(session, scenario_id, cache, common.offline)
+
+    state_path = os.path.join(os.getcwd(), f"sc_id{scenario_id}_pipeline.json")
+    state = _load_state(state_path)
+    outputs = {stage: entry["output"] for stage, entry in state.items()}
+    keys = {stage: entry["key"] for stage, entry in state.items()}
+    try:
+        for stage in selected:
+            options = stage_args[stage]
+            key = None
+            if stage in CACHED_STAGES:
+                # the steady state depends on the results of the degradation, also if they are from an earlier run
+                upstream = keys.get("degradation") if stage == "steady_state" else None
+                key = keys[stage] = stage_key(stage, options, model, upstream)
+                previous = state.get(stage, {})
+                if (
+                    not args.force
+                    and previous.get("key") == key
+                    and _output_exists(stage, previous["output"])
+                ):
+                    print(f"Skipped stage {stage}, its inputs did not change.")
+                    continue
+
+            start = time.perf_counter()
+            if stage == "degradation":
+                outputs[stage] = run_degradation(options, engine, model)
+            elif stage == "steady_state":
+                if options.results is None and "degradation" in outputs:
+                    options.results = outputs["degradation"]
+                outputs[stage] = run_steady_state(options, engine, model)
+            elif stage == "depot_simulation":
+                if options.results is None and "degradation" in outputs:
+                    options.results = outputs["degradation"]
+                run_depot_simulation(options, engine)
+            else:
+                run_results(options, engine)
+            print(f"Stage {stage} took {time.perf_counter() - start:.1f} s.")
+
+            if key is not None:
+                state[stage] = {"key": key, "output": outputs[stage]}
+                _save_state(state_path, state)
+    finally:
+        if engine is not None:
+            engine.dispose()
+    return outputs
+
+
+if __name__ == "__main__":
+    run_pipeline(*parse_args())
@@ -0,0 +1,214 @@
+"""
+Headless rendering of the figures of yurena_example and yurena_steadystate.
+
+Every figure is described by a kind (the name of a plot function in FIGURES), a file name and its input data (plain
+numbers, strings, lists and arrays). The plot functions use the object oriented API of matplotlib with the Agg canvas,
+so no pyplot state is shared and the figures can be rendered in parallel worker processes. matplotlib is only imported
+inside the plot functions, runs without plots never load it.
+
+render_figures keeps a hash of the input data of every rendered figure in an index file in the output folder. Figures
+whose data did not change since the previous render (and whose file still exists) are not rendered again.
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# part of every hash, increase it when the look of the figures changes so that they get rendered again
+RENDER_VERSION = 1
+RENDER_INDEX = "render_index.json"
+
+
+def _new_figure(figsize):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=figsize)
+    FigureCanvasAgg(figure)
+    return figure
+
+
+def plot_soh_progression(path, data):
+    """
+    Average SoH progression of one vehicle type, one line per depot and a line for all depots.
+
+    :param data: dict with title, years, x_values, depot_lines (list of (depot name, SoH of each age)) and all_depots
+        (SoH of each age of all vehicles of the type)
+    """
+    figure = _new_figure((15, 8))
+    ax = figure.add_subplot()
+    # Titel nicht für schriftliche Ausarbeitung
+    ax.set_title(data["title"])
+    ax.set_xlabel("Vehicle Age [years]", fontsize=23)
+    ax.set_ylabel("State of Health [/]", fontsize=23)
+    ax.set_ylim(bottom=0)
+    ax.set_xlim(left=-0.1, right=data["years"])
+    ax.grid(True)
+    ax.tick_params(axis="both", which="major", labelsize=21)
+
+    for depot_name, y_values in data["depot_lines"]:
+        ax.plot(data["x_values"], y_values, label=f"{depot_name}")
+    ax.plot(
+        data["x_values"],
+        data["all_depots"],
+        label="All Depots",
+        color="black",
+        linewidth=3.5,
+    )
+
+    ax.legend(
+        title="Depot:",
+        loc="center left",
+        fontsize="20",
+        bbox_to_anchor=(1, 0.5),
+        title_fontsize=19,
+    )
+    figure.tight_layout(rect=[0, 0, 0.8, 1])
+    figure.savefig(path, bbox_inches="tight")
+
+
+def plot_age_distribution(path, data):
+    """
+    Number of vehicles of each age in the steady state of one depot, one group of bars per vehicle type.
+
+    :param data: dict with title, max_vehicles, max_age (limits shared by all depots) and bars (list of (vehicle
+        type name, number of vehicles of each age))
+    """
+    figure = _new_figure((12, 8))
+    ax = figure.add_subplot()
+    ax.set_title(data["title"], fontsize=28)
+
+    bar_width = 0.3  # Adjusted bar width for multiple vehicle types
+    x = np.arange(data["max_age"])  # Global x range for consistent x-axis ticks
+    pos = 0
+    for vt_name, age_distribution in data["bars"]:
+        x_positions = np.arange(len(age_distribution))
+        ax.bar(x_positions + pos, age_distribution, bar_width, label=vt_name)
+        pos += bar_width
+
+    # Set consistent y-axis and x-axis limits
+    ax.set_ylim(0, data["max_vehicles"] + 5)
+    ax.set_xticks(x + (pos - bar_width) / 2)  # Center ticks
+    ax.set_xticklabels([f"{i}" for i in range(data["max_age"])])
+    ax.set_xlabel("Age in the Steady State [years]", fontsize=28)
+    ax.set_ylabel("Number of vehicles [/]", fontsize=28)
+    ax.tick_params(axis="both", which="major", labelsize=27)
+
+    figure.tight_layout()
+    figure.savefig(path)
+
+
+def plot_legend(path, data):
+    """
+    Legend of bar plots as separate figure, the entries get the colors of the color cycle in their order.
+
+    :param data: dict with title and labels
+    """
+    labels = data["labels"]
+    figure = _new_figure((6, len(labels) * 1.2))
+    ax = figure.add_subplot()
+    ax.axis("off")
+    # empty bars, so the legend entries look like the ones of the bar plots
+    for label in labels:
+        ax.bar(0, 0, label=label)
+    ax.legend(
+        title=data["title"],
+        fontsize=19,
+        title_fontsize=20,
+        loc="center",
+        ncol=1,
+        frameon=True,
+        borderpad=1.5,
+    )
+    figure.tight_layout()
+    figure.savefig(path)
+
+
+FIGURES = {
+    "soh_progression": plot_soh_progression,
+    "age_distribution": plot_age_distribution,
+    "legend": plot_legend,
+}
+
+
+def data_hash(kind, data):
+    """Hash of the kind and input data of a figure, arrays are hashed with dtype, shape and content."""
+    digest = hashlib.sha1(f"{RENDER_VERSION}:{kind}".encode())
+
+    def update(value):
+        if isinstance(value, dict):
+            digest.update(b"{")
+            for key in sorted(value):
+                update(key)
+                update(value[key])
+            digest.update(b"}")
+        elif isinstance(value, (list, tuple)):
+            digest.update(b"[")
+            for item in value:
+                update(item)
+            digest.update(b"]")
+        elif isinstance(value, np.ndarray):
+            value = np.ascontiguousarray(value)
+            digest.update(f"{value.dtype.str}{value.shape}".encode())
+            digest.update(value.tobytes())
+        else:
+            digest.update(repr(value).encode())
+        digest.update(b",")
+
+    update(data)
+    return digest.hexdigest()
+
+
+def _render(kind, path, data):
+    FIGURES[kind](path, data)
+
+
+def render_figures(folder, figures, workers=None):
+    """
+    Renders the figures into a folder, figures with unchanged input data are skipped.
+
+    :param figures: list of (kind, file name, data), kind is a key of FIGURES
+    :param workers: number of worker processes, defaults to the number of CPUs. With 1 the figures are rendered in
+        this process.
+    :return: number of rendered figures
+    """
+    os.makedirs(folder, exist_ok=True)
+    index_path = os.path.join(folder, RENDER_INDEX)
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path) as file:
+            index = json.load(file)
+
+    pending = []
+    for kind, filename, data in figures:
+        path = os.path.join(folder, filename)
+        digest = data_hash(kind, data)
+        if index.get(filename) == digest and os.path.exists(path):
+            continue
+        # a figure that fails to render must not keep the hash of an older file
+        index.pop(filename, None)
+        pending.append((kind, path, data, filename, digest))
+
+    try:
+        if workers == 1 or len(pending) <= 1:
+            for kind, path, data, filename, digest in pending:
+                _render(kind, path, data)
+                index[filename] = digest
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    (executor.submit(_render, kind, path, data), filename, digest)
+                    for kind, path, data, filename, digest in pending
+                ]
+                for future, filename, digest in futures:
+                    future.result()
+                    index[filename] = digest
+    finally:
+        temporary_path = index_path + ".tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(index, file, indent=1, sort_keys=True)
+        os.replace(temporary_path, index_path)
+    return len(pending)
@@ -0,0 +1,368 @@
+"""
+Database queries for the degeneration simulation.
+
+Instead of materializing full ORM objects, the queries in this file only select the columns the model needs and
+stream them in batches into preallocated NumPy arrays, so the peak memory is bounded by the size of the arrays.
+"""
+
+import numpy as np
+from eflips.model import (
+    Depot,
+    Event,
+    EventType,
+    Rotation,
+    Route,
+    Trip,
+    Vehicle,
+    VehicleType,
+)
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import aliased
+
+# vehicle to depot assignments that were already queried, by (database url, scenario id)
+_depot_assignments = {}
+
+# columns of the Event table that can be loaded, with the dtype of their array
+EVENT_COLUMNS = {
+    "id": (Event.id, np.int64),
+    "vehicle_id": (Event.vehicle_id, np.int64),
+    "trip_id": (Event.trip_id, np.int64),
+    "soc_start": (Event.soc_start, np.float64),
+    "soc_end": (Event.soc_end, np.float64),
+    "time_start": (Event.time_start, np.float64),
+    "time_end": (Event.time_end, np.float64),
+}
+
+
+def _convert_column(column, values):
+    """Converts the values of one column of a batch of rows into a form that fits into its array."""
+    if column in ("time_start", "time_end"):
+        # times are stored as POSIX timestamps in seconds
+        return [value.timestamp() for value in values]
+    if column == "trip_id":
+        # events without a trip get -1
+        return [-1 if value is None else value for value in values]
+    return values
+
+
+def load_event_arrays(
+    session,
+    scenario_id,
+    event_types,
+    columns=("id", "vehicle_id", "soc_start", "soc_end"),
+    batch_size=10000,
+    order_by_vehicle=False,
+    exclude_last=False,
+):
+    """
+    Loads selected columns of the events of a scenario into NumPy arrays.
+
+    The rows are streamed with yield_per (server side cursors where the database supports them) and written into
+    arrays that are allocated once, after counting the events.
+
+    :param session: an open SQLAlchemy session
+    :param scenario_id: id of the scenario
+    :param event_types: list of EventTypes to load
+    :param columns: names of the columns to load, see EVENT_COLUMNS
+    :param batch_size: number of rows fetched at once
+    :param order_by_vehicle: let the database sort the events by (vehicle_id, time_start), so the events of each
+        vehicle are one contiguous range of the arrays
+    :param exclude_last: leave out the last event (by time_start) of each vehicle, using a window function
+    :return: dict with one array per column, in the order in which the database returns the events
+    """
+    filters = (Event.scenario_id == scenario_id, Event.event_type.in_(event_types))
+    if exclude_last:
+        # number the events of each vehicle from the last one backwards and skip number 1
+        rank_from_end = (
+            func.row_number()
+            .over(
+                partition_by=Event.vehicle_id,
+                order_by=(Event.time_start.desc(), Event.id.desc()),
+            )
+            .label("rank_from_end")
+        )
+        events = (
+            select(
+                *(column.label(name) for name, (column, _) in EVENT_COLUMNS.items()),
+                rank_from_end,
+            )
+            .where(*filters)
+            .subquery()
+        )
+        source_columns = {name: events.c[name] for name in EVENT_COLUMNS}
+        conditions = (events.c.rank_from_end > 1,)
+    else:
+        source_columns = {name: column for name, (column, _) in EVENT_COLUMNS.items()}
+        conditions = filters
+
+    n_events = session.scalar(
+        select(func.count(source_columns["id"])).where(*conditions)
+    )
+
+    arrays = {
+        column: np.empty(n_events, dtype=EVENT_COLUMNS[column][1]) for column in columns
+    }
+    statement = (
+        select(*(source_columns[column] for column in columns))
+        .where(*conditions)
+        .execution_options(yield_per=batch_size)
+    )
+    if order_by_vehicle:
+        statement = statement.order_by(
+            source_columns["vehicle_id"],
+            source_columns["time_start"],
+            source_columns["id"],
+        )
+
+    n_loaded = 0
+    for rows in session.execute(statement).partitions():
+        if n_loaded + len(rows) > n_events:
+            raise RuntimeError(
+                "The events of the scenario changed while they were loaded."
+            )
+        for column, values in zip(columns, zip(*rows)):
+            arrays[column][n_loaded : n_loaded + len(rows)] = _convert_column(
+                column, values
+            )
+        n_loaded += len(rows)
+
+    return {column: array[:n_loaded] for column, array in arrays.items()}
+
+
+def query_vehicle_depots(session, scenario_id, use_cache=True):
+    """
+    Assigns each vehicle to a depot with one aggregated query over Event -> Trip -> Route -> Depot.
+
+    A vehicle belongs to the depot at the departure (or else arrival) station of the route of its first driving event
+    that starts or ends at a depot, so Trips and Routes never have to be loaded into Python.
+
+    :param session: an open SQLAlchemy session
+    :param scenario_id: id of the scenario
+    :param use_cache: reuse the result of an earlier call for the same database and scenario
+    :return: dict with vehicle id as key and depot id as value, vehicles without depot are missing
+    """
+    key = (str(session.get_bind().url), scenario_id)
+    if use_cache and key in _depot_assignments:
+        return dict(_depot_assignments[key])
+
+    departure_depot = aliased(Depot)
+    arrival_depot = aliased(Depot)
+    rank = (
+        func.row_number()
+        .over(partition_by=Event.vehicle_id, order_by=(Event.time_start, Event.id))
+        .label("rank")
+    )
+    depot_events = (
+        select(
+            Event.vehicle_id.label("vehicle_id"),
+            func.coalesce(departure_depot.id, arrival_depot.id).label("depot_id"),
+            rank,
+        )
+        .join(Trip, Trip.id == Event.trip_id)
+        .join(Route, Route.id == Trip.route_id)
+        .outerjoin(
+            departure_depot,
+            and_(
+                departure_depot.station_id == Route.departure_station_id,
+                departure_depot.scenario_id == scenario_id,
+            ),
+        )
+        .outerjoin(
+            arrival_depot,
+            and_(
+                arrival_depot.station_id == Route.arrival_station_id,
+                arrival_depot.scenario_id == scenario_id,
+            ),
+        )
+        .where(
+            Event.scenario_id == scenario_id,
+            Event.event_type == EventType.DRIVING,
+            or_(departure_depot.id.isnot(None), arrival_depot.id.isnot(None)),
+        )
+        .subquery()
+    )
+    rows = session.execute(
+        select(depot_events.c.vehicle_id, depot_events.c.depot_id).where(
+            depot_events.c.rank == 1
+        )
+    )
+    vehicle_depots = {int(vehicle_id): int(depot_id) for vehicle_id, depot_id in rows}
+
+    _depot_assignments[key] = vehicle_depots
+    return dict(vehicle_depots)
+
+
+def query_rotation_table(session, scenario_id):
+    """
+    Depot, first departure and last arrival of every rotation of a scenario, with one aggregated query over
+    Rotation -> Trip -> Route -> Depot.
+
+    Like query_vehicle_depots, a rotation belongs to the depot at the departure (or else arrival) station of the route
+    of its first trip that starts or ends at a depot. Rotations without trips are left out.
+
+    :param session: an open SQLAlchemy session
+    :param scenario_id: id of the scenario
+    :return: dict of arrays sorted by rotation id: rotation_id, vehicle_type_id, depot_id (-1 without depot),
+        departure, arrival (POSIX timestamps in seconds) and distance (sum of the route distances in m)
+    """
+    times = (
+        select(
+            Trip.rotation_id.label("rotation_id"),
+            func.min(Trip.departure_time).label("departure"),
+            func.max(Trip.arrival_time).label("arrival"),
+            func.sum(Route.distance).label("distance"),
+        )
+        .join(Route, Route.id == Trip.route_id)
+        .where(Trip.scenario_id == scenario_id)
+        .group_by(Trip.rotation_id)
+        .subquery()
+    )
+
+    departure_depot = aliased(Depot)
+    arrival_depot = aliased(Depot)
+    rank = (
+        func.row_number()
+        .over(partition_by=Trip.rotation_id, order_by=(Trip.departure_time, Trip.id))
+        .label("rank")
+    )
+    depot_trips = (
+        select(
+            Trip.rotation_id.label("rotation_id"),
+            func.coalesce(departure_depot.id, arrival_depot.id).label("depot_id"),
+            rank,
+        )
+        .join(Route, Route.id == Trip.route_id)
+        .outerjoin(
+            departure_depot,
+            and_(
+                departure_depot.station_id == Route.departure_station_id,
+                departure_depot.scenario_id == scenario_id,
+            ),
+        )
+        .outerjoin(
+            arrival_depot,
+            and_(
+                arrival_depot.station_id == Route.arrival_station_id,
+                arrival_depot.scenario_id == scenario_id,
+            ),
+        )
+        .where(
+            Trip.scenario_id == scenario_id,
+            or_(departure_depot.id.isnot(None), arrival_depot.id.isnot(None)),
+        )
+        .subquery()
+    )
+    first_depot = (
+        select(depot_trips.c.rotation_id, depot_trips.c.depot_id)
+        .where(depot_trips.c.rank == 1)
+        .subquery()
+    )
+
+    rows = session.execute(
+        select(
+            Rotation.id,
+            Rotation.vehicle_type_id,
+            func.coalesce(first_depot.c.depot_id, -1),
+            times.c.departure,
+            times.c.arrival,
+            times.c.distance,
+        )
+        .join(times, times.c.rotation_id == Rotation.id)
+        .outerjoin(first_depot, first_depot.c.rotation_id == Rotation.id)
+        .where(Rotation.scenario_id == scenario_id)
+        .order_by(Rotation.id)
+    ).all()
+
+    columns = list(zip(*rows)) or [()] * 6
+    return {
+        "rotation_id": np.array(columns[0], dtype=np.int64),
+        "vehicle_type_id": np.array(columns[1], dtype=np.int64),
+        "depot_id": np.array(columns[2], dtype=np.int64),
+        # times are stored as POSIX timestamps in seconds
+        "departure": np.array(
+            _convert_column("time_start", columns[3]), dtype=np.float64
+        ),
+        "arrival": np.array(_convert_column("time_end", columns[4]), dtype=np.float64),
+        "distance": np.array(columns[5], dtype=np.float64),
+    }
+
+
+def query_fingerprint(session, scenario_id):
+    """
+    Cheap fingerprint of the data of a scenario: row count and largest id of every table the simulation reads.
+
+    :return: dict with "<table>_count" and "<table>_max_id" entries
+    """
+    fingerprint = {}
+    for table in (VehicleType, Vehicle, Depot, Trip, Route, Event):
+        count, max_id = session.execute(
+            select(func.count(table.id), func.max(table.id)).where(
+                table.scenario_id == scenario_id
+            )
+        ).one()
+        fingerprint[f"{table.__name__}_count"] = int(count)
+        fingerprint[f"{table.__name__}_max_id"] = -1 if max_id is None else int(max_id)
+    return fingerprint
+
+
+def extract_scenario_arrays(session, scenario_id):
+    """
+    Extracts everything the degeneration simulation needs from the database as flat arrays.
+
+    Contains the vehicle types with their capacities, the depots, the vehicles, the vehicle to depot assignment and
+    the charging events (sorted by vehicle, without the last event of each vehicle, see load_event_arrays). Missing
+    names are stored as empty strings.
+
+    :return: dict of NumPy arrays
+    """
+
+    def rows(*columns, table):
+        return session.execute(
+            select(*columns).where(table.scenario_id == scenario_id).order_by(table.id)
+        ).all()
+
+    vehicle_types = rows(
+        VehicleType.id,
+        VehicleType.name,
+        VehicleType.battery_capacity,
+        VehicleType.battery_capacity_reserve,
+        table=VehicleType,
+    )
+    depots = rows(Depot.id, Depot.name, Depot.name_short, Depot.station_id, table=Depot)
+    vehicles = rows(Vehicle.id, Vehicle.vehicle_type_id, table=Vehicle)
+    vehicle_depots = query_vehicle_depots(session, scenario_id)
+    charging_events = load_event_arrays(
+        session,
+        scenario_id,
+        [EventType.CHARGING_DEPOT, EventType.CHARGING_OPPORTUNITY],
+        columns=("id", "vehicle_id", "soc_start", "soc_end"),
+        order_by_vehicle=True,
+        exclude_last=True,
+    )
+
+    def column(table_rows, i, dtype):
+        if dtype is str:
+            return np.array(
+                ["" if row[i] is None else row[i] for row in table_rows], dtype=str
+            )
+        return np.array([row[i] for row in table_rows], dtype=dtype)
+
+    return {
+        "vehicle_type_id": column(vehicle_types, 0, np.int64),
+        "vehicle_type_name": column(vehicle_types, 1, str),
+        "vehicle_type_battery_capacity": column(vehicle_types, 2, np.float64),
+        "vehicle_type_battery_capacity_reserve": column(vehicle_types, 3, np.float64),
+        "depot_id": column(depots, 0, np.int64),
+        "depot_name": column(depots, 1, str),
+        "depot_name_short": column(depots, 2, str),
+        "depot_station_id": column(depots, 3, np.int64),
+        "vehicle_id": column(vehicles, 0, np.int64),
+        "vehicle_vehicle_type_id": column(vehicles, 1, np.int64),
+        "vehicle_depot_id": np.array(
+            [vehicle_depots.get(int(row[0]), -1) for row in vehicles], dtype=np.int64
+        ),
+        "event_id": charging_events["id"],
+        "event_vehicle_id": charging_events["vehicle_id"],
+        "event_soc_start": charging_events["soc_start"],
+        "event_soc_end": charging_events["soc_end"],
+    }
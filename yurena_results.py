@@ -3,26 +3,28 @@ import argparse
 import os
 import warnings
 
-import numpy as np
-import matplotlib.pyplot as plt
-
 from eflips.model import *
 from eflips.model import ConsistencyWarning
 from sqlalchemy import create_engine
 from sqlalchemy.orm import Session
 
-from eflips.depot.api import (
-    add_evaluation_to_database,
-    delete_depots,
-    init_simulation,
-    insert_dummy_standby_departure_events,
-    run_simulation,
-    generate_realistic_depot_layout,
-    simple_consumption_simulation,
-    apply_even_smart_charging,
-)
+#numpy and matplotlib are only imported for the bar plot, so --list-scenarios only loads SQLAlchemy and eflips.model
 
-if __name__ == "__main__":
+
+def list_scenarios(database_url: str):
+    engine = create_engine(database_url, echo=False)
+    with Session(engine) as session:
+        scenarios = session.query(Scenario).all()
+        for scenario in scenarios:
+            rotation_count = (
+                session.query(Rotation)
+                .filter(Rotation.scenario_id == scenario.id)
+                .count()
+            )
+            print(f"{scenario.id}: {scenario.name} with {rotation_count} rotations.")
+
+
+def build_parser():
     ###GIVEN CODE:      (pick scenario)
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -45,27 +47,17 @@ if __name__ == "__main__":
         required=False,
     )
 
-    args = parser.parse_args()
-
-    if args.database_url is None:
-        if "DATABASE_URL" not in os.environ:
-            raise ValueError(
-                "The database url must be specified either as an argument or as the environment variable DATABASE_URL."
-            )
-        args.database_url = os.environ["DATABASE_URL"]
+    return parser
 
-    if args.list_scenarios:
-        list_scenarios(args.database_url)
-        exit()
 
-    if args.scenario_id is None:
-        raise ValueError(
-            "The scenario id must be specified. Use --list-scenarios to see all available scenarios, then run with "
-            "--scenario-id <id>."
-        )
-    ###
+def run_results(args, engine=None):
+    """
+    Bar plot of the initial capacities of the vehicle types with and without categorization.
 
-    engine = create_engine(args.database_url, echo=False)
+    :param engine: engine of the database, created from args.database_url if it is None
+    """
+    if engine is None:
+        engine = create_engine(args.database_url, echo=False)
     with Session(engine) as session:
         scenario = session.query(Scenario).filter(Scenario.id == args.scenario_id).one()
         assert isinstance(scenario, Scenario)
@@ -123,6 +115,9 @@ if __name__ == "__main__":
         #vehicles_by_depot = session.query(Vehicle).join(Event).join(Depot).group_by(depot.name, VehicleType.id)
         """
 
+        import numpy as np
+        import matplotlib.pyplot as plt
+
         # Fahrzeugtypen und Daten aus der Tabelle
         fahrzeugtypen = ['EN', 'GN', 'DD']
         unangepasst = [497.91, 799.70, 465.68]  # Kapazität (unangepasst)
@@ -159,6 +154,28 @@ if __name__ == "__main__":
         # Diagramm speichern und anzeigen
         plt.tight_layout()
         plt.savefig('balkendiagramm_kapazitaet.png', dpi=300)
+        plt.close(fig)
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+
+    if args.database_url is None:
+        if "DATABASE_URL" not in os.environ:
+            raise ValueError(
+                "The database url must be specified either as an argument or as the environment variable DATABASE_URL."
+            )
+        args.database_url = os.environ["DATABASE_URL"]
+
+    if args.list_scenarios:
+        list_scenarios(args.database_url)
+        exit()
 
+    if args.scenario_id is None:
+        raise ValueError(
+            "The scenario id must be specified. Use --list-scenarios to see all available scenarios, then run with "
+            "--scenario-id <id>."
+        )
+    ###
 
-        exit()
\ No newline at end of file
+    run_results(args)
@@ -1,15 +1,10 @@
-import numpy as np
 import math
-import matplotlib.pyplot as plt
 from collections import defaultdict
 import json
 import random
 from dataclasses import replace
 import copy
 
-import psycopg2
-from urllib.parse import urlparse, urlunparse
-
 #! /usr/bin/env python3
 import argparse
 import os
@@ -20,21 +15,11 @@ from eflips.model import ConsistencyWarning
 from sqlalchemy import create_engine, Column, Integer, update, text
 from sqlalchemy.orm import Session
 
-import eflips.depot.api
-from bin.bar_plot_test import all_vehicletypes
-#from yurena_example import years
-
+from yurena_workspace import COPY_MODES, check_depot_simulation_mode, open_workspace
 
-from eflips.depot.api import (
-    add_evaluation_to_database,
-    delete_depots,
-    init_simulation,
-    insert_dummy_standby_departure_events,
-    run_simulation,
-    generate_realistic_depot_layout,
-    simple_consumption_simulation,
-    apply_even_smart_charging,
-)
+#from yurena_example import years
+#numpy, the results and plot modules and eflips.depot.api are only imported by the stages that need them, so
+#--list-scenarios only loads SQLAlchemy and eflips.model
 
 
 def list_scenarios(database_url: str):
@@ -50,59 +35,7 @@ def list_scenarios(database_url: str):
             print(f"{scenario.id}: {scenario.name} with {rotation_count} rotations.")
 
 
-
-#COPIED FROM CHATGPT ON 01.12. TITLE: Adding new attributes to ORM
-def recreate_database_with_latest_data(original_db, copied_db, username, password, host="localhost"):
-    """Ensure the copied database has the latest data by dropping and recreating it."""
-    try:
-        conn = psycopg2.connect(
-            dbname="postgres",
-            user=username,
-            password=password,
-            host=host
-        )
-        conn.autocommit = True
-        with conn.cursor() as cursor:
-            # Terminate connections to the target database if it exists
-            cursor.execute(
-                f"""
-                SELECT pg_terminate_backend(pg_stat_activity.pid)
-                FROM pg_stat_activity
-                WHERE pg_stat_activity.datname = %s
-                AND pid <> pg_backend_pid();
-                """,
-                (copied_db,)
-            )
-            # Drop the copied database if it exists
-            cursor.execute(f"DROP DATABASE IF EXISTS {copied_db};")
-            print(f"Dropped existing database: {copied_db}")
-
-            # Terminate connections to the source database
-            cursor.execute(
-                f"""
-                SELECT pg_terminate_backend(pg_stat_activity.pid)
-                FROM pg_stat_activity
-                WHERE pg_stat_activity.datname = %s
-                AND pid <> pg_backend_pid();
-                """,
-                (original_db,)
-            )
-
-            # Recreate the copied database from the source database
-            cursor.execute(f"CREATE DATABASE {copied_db} WITH TEMPLATE {original_db} OWNER {username};")
-            print(f"Database {copied_db} created successfully as a copy of {original_db}.")
-    except psycopg2.Error as e:
-        print(f"Error recreating the database: {e}")
-
-#modify our argument to access the newly created steady state database
-def modify_database_url(original_url, new_database_name):
-    parsed_url = urlparse(original_url)
-    new_path = f"/{new_database_name}"
-    return urlunparse(parsed_url._replace(path=new_path))
-
-
-
-if __name__ == "__main__":
+def build_parser():
     ###GIVEN CODE:      (pick scenario)
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -124,255 +57,279 @@ if __name__ == "__main__":
         help="The url of the database to be used. If it is not specified, the environment variable DATABASE_URL is used.",
         required=False,
     )
+    parser.add_argument(
+        "--results",
+        type=str,
+        help="Folder with the results of yurena_example. Defaults to sc_id<scenario_id>_results in the working directory.",
+        required=False,
+    )
+    parser.add_argument(
+        "--copy_mode",
+        "--copy-mode",
+        choices=COPY_MODES,
+        default="schema",
+        help="How the scenario is copied before it gets changed: only its rows into a working schema of the database "
+        "(schema) or into a local SQLite file (sqlite, without the geometry columns and therefore not usable with "
+        "--depot-simulation), or the whole database with CREATE DATABASE ... WITH TEMPLATE (database).",
+    )
+    parser.add_argument(
+        "--workspace",
+        type=str,
+        help="Name of the working schema, SQLite file or database copy. Defaults to eflips_steadystate_<scenario_id>.",
+        required=False,
+    )
+    parser.add_argument(
+        "--no_plots",
+        "--no-plots",
+        action="store_true",
+        help="Do not render the age distribution plots, matplotlib is not loaded at all.",
+    )
+    parser.add_argument(
+        "--plot_workers",
+        "--plot-workers",
+        type=int,
+        help="Number of worker processes for rendering the plots. Defaults to the number of CPUs, with 1 the plots are rendered in this process.",
+        required=False,
+    )
+    parser.add_argument(
+        "--cache_dir",
+        "--cache-dir",
+        type=str,
+        default=os.path.join(os.getcwd(), "scenario_cache"),
+        help="Folder with the cached snapshots of yurena_example, the vehicles, vehicle types and depots are read from them.",
+    )
+    parser.add_argument(
+        "--no_cache",
+        "--no-cache",
+        action="store_true",
+        help="Always extract the data from the database and do not use the snapshot cache.",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Use the newest cached snapshot of the scenario without connecting to the database.",
+    )
+    parser.add_argument(
+        "--depot_simulation",
+        "--depot-simulation",
+        action="store_true",
+        help="Split the vehicle types into age classes and simulate the depots again on a copy of the scenario.",
+    )
+    parser.add_argument(
+        "--age_classes",
+        "--age-classes",
+        type=int,
+        default=2,
+        help="Number of age classes each vehicle type is split into for the depot simulation, 2 gives young and old vehicle types.",
+    )
+    parser.add_argument(
+        "--age_class_metric",
+        "--age-class-metric",
+        choices=("duration", "distance"),
+        default="duration",
+        help="The rotations with the largest duration or distance get the youngest vehicles, each age class gets the share of the rotations that matches its share of the vehicles. The distance ranks the rotations like their energy with a constant consumption per vehicle type.",
+    )
 
-    args = parser.parse_args()
+    return parser
+
+
+def run_steady_state(args, engine=None, model=None):
+    """
+    Steady state age distribution of the vehicles of each depot, from the results of yurena_example.
+
+    :param engine: engine of the database, only used to load the model and created from args.database_url if it is None
+    :param model: ScenarioModel of the scenario, loaded from the snapshot cache or the database if it is None
+    :return: folder of the age distribution plots
+    """
+    import numpy as np
+
+    from yurena_aggregation import FleetGroups, age_group_counts, index_lookup
+    from yurena_store import ResultsStore, add_results, results_folder
+
+    if model is None:
+        from yurena_cache import SnapshotCache
+        from yurena_model import ScenarioModel
+
+        if engine is None and args.database_url is not None:
+            engine = create_engine(args.database_url, echo=False)
+        cache = None if args.no_cache else SnapshotCache(args.cache_dir)
+        with Session(engine) as session:
+            model = ScenarioModel.load(session, args.scenario_id, cache, args.offline)
+
+    #vehicle types and depots of the scenario model as dictionaries for easy access, keys are the ids
+    all_vehicletypes, all_depots = model.vehicle_types, model.depots
+
+    #results of yurena_example, arrays are only read when they are used
+    results = ResultsStore(args.results or results_folder(args.scenario_id))
+    soh = results["soh_progression"]
+    max_ages = results["lifespans"]
+
+    # create bar plot to show age distributions of vehicles in depot, same indizes as in yurena_example
+    depot_indizes = results.depot_indizes
+    vehicle_type_indizes = results.vehicle_type_indizes
+
+    #number of vehicles of each depot x vehicle type x age in the steady state, the vehicles of a pair are distributed
+    #evenly over its ages. The depot of each vehicle is the one of yurena_example, the axis limits and the bars of the
+    #plots are read from this table and it is exported into the results for the later stages
+    snapshot = model.snapshot
+    position = index_lookup(results.vehicle_ids, snapshot["vehicle_id"])
+    vehicle_depot = np.where(position >= 0, results["vehicle_depot"][position], -1)
+    groups = FleetGroups(index_lookup(results.depot_ids, vehicle_depot),
+                         index_lookup(results.vehicle_type_ids, snapshot["vehicle_vehicle_type_id"]),
+                         len(depot_indizes), len(vehicle_type_indizes))
+    age_distributions = age_group_counts(groups.pair_counts, max_ages)
+    add_results(results.folder, {"age_distribution": age_distributions})
+
+    # todo: ausserhalb der Datenbank visualisieren, veh.age brauche ich nicht
+    # create bar plot to show age distributions of vehicles in depot
+    folder_path = os.path.join(os.getcwd(), f"steady_state_age_distributions_{args.scenario_id}")
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path)
+
+    # Step 1: global y-axis limit and max x-axis range
+    #vehicles get replaced immediately uppon reaching max_age and are therefore not shown in steady state across the year
+    global_max_vehicles = int(age_distributions.max(initial=0))
+    global_max_age = age_distributions.shape[2]
+
+    # Step 2: Create plots with consistent y-axis and x-axis settings, rendered in worker processes and only if
+    # their data changed since the last run
+    figures = []
+    legend_labels = None
+    for depot_id, depot in all_depots.items():
+        bars = []
+        # one group of bars per vehicle type with age groups
+        for vt_id, vt in all_vehicletypes.items():
+            depot_index, vt_index = depot_indizes[depot_id], vehicle_type_indizes[vt_id]
+            agegroups = max_ages[depot_index, vt_index] - 1
+            if agegroups > 0:
+                bars.append((vt.name, age_distributions[depot_index, vt_index, :agegroups].tolist()))
 
-    if args.database_url is None:
-        if "DATABASE_URL" not in os.environ:
-            raise ValueError(
-                "The database url must be specified either as an argument or as the environment variable DATABASE_URL."
-            )
-        args.database_url = os.environ["DATABASE_URL"]
+        figures.append(("age_distribution", f'age_distribution_for_{depot.name}.png', {
+            "title": f"Age Distribution for {all_depots[depot.id].name}",
+            "max_vehicles": global_max_vehicles,
+            "max_age": global_max_age,
+            "bars": bars,
+        }))
 
-    if args.list_scenarios:
-        list_scenarios(args.database_url)
-        exit()
+        # Save legend labels of the first depot for separate legend plot
+        if legend_labels is None:
+            legend_labels = [vt_name for vt_name, _ in bars]
 
-    if args.scenario_id is None:
-        raise ValueError(
-            "The scenario id must be specified. Use --list-scenarios to see all available scenarios, then run with "
-            "--scenario-id <id>."
-        )
-    ###
+    #print legend separately
+    if legend_labels:  # Prüfen, ob Legendenelemente vorhanden sind
+        figures.append(("legend", 'legend_only.png', {"title": 'Vehicle types', "labels": legend_labels}))
 
+    if not args.no_plots:
+        from yurena_plots import render_figures
 
-    new_database_url = recreate_database_with_latest_data(
-        original_db="eflips_oneweek",
-        copied_db= f"eflips_steadystate_{args.scenario_id}",
-        #specific to me!!! needs to be changed if someone else runs it todo: change that??
-        username="yurenape",
-        password="eflips",
-        host="localhost"
-    )
+        rendered = render_figures(folder_path, figures, workers=args.plot_workers)
+        print(f"Rendered {rendered} of {len(figures)} age distribution plots, the others did not change.")
 
-    new_database_url = modify_database_url(args.database_url, f"eflips_steadystate_{args.scenario_id}")
+    return folder_path
 
-    engine = create_engine(new_database_url, echo=False)
-    #engine = create_engine(args.database_url, echo=False)
-    with Session(engine) as session:
-        scenario = session.query(Scenario).filter(Scenario.id == args.scenario_id).one()
-        assert isinstance(scenario, Scenario)
 
+def run_depot_simulation(args, engine=None):
+    """
+    Splits every vehicle type into one per age class (by default a young and an old one), assigns the rotations to them
+    and simulates the depots again with eflips.depot.
 
-        #collect all classes_needed from Dataframe into dictionaries for easy access:
-        classes_needed = ['VehicleType', 'Vehicle', 'Depot']
-        for c in classes_needed:
-            class_type = globals().get(c)   #converts String
-            query_result = session.query(class_type).filter(class_type.scenario_id == scenario.id).all()
-            globals()[f"all_{c.lower()}s"] = {x.id: x for x in query_result}      #e.g. dictionary is called all_vehicletypes, keys are vehicletype ids
-
-
-
-        soh = np.load("soh_progression.npy")
-        max_ages = np.load("max_ages.npy", allow_pickle=True)
-
-        # create bar plot to show age distributions of vehicles in depot
-        depot_indizes = {depot_id: i for i, depot_id in enumerate(all_depots.keys())}
-        vehicle_type_indizes = {v_type_id: i for i, v_type_id in enumerate(all_vehicletypes.keys())}
-
-        #import depot assignment dict with {vehicle_id: depot_id} from yurena_example file
-        with open('veh_to_depot.json', 'r') as f:
-            veh_to_depot = json.load(f)
-        #convert keys back to int
-        veh_to_depot = {int(k): int(v) for k, v in veh_to_depot.items()}
-
-        vehicles_of_depot = defaultdict(list)
-        # assign depots
-        for vehicle_id, vehicle in all_vehicles.items():
-            vehicle.depot_id = veh_to_depot[vehicle_id]  # Assign vehicles their depot_id from yurena_example
-            vehicles_of_depot[vehicle.depot_id].append(vehicle)  # dict for easy access
-
-
-        # todo: ausserhalb der Datenbank visualisieren, veh.age brauche ich nicht
-        # create bar plot to show age distributions of vehicles in depot
-        folder_path = os.path.join(os.getcwd(), f"steady_state_age_distributions_{scenario.id}")
-        if not os.path.exists(folder_path):
-            os.makedirs(folder_path)
-
-        # Step 1: Calculate global y-axis limit and max x-axis range
-        global_max_vehicles = 0
-        global_max_age = 0
-        for depot_id, depot in all_depots.items():
-            for vt_id, vt in all_vehicletypes.items():
-                #vehicles get replaced immediately uppon reaching max_age and are therefore not shown in steady state across the year
-                max_age = max_ages[depot_indizes[depot_id], vehicle_type_indizes[vt_id]]
-                if max_age:
-                    agegroups = max_age - 1
-                    num_veh = len([vehicle for vehicle in vehicles_of_depot[depot.id] if vehicle.vehicle_type_id == vt_id])
-                    num_in_agegroup = num_veh // agegroups
-                    remainder = num_veh % agegroups
-                    age_distribution = [num_in_agegroup] * agegroups
-                    for i in range(remainder):
-                        age_distribution[i] += 1
-                    global_max_vehicles = max(global_max_vehicles, max(age_distribution))
-                    global_max_age = max(global_max_age, agegroups)
-
-        # Variable to store legend handles and labels
-        legend_handles = None
-        legend_labels = None
-
-        # Step 2: Create plots with consistent y-axis and x-axis settings
-        for depot_id, depot in all_depots.items():
-            depot_index = depot_indizes[depot_id]
-            vehicles_in_depot = vehicles_of_depot[depot.id]
-            bar_width = 0.3  # Adjusted bar width for multiple vehicle types
-            x = np.arange(global_max_age)  # Global x range for consistent x-axis ticks
-
-            # Create figure
-            fig, ax = plt.subplots(figsize=(12, 8))
-            plt.title(f"Age Distribution for {all_depots[depot.id].name}", fontsize = 28)
-
-            pos = 0
-            # Loop through each vehicle type to generate and save a histogram
-            for vt_id, vt in all_vehicletypes.items():
-                vt_index = vehicle_type_indizes[vt_id]
-                max_age = max_ages[depot_indizes[depot_id], vehicle_type_indizes[vt_id]]
-                if max_age:
-                    agegroups = max_age - 1
-                    veh_of_vt = [vehicle for vehicle in vehicles_in_depot if vehicle.vehicle_type_id == vt_id]
-                    num_veh = len(veh_of_vt)
-
-                    num_in_agegroup = num_veh // agegroups
-                    remainder = num_veh % agegroups
-                    age_distribution = [num_in_agegroup] * agegroups
-                    for i in range(remainder):
-                        age_distribution[i] += 1
-                    x_positions = np.arange(agegroups)  # x positions for the current vehicle type
-                    ax.bar(x_positions + pos, age_distribution, bar_width, label=vt.name)
-                    pos += bar_width
-
-            # Set consistent y-axis and x-axis limits
-            ax.set_ylim(0, global_max_vehicles + 5)  # Consistent y-axis limit
-            ax.set_xticks(x + (pos - bar_width) / 2)  # Center ticks
-            ax.set_xticklabels([f"{i}" for i in range(global_max_age)], )  # Consistent x-axis labels
-            ax.set_xlabel('Age in the Steady State [years]', fontsize=28)
-            ax.set_ylabel('Number of vehicles [/]', fontsize=28)
-            ax.tick_params(axis='both', which='major', labelsize=27)
-            #ax.legend(title='Vehicle types', fontsize = 25,title_fontsize=22)
-
-            # Save legend handles and labels for separate legend plot
-            if legend_handles is None and legend_labels is None:
-                legend_handles, legend_labels = ax.get_legend_handles_labels()
-
-            plt.tight_layout()
-            plt.savefig(os.path.join(folder_path, f'age_distribution_for_{depot.name}.png'))
-            plt.close(fig)
-
-        #print legend separately
-        if legend_handles and legend_labels:  # Prüfen, ob Legendenelemente vorhanden sind
-            fig, ax = plt.subplots(figsize=(6, len(legend_labels) * 1.2))  # Höhe proportional zur Anzahl der Einträge
-            ax.axis('off')  # Achsen ausblenden
-            legend = ax.legend(
-                legend_handles,
-                legend_labels,
-                title='Vehicle types',
-                fontsize=19,  # Schriftgröße der Einträge
-                title_fontsize=20,  # Schriftgröße des Titels
-                loc='center',  # Zentrierte Legende
-                ncol=1,  # Einträge untereinander
-                frameon=True,  # Rahmen um die Legende
-                borderpad=1.5,  # Abstand innerhalb des Rahmens
-            )
-            plt.tight_layout()
-            plt.savefig(os.path.join(folder_path, 'legend_only.png'))  # Legende als separate Datei speichern
-            plt.close(fig)
+    The rotations, vehicles and depots are changed, so the simulation works on a copy of the scenario (see
+    yurena_workspace) with its own engine.
 
-        exit()
+    :param engine: engine of the database the scenario is copied from, created from args.database_url if it is None
+    """
+    import numpy as np
+
+    check_depot_simulation_mode(args.copy_mode)
+
+    #depot simulation stage, eflips.depot.api is only needed here
+    import eflips.depot.api
+    from eflips.depot.api import delete_depots, simple_consumption_simulation
+
+    from yurena_age_classes import assign_age_classes, capacity_factors, class_of_age, class_shares
+    from yurena_aggregation import index_lookup
+    from yurena_queries import query_rotation_table
+    from yurena_store import ResultsStore, results_folder
+
+    #by default only the rows of the scenario are copied into a working schema
+    workspace = open_workspace(args.database_url, args.scenario_id, mode=args.copy_mode, name=args.workspace,
+                               source=engine, echo=False)
+    with Session(workspace) as session:
+        scenario = session.query(Scenario).filter(Scenario.id == args.scenario_id).one()
+        assert isinstance(scenario, Scenario)
 
-        # create helpful dict that references depots by station id instead of depot id:
-        depot_station_ids = {depot.station_id: depot.id for depot in all_depots.values()}
-
-        all_rotations = session.query(Rotation).filter(Rotation.scenario_id == scenario.id).all()
-        all_trips = session.query(Trip).filter(Trip.scenario_id == scenario.id).all()
-        all_routes = session.query(Route).filter(Route.scenario_id == scenario.id).all()
-
-        #sort rotations by depot
-        rotations_in_depot = defaultdict(list)
-
-        #assign rotations to depots
-        for rot in all_rotations:
-            #checks all trips within rotation until a depot is found through route
-            for i in range(len(rot.trips)):
-                route = rot.trips[i].route
-                dep_id = route.departure_station_id
-                arr_id = route.arrival_station_id
-                #checks if arrival or departure station is a depot. if so, assigns the rotation o depot and goes to next rotation
-                if dep_id in depot_station_ids.keys():
-                    depot_id = depot_station_ids[dep_id]
-                    rotations_in_depot[depot_id].append(rot)
-                    break
-                elif arr_id in depot_station_ids.keys():
-                    depot_id = depot_station_ids[arr_id]
-                    rotations_in_depot[depot_id].append(rot)
-                    break
-
-        # This is the dictionary we will use to map from the "original" vehicle type to the "young" and "old"
-        # vehicle types
-        young_old_vts: dict[int, tuple[int, int]] = {} # Original ID maps to (young_id, old_id)
+        #dictionaries for easy access, keys are the ids
+        all_vehicletypes = {x.id: x for x in session.query(VehicleType).filter(VehicleType.scenario_id == scenario.id)}
+        all_depots = {x.id: x for x in session.query(Depot).filter(Depot.scenario_id == scenario.id)}
+
+        #depot, first departure, last arrival and distance of every rotation from one aggregated query instead of
+        #loading the trips and routes of each rotation, the table is sorted by rotation id
+        rotation_table = query_rotation_table(session, scenario.id)
+
+        #age classes of the vehicles in the steady state, see yurena_age_classes. The results of yurena_example give
+        #the max ages and the SoH curves, the steady state stage adds the number of vehicles of each age
+        results = ResultsStore(args.results or results_folder(args.scenario_id))
+        n_classes = args.age_classes
+        classes = class_of_age(results["lifespans"], n_classes)
+        if "age_distribution" in results:
+            age_distribution = results["age_distribution"]
+        else:
+            #without the steady state stage, every age gets the same number of vehicles
+            age_distribution = np.ones(classes.shape)
+        shares = class_shares(age_distribution, classes, n_classes)
+        factors = capacity_factors(results["soh_progression"], classes, n_classes)
+
+        # This is the dictionary we will use to map from the "original" vehicle type to the vehicle types of its age
+        # classes, e.g. "young" and "old"
+        age_class_vts: dict[int, list[int]] = {} # Original ID maps to the ids of its classes, youngest first
         for vt_id, vt in all_vehicletypes.items():
             vt_id: int # For PyCharm's autocomplete
 
-            young_vt = VehicleType()
-            for key, value in vars(vt).items():
-                if key not in ["id", "_sa_instance_state"]:  # Exclude primary key and SQLAlchemy internal state
-                    setattr(young_vt, key, value)
-            # Overwrite specific attributes for "young"
-            young_vt.name = f"{vt.name} (young)"
-            young_vt.battery_capacity = vt.battery_capacity * 0.9
-            young_vt.battery_capacity_reserve = vt.battery_capacity_reserve * 0.9
-
-            # Create a new "old" vehicle type by copying attributes
-            old_vt = VehicleType()
-            for key, value in vars(vt).items():
-                if key not in ["id", "_sa_instance_state"]:  # Exclude primary key and SQLAlchemy internal state
-                    setattr(old_vt, key, value)
-            # Overwrite specific attributes for "old"
-            old_vt.name = f"{vt.name} (old)"
-            old_vt.battery_capacity = vt.battery_capacity * 0.8
-            old_vt.battery_capacity_reserve = vt.battery_capacity_reserve * 0.8
-
-            session.add(young_vt)
-            session.add(old_vt)
-            session.flush()  # Assign ID to old_vt and young_vt
-            young_old_vts[vt.id] = (young_vt.id, old_vt.id)
+            class_vts = []
+            for k in range(n_classes):
+                # Create a new vehicle type by copying attributes
+                class_vt = VehicleType()
+                for key, value in vars(vt).items():
+                    if key not in ["id", "_sa_instance_state"]:  # Exclude primary key and SQLAlchemy internal state
+                        setattr(class_vt, key, value)
+                # Overwrite specific attributes, the capacity is reduced to the remaining capacity of the oldest vehicles
+                # of the class (between 0.8 and 1, see capacity_factors)
+                class_name = ("young", "old")[k] if n_classes == 2 else f"age class {k + 1}"
+                factor = float(factors[results.vehicle_type_indizes[vt_id], k])
+                class_vt.name = f"{vt.name} ({class_name})"
+                class_vt.battery_capacity = vt.battery_capacity * factor
+                class_vt.battery_capacity_reserve = vt.battery_capacity_reserve * factor
+                session.add(class_vt)
+                class_vts.append(class_vt)
+            session.flush()  # Assign IDs to the new vehicle types
+            age_class_vts[vt.id] = [class_vt.id for class_vt in class_vts]
+            print(f"Capacity factors of the age classes of {vt.name}: {np.round(factors[results.vehicle_type_indizes[vt_id]], 3)}")
         #session.commit()
 
-        #will save average duration of rotations of that vehicletype in that depot
-        all_rotation_durs = {}
-
-        #calculates the average duration of rotations in a depot for a certain vehicletype
-        for depot_id, depot in all_depots.items():
-            rots = rotations_in_depot[depot_id]
-            for vt_id, vt in all_vehicletypes.items():
-                #sorts for rotations with that vehicle id
-                vt_rots = [rot for rot in rots if rot.vehicle_type_id == vt_id]
-                rotation_durs = []
-                if vt_rots:
-                    #calculate avergage rotation duration
-                    for rotation in vt_rots:
-                        rot_duration = rotation.trips[-1].arrival_time - rotation.trips[0].departure_time
-                        rotation_durs.append(rot_duration)
-                    all_rotation_durs[depot_id, vt_id] = np.mean(rotation_durs)
-                    #print(f"Depot: {depot_id}, VT: {vt_id}, {all_rotation_durs[depot_id, vt_id]}")
-
-                    #assign rotations a new vehicletype_id based on if they are above or below average duration
-                    #vt_if = 0 means young, vt_id = 1 means old
-                    for rotation in vt_rots:
-                        rot_duration = rotation.trips[-1].arrival_time - rotation.trips[0].departure_time
-                        if rot_duration > all_rotation_durs[depot_id, vt_id]:
-                            rotation.vehicle_type_id = young_old_vts[vt_id][0]   #young
-                        else:
-                            rotation.vehicle_type_id = young_old_vts[vt_id][1]   #old
+        #depot x vehicle type index of every rotation, like in the results. Rotations without depot keep their vehicle type
+        depot_index = index_lookup(results.depot_ids, rotation_table["depot_id"])
+        vt_index = index_lookup(results.vehicle_type_ids, rotation_table["vehicle_type_id"])
+        group_index = np.where((depot_index >= 0) & (vt_index >= 0),
+                               depot_index * len(results.vehicle_type_ids) + vt_index, -1)
+
+        #the rotations with the largest duration (or distance) of a depot and vehicle type get the youngest vehicles,
+        #each class gets the share of the rotations that matches its share of the vehicles. Unlike the former split at the
+        #mean duration, the number of rotations of a class follows the number of vehicles of its ages
+        if args.age_class_metric == "distance":
+            metric = rotation_table["distance"]
+        else:
+            metric = rotation_table["arrival"] - rotation_table["departure"]
+        rotation_classes = assign_age_classes(group_index, metric, shares.reshape(-1, n_classes))
+
+        #new vehicle types of all rotations, written back with one bulk UPDATE by primary key
+        assigned = np.flatnonzero(rotation_classes >= 0)
+        if assigned.size:
+            session.execute(update(Rotation), [
+                {"id": rotation_id, "vehicle_type_id": age_class_vts[vt_id][k]}
+                for rotation_id, vt_id, k in zip(rotation_table["rotation_id"][assigned].tolist(),
+                                                 rotation_table["vehicle_type_id"][assigned].tolist(),
+                                                 rotation_classes[assigned].tolist())
+            ])
 
 
         #copied from eflips example.py to reset and run simulation
@@ -405,5 +362,35 @@ if __name__ == "__main__":
         eflips.depot.api.simulate_scenario(scenario)
 
         session.commit()
-    exit()
 
+    workspace.dispose()
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+
+    if args.database_url is None and (args.depot_simulation or not args.offline):
+        if "DATABASE_URL" not in os.environ:
+            raise ValueError(
+                "The database url must be specified either as an argument or as the environment variable DATABASE_URL."
+            )
+        args.database_url = os.environ["DATABASE_URL"]
+
+    if args.list_scenarios:
+        list_scenarios(args.database_url)
+        exit()
+
+    if args.scenario_id is None:
+        raise ValueError(
+            "The scenario id must be specified. Use --list-scenarios to see all available scenarios, then run with "
+            "--scenario-id <id>."
+        )
+    ###
+
+    #before the steady state, so a run with an unusable copy mode fails right away
+    if args.depot_simulation:
+        check_depot_simulation_mode(args.copy_mode)
+
+    run_steady_state(args)
+    if args.depot_simulation:
+        run_depot_simulation(args)
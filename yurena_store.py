@@ -0,0 +1,137 @@
+"""
+Results container that hands the results of yurena_example.py over to the following stages.
+
+The container is a folder with one .npy file per array and a manifest.json with the format version, the dtype and
+shape of every array and the index metadata (depot ids, vehicle type ids, vehicle ids, years). Arrays are opened
+lazily with memory mapping, so a stage only reads the parts it actually uses.
+
+Arrays written by yurena_example.py:
+    soh_progression: float32 (depots x vehicle types x years + 1), average SoH at the beginning of each year
+    vehicle_soh: float32 (vehicles x years + 1), SoH of each vehicle at the beginning of each year
+    lifespans: int16 (depots x vehicle types), age at which the vehicles reach their EoL, the number of simulated years
+        if they do not reach it or there are no vehicles
+    vehicle_depot: int32 (vehicles), depot id of each vehicle, -1 without depot
+    eol_week: int32 (vehicles), week of the simulation in which each vehicle reached its EoL, -1 if it did not
+    lifespan_weeks: float32 (depots x vehicle types), average number of weeks until the EoL of the vehicles that
+        reached it, NaN if none did
+    soh_percentiles: float32 (percentiles x depots x vehicle types x years + 1), only with --monte-carlo, the
+        percentiles are in the metadata
+
+Arrays added by yurena_steadystate.py:
+    age_distribution: int32 (depots x vehicle types x age groups), number of vehicles of each age in the steady state
+"""
+
+import json
+import os
+
+import numpy as np
+
+RESULTS_VERSION = 1
+MANIFEST = "manifest.json"
+
+
+def results_folder(scenario_id, base=None):
+    """Returns the default folder of the results container of a scenario."""
+    return os.path.join(base or os.getcwd(), f"sc_id{scenario_id}_results")
+
+
+def write_results(
+    folder, arrays, depot_ids, vehicle_type_ids, vehicle_ids, years, metadata=None
+):
+    """
+    Writes a results container, replacing the arrays of an existing one.
+
+    :param folder: folder of the container
+    :param arrays: dict with name and array, arrays are stored with their dtype
+    :param depot_ids: depot id for each depot index
+    :param vehicle_type_ids: vehicle type id for each vehicle type index
+    :param vehicle_ids: vehicle id for each vehicle index
+    :param years: number of simulated years
+    :param metadata: dict with additional JSON serializable information
+    """
+    os.makedirs(folder, exist_ok=True)
+    manifest = {
+        "version": RESULTS_VERSION,
+        "years": int(years),
+        "depot_ids": [int(i) for i in depot_ids],
+        "vehicle_type_ids": [int(i) for i in vehicle_type_ids],
+        "vehicle_ids": [int(i) for i in vehicle_ids],
+        "metadata": metadata or {},
+        "arrays": {},
+    }
+    _save_arrays(folder, manifest, arrays)
+
+
+def add_results(folder, arrays):
+    """
+    Adds the arrays of a later stage to an existing results container, arrays with the same name are replaced.
+
+    :param arrays: dict with name and array, arrays are stored with their dtype
+    """
+    with open(os.path.join(folder, MANIFEST)) as file:
+        manifest = json.load(file)
+    _save_arrays(folder, manifest, arrays)
+
+
+def _save_arrays(folder, manifest, arrays):
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        np.save(os.path.join(folder, f"{name}.npy"), array, allow_pickle=False)
+        manifest["arrays"][name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+        }
+
+    # the manifest is written last, so a container is only complete once it exists
+    temporary_path = os.path.join(folder, MANIFEST + ".tmp")
+    with open(temporary_path, "w") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(temporary_path, os.path.join(folder, MANIFEST))
+
+
+class ResultsStore:
+    """Read access to a results container, arrays are memory mapped when they are first accessed."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        with open(os.path.join(folder, MANIFEST)) as file:
+            self.manifest = json.load(file)
+        if self.manifest["version"] != RESULTS_VERSION:
+            raise ValueError(
+                f"Results in {folder} have version {self.manifest['version']}, expected {RESULTS_VERSION}."
+            )
+        self._arrays = {}
+
+        self.years = self.manifest["years"]
+        self.depot_ids = self.manifest["depot_ids"]
+        self.vehicle_type_ids = self.manifest["vehicle_type_ids"]
+        self.vehicle_ids = self.manifest["vehicle_ids"]
+        self.metadata = self.manifest["metadata"]
+        self.depot_indizes = {depot_id: i for i, depot_id in enumerate(self.depot_ids)}
+        self.vehicle_type_indizes = {
+            vt_id: i for i, vt_id in enumerate(self.vehicle_type_ids)
+        }
+
+    def __contains__(self, name):
+        return name in self.manifest["arrays"]
+
+    def __getitem__(self, name):
+        if name not in self._arrays:
+            if name not in self:
+                raise KeyError(f"There is no array {name} in {self.folder}.")
+            self._arrays[name] = np.load(
+                os.path.join(self.folder, f"{name}.npy"),
+                mmap_mode="r",
+                allow_pickle=False,
+            )
+        return self._arrays[name]
+
+    def vehicle_depots(self):
+        """Returns the vehicle to depot assignment as dict, without vehicles that have no depot."""
+        return {
+            vehicle_id: depot_id
+            for vehicle_id, depot_id in zip(
+                self.vehicle_ids, self["vehicle_depot"].tolist()
+            )
+            if depot_id >= 0
+        }
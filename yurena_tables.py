@@ -0,0 +1,247 @@
+"""
+Long-format results of the yearly capacity fade and the wide CSV tables rendered from them.
+
+LongResultsWriter streams one record per group and year into a single CSV file at full precision. The groups are the
+depot x vehicle type pairs, the depots (vehicle_type_id -1), the vehicle types (depot_id -1) and the whole fleet (both
+-1), with the same averages as the former per-year tables. The wide tables (one per year with the average capacity
+fade, one per depot with the SoH progression) are views of this file and can be rendered at any time.
+"""
+
+import csv
+import os
+
+import numpy as np
+
+ALL = -1
+PERCENTILES = (5, 50, 95)
+COLUMNS = ["depot_id", "vehicle_type_id", "year", "mean_cap_fade", "count"] + [
+    f"p{q}" for q in PERCENTILES
+]
+
+
+class LongResultsWriter:
+    """Buffered writer for the long-format results, use as context manager."""
+
+    def __init__(self, path, depot_ids, vehicle_type_ids, buffer_size=1024**2):
+        """
+        :param path: path of the CSV file, an existing file is replaced
+        :param depot_ids: depot id for each depot index of FleetGroups
+        :param vehicle_type_ids: vehicle type id for each vehicle type index of FleetGroups
+        """
+        self.path = path
+        self.depot_ids = list(depot_ids)
+        self.vehicle_type_ids = list(vehicle_type_ids)
+        self._file = open(path, "w", newline="", buffering=buffer_size)
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(COLUMNS)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def write_year(self, year, groups, cap_fade):
+        """
+        Writes the records of one year, groups without vehicles are left out.
+
+        :param groups: FleetGroups of the fleet
+        :param cap_fade: capacity fade of each vehicle at the beginning of the year
+        """
+        stats = groups.aggregate(cap_fade)
+        percentiles = groups.percentiles(cap_fade, PERCENTILES)
+        type_counts = np.bincount(groups.type_index, minlength=groups.n_types)
+
+        rows = []
+        for depot_index, depot_id in enumerate(self.depot_ids):
+            for vt_index, vt_id in enumerate(self.vehicle_type_ids):
+                count = stats["pair_count"][depot_index, vt_index]
+                if count > 0:
+                    rows.append(
+                        _record(
+                            depot_id,
+                            vt_id,
+                            year,
+                            stats["pair_mean"][depot_index, vt_index],
+                            count,
+                            percentiles["pair"][:, depot_index, vt_index],
+                        )
+                    )
+        for depot_index, depot_id in enumerate(self.depot_ids):
+            if not np.isnan(stats["depot_mean"][depot_index]):
+                rows.append(
+                    _record(
+                        depot_id,
+                        ALL,
+                        year,
+                        stats["depot_mean"][depot_index],
+                        stats["pair_count"][depot_index].sum(),
+                        percentiles["depot"][:, depot_index],
+                    )
+                )
+        for vt_index, vt_id in enumerate(self.vehicle_type_ids):
+            if not np.isnan(stats["type_mean"][vt_index]):
+                rows.append(
+                    _record(
+                        ALL,
+                        vt_id,
+                        year,
+                        stats["type_mean"][vt_index],
+                        type_counts[vt_index],
+                        percentiles["type"][:, vt_index],
+                    )
+                )
+        rows.append(
+            _record(
+                ALL,
+                ALL,
+                year,
+                stats["mean"],
+                len(groups.type_index),
+                percentiles["all"],
+            )
+        )
+        self._writer.writerows(rows)
+
+
+def _record(depot_id, vt_id, year, mean, count, percentiles):
+    # plain Python numbers, their repr keeps the full precision of the floats
+    return [int(depot_id), int(vt_id), int(year), float(mean), int(count)] + [
+        float(value) for value in percentiles
+    ]
+
+
+def read_long_results(path):
+    """
+    Reads the long-format results.
+
+    :return: dict with (depot_id, vehicle_type_id, year) as key and a dict with mean_cap_fade, count and the
+        percentiles as value
+    """
+    records = {}
+    with open(path, newline="") as file:
+        for row in csv.DictReader(file):
+            key = (int(row["depot_id"]), int(row["vehicle_type_id"]), int(row["year"]))
+            records[key] = {
+                name: int(value) if name == "count" else float(value)
+                for name, value in row.items()
+                if name not in ("depot_id", "vehicle_type_id", "year")
+            }
+    return records
+
+
+def render_year_table(records, year, depot_names, vehicle_type_names, path):
+    """
+    Renders the table with the average capacity fade of each depot and vehicle type after one year.
+
+    :param records: result of read_long_results
+    :param depot_names: dict with the name of each depot id, in the order of the rows
+    :param vehicle_type_names: dict with the name of each vehicle type id, in the order of the columns
+    """
+
+    def mean(depot_id, vt_id):
+        record = records.get((depot_id, vt_id, year))
+        return "---" if record is None else f"{record['mean_cap_fade']:.3f}"
+
+    with open(path, "w") as file:
+        file.write(f"Average capacity fade for vehicles after {year} years\n")
+        columns = (
+            ["Depot"] + list(vehicle_type_names.values()) + ["Depot Weighted Average"]
+        )
+        file.write(",".join(columns) + "\n")
+
+        for depot_id, depot_name in depot_names.items():
+            row = [depot_name] + [mean(depot_id, vt_id) for vt_id in vehicle_type_names]
+            row.append(mean(depot_id, ALL))
+            file.write(",".join(row) + "\n")
+
+        # vehicle types without vehicles in a depot are left out, like in the former tables
+        avg_row = ["Vehicle Type Weighted Average"] + [
+            mean(ALL, vt_id)
+            for vt_id in vehicle_type_names
+            if (ALL, vt_id, year) in records
+        ]
+        avg_row.append(mean(ALL, ALL))
+        file.write(",".join(avg_row) + "\n")
+
+
+def render_soh_progression_table(
+    records, depot_id, depot_name, vehicle_type_names, years, path
+):
+    """
+    Renders the table with the average SoH of each vehicle type of a depot for each age.
+
+    The row of a vehicle type ends with the age at which the average SoH drops below zero, ages without vehicles are
+    shown as ---, except for age 0, which is 1.000 for every vehicle type like in the former tables.
+
+    :param records: result of read_long_results
+    :param vehicle_type_names: dict with the name of each vehicle type id, in the order of the rows
+    :param years: number of simulated years
+    """
+    with open(path, "w") as file:
+        # Header: Vehicle types as rows and years as columns
+        file.write(f"Average SoH for {depot_name} Over {years} Years\n")
+        columns = (
+            ["Vehicle Type"]
+            + [f"Age {year - 1}" for year in range(1, years + 1)]
+            + ["Lifespan"]
+        )
+        file.write(",".join(columns) + "\n")
+
+        for vt_id, vt_name in vehicle_type_names.items():
+            row = [vt_name]
+            for age in range(0, years + 1):
+                if age >= years:
+                    row.append("0")
+                    break
+                record = records.get((depot_id, vt_id, age))
+                if record is None:
+                    row.append("1.000" if age == 0 else "---")
+                    continue
+                entry = 1 - record["mean_cap_fade"]
+                # if SoH dips below zero, vehicle does not reach the next age
+                if entry < 0:
+                    break
+                row.append(f"{entry:.3f}")
+            file.write(",".join(row) + "\n")
+
+
+def render_tables(
+    path,
+    depot_names,
+    depot_short_names,
+    vehicle_type_names,
+    years,
+    year_folder,
+    depot_folder,
+):
+    """
+    Renders all wide tables from the long-format results.
+
+    :param depot_short_names: dict with the name of each depot id used in the SoH progression tables
+    :param year_folder: folder for the average_capacity_fades_in_year<year>.csv tables
+    :param depot_folder: folder for the <depot>_avg_soh_progression_table.csv tables
+    """
+    records = read_long_results(path)
+    simulated_years = sorted({year for _, _, year in records})
+    for year in simulated_years:
+        if year > 0:
+            render_year_table(
+                records,
+                year,
+                depot_names,
+                vehicle_type_names,
+                os.path.join(year_folder, f"average_capacity_fades_in_year{year}.csv"),
+            )
+    for depot_id, depot_name in depot_short_names.items():
+        render_soh_progression_table(
+            records,
+            depot_id,
+            depot_name,
+            vehicle_type_names,
+            years,
+            os.path.join(depot_folder, f"{depot_name}_avg_soh_progression_table.csv"),
+        )
@@ -0,0 +1,343 @@
+"""
+Working copies of one scenario for the steady state simulation, which changes rotations, vehicles and depots.
+
+Instead of cloning the whole database for every run, only the rows of one scenario are copied:
+
+    schema      into a working schema of the same PostgreSQL database, with one INSERT ... SELECT per table. The
+                tables are created with CREATE TABLE ... (LIKE ... INCLUDING ALL), which does not copy the foreign
+                keys, so they are added again after the rows (NOT VALID, the copied rows are not checked again) and
+                ON DELETE cascades work in the copy as well. The engine of the copy finds the tables through the
+                search_path. No exclusive access to the database is needed.
+    sqlite      into a local SQLite file, the rows are streamed in chunks, e.g. to look at a scenario without the
+                database server. The geometry columns are left out, since geoalchemy2 can only read them back with
+                SpatiaLite, so objects with geometries (e.g. Station and Route) cannot be loaded from this copy and
+                the depot simulation, which loads them, cannot run on it (see check_depot_simulation_mode). The
+                tables have no foreign keys, cascades of the database are not applied, only the cascades of the ORM
+                relationships.
+    database    the former copy of the whole database with CREATE DATABASE ... WITH TEMPLATE, which terminates all
+                connections to the source database.
+
+The rows of a scenario are the Scenario row itself, the rows of all tables with a scenario_id column and the rows of
+other tables that reference those rows. The credentials are always taken from the database url.
+"""
+
+import os
+
+from sqlalchemy import (
+    JSON,
+    MetaData,
+    Table,
+    Column,
+    create_engine,
+    insert,
+    select,
+    text,
+)
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import CompileError
+
+COPY_MODES = ("schema", "sqlite", "database")
+# copy modes that keep the geometries of the stations and routes, which the depot simulation loads
+DEPOT_SIMULATION_MODES = ("schema", "database")
+
+
+def check_depot_simulation_mode(mode):
+    """Raises a ValueError if the depot simulation cannot run on a copy of this mode."""
+    if mode not in DEPOT_SIMULATION_MODES:
+        raise ValueError(
+            f"The depot simulation cannot run on a copy of mode {mode}, it loads the stations and routes with their "
+            f"geometries, which the {mode} copy does not contain. Use one of {DEPOT_SIMULATION_MODES}."
+        )
+
+
+def default_metadata():
+    """Metadata of the eflips.model tables."""
+    from eflips.model import Base, Scenario
+
+    return Base.metadata, Scenario.__table__
+
+
+def scenario_filter(table, scenario_table, scenario_id, _visited=None):
+    """
+    Where clause that selects the rows of a table that belong to one scenario.
+
+    :param scenario_table: table of the scenarios, filtered by its primary key
+    :return: clause, or None if the table has no relation to the scenarios and is copied completely
+    """
+    if table is scenario_table:
+        return list(table.primary_key.columns)[0] == scenario_id
+    if "scenario_id" in table.c:
+        return table.c.scenario_id == scenario_id
+
+    # rows that reference rows of the scenario, e.g. association tables
+    visited = (_visited or set()) | {table.name}
+    for foreign_key in table.foreign_keys:
+        parent = foreign_key.column.table
+        if parent.name in visited:
+            continue
+        parent_filter = scenario_filter(parent, scenario_table, scenario_id, visited)
+        if parent_filter is not None:
+            return foreign_key.parent.in_(
+                select(foreign_key.column).where(parent_filter)
+            )
+    return None
+
+
+def _quote(engine, *names):
+    preparer = engine.dialect.identifier_preparer
+    return ".".join(preparer.quote(name) for name in names)
+
+
+def copy_scenario_to_schema(
+    engine, scenario_id, schema, metadata=None, scenario_table=None
+):
+    """
+    Copies the rows of one scenario into a working schema of the same PostgreSQL database, an existing schema with this
+    name is replaced.
+
+    :param engine: engine of the database, the tables are read from its search_path (usually public)
+    :param metadata: tables to copy, defaults to the tables of eflips.model
+    :param scenario_table: table of the scenarios, defaults to the one of eflips.model
+    :return: dict with the number of copied rows of each table
+    """
+    if metadata is None:
+        metadata, scenario_table = default_metadata()
+    counts = {}
+    with engine.begin() as connection:
+        connection.execute(
+            text(f"DROP SCHEMA IF EXISTS {_quote(engine, schema)} CASCADE")
+        )
+        connection.execute(text(f"CREATE SCHEMA {_quote(engine, schema)}"))
+        for table in metadata.sorted_tables:
+            source = (
+                _quote(engine, table.schema, table.name)
+                if table.schema
+                else _quote(engine, table.name)
+            )
+            target = _quote(engine, schema, table.name)
+            # without the foreign keys, they are added once all rows are copied
+            connection.execute(
+                text(f"CREATE TABLE {target} (LIKE {source} INCLUDING ALL)")
+            )
+
+            result = connection.execute(
+                _copy_rows(
+                    table,
+                    schema,
+                    scenario_filter(table, scenario_table, scenario_id),
+                )
+            )
+            counts[table.name] = result.rowcount
+
+        # after all rows, so the order of the tables and circular references do not matter
+        for table in metadata.sorted_tables:
+            for constraint in table.foreign_key_constraints:
+                if constraint.referred_table.key in metadata.tables:
+                    connection.execute(
+                        text(_foreign_key_ddl(engine, schema, table, constraint))
+                    )
+    return counts
+
+
+def _copy_rows(table, schema, where=None):
+    """INSERT ... SELECT that copies the rows of a table (matching where) into its copy in the working schema."""
+    # the columns are named on both sides, so the column order of the database does not matter
+    columns = [column.name for column in table.columns]
+    target_table = Table(
+        table.name, MetaData(), *[Column(name) for name in columns], schema=schema
+    )
+    query = select(*table.columns)
+    if where is not None:
+        query = query.where(where)
+    return insert(target_table).from_select(columns, query)
+
+
+def _foreign_key_ddl(engine, schema, table, constraint):
+    """ALTER TABLE statement that adds a foreign key of the source table to its copy in the working schema."""
+    columns = ", ".join(_quote(engine, column.name) for column in constraint.columns)
+    referred_columns = ", ".join(
+        _quote(engine, element.column.name) for element in constraint.elements
+    )
+    ddl = (
+        f"ALTER TABLE {_quote(engine, schema, table.name)} ADD FOREIGN KEY ({columns}) "
+        f"REFERENCES {_quote(engine, schema, constraint.referred_table.name)} ({referred_columns})"
+    )
+    if constraint.ondelete:
+        ddl += f" ON DELETE {constraint.ondelete}"
+    if constraint.onupdate:
+        ddl += f" ON UPDATE {constraint.onupdate}"
+    if constraint.deferrable:
+        ddl += " DEFERRABLE"
+        if constraint.initially:
+            ddl += f" INITIALLY {constraint.initially}"
+    # the copied rows reference each other already, NOT VALID skips checking them again
+    return ddl + " NOT VALID"
+
+
+def schema_engine(database_url, schema, **kwargs):
+    """Engine that finds the tables of the working schema first, and everything else (e.g. PostGIS) in public."""
+    return create_engine(
+        database_url,
+        connect_args={"options": f"-csearch_path={schema},public"},
+        **kwargs,
+    )
+
+
+def _is_geometry(type_):
+    return type(type_).__module__.startswith("geoalchemy2")
+
+
+def _sqlite_columns(table):
+    """Columns of a table that are copied into SQLite, all but the geometry columns."""
+    return [column for column in table.columns if not _is_geometry(column.type)]
+
+
+def _sqlite_type(type_):
+    """Type of a column in the SQLite copy, PostgreSQL specific types get a type SQLite can store."""
+    try:
+        type_.compile(dialect=sqlite.dialect())
+    except CompileError:
+        # e.g. ARRAY and JSONB, their values are stored as JSON
+        return JSON()
+    return type_
+
+
+def copy_scenario_to_sqlite(
+    engine,
+    scenario_id,
+    path,
+    metadata=None,
+    scenario_table=None,
+    chunk_size=10000,
+):
+    """
+    Copies the rows of one scenario into a new SQLite file, an existing file is replaced.
+
+    The geometry columns and the foreign keys are not copied, see the sqlite mode above.
+
+    :param engine: engine of the source database
+    :param path: path of the SQLite file
+    :param metadata: tables to copy, defaults to the tables of eflips.model
+    :param scenario_table: table of the scenarios, defaults to the one of eflips.model
+    :param chunk_size: number of rows per INSERT
+    :return: dict with the number of copied rows of each table
+    """
+    if metadata is None:
+        metadata, scenario_table = default_metadata()
+    if os.path.exists(path):
+        os.remove(path)
+
+    target_metadata = MetaData()
+    for table in metadata.sorted_tables:
+        # without the foreign keys, SQLite does not enforce them by default anyway
+        Table(
+            table.name,
+            target_metadata,
+            *[
+                Column(
+                    column.name,
+                    _sqlite_type(column.type),
+                    primary_key=column.primary_key,
+                    nullable=column.nullable,
+                    autoincrement=column.autoincrement,
+                )
+                for column in _sqlite_columns(table)
+            ],
+        )
+    target = create_engine(f"sqlite:///{path}")
+    target_metadata.create_all(target)
+
+    counts = {}
+    with engine.connect() as source, target.begin() as connection:
+        for table in metadata.sorted_tables:
+            target_table = target_metadata.tables[table.name]
+            query = select(*_sqlite_columns(table))
+            where = scenario_filter(table, scenario_table, scenario_id)
+            if where is not None:
+                query = query.where(where)
+
+            counts[table.name] = 0
+            result = source.execution_options(yield_per=chunk_size).execute(query)
+            for rows in result.partitions(chunk_size):
+                records = [dict(row._mapping) for row in rows]
+                connection.execute(insert(target_table), records)
+                counts[table.name] += len(records)
+    target.dispose()
+    return counts
+
+
+def clone_database(database_url, copied_db):
+    """
+    Copies the whole database of the url with CREATE DATABASE ... WITH TEMPLATE, an existing copy is dropped first.
+
+    All connections to the source database and the copy get terminated, since PostgreSQL needs exclusive access to
+    the template.
+
+    :return: url of the copy
+    """
+    url = make_url(database_url)
+    original_db = url.database
+    admin = create_engine(url.set(database="postgres"), isolation_level="AUTOCOMMIT")
+    terminate = text(
+        "SELECT pg_terminate_backend(pid) FROM pg_stat_activity "
+        "WHERE datname = :database AND pid <> pg_backend_pid()"
+    )
+    with admin.connect() as connection:
+        connection.execute(terminate, {"database": copied_db})
+        connection.execute(text(f"DROP DATABASE IF EXISTS {_quote(admin, copied_db)}"))
+        print(f"Dropped existing database: {copied_db}")
+        connection.execute(terminate, {"database": original_db})
+        connection.execute(
+            text(
+                f"CREATE DATABASE {_quote(admin, copied_db)} "
+                f"WITH TEMPLATE {_quote(admin, original_db)}"
+            )
+        )
+        print(f"Database {copied_db} created successfully as a copy of {original_db}.")
+    admin.dispose()
+    return url.set(database=copied_db).render_as_string(hide_password=False)
+
+
+def open_workspace(
+    database_url, scenario_id, mode="schema", name=None, source=None, **kwargs
+):
+    """
+    Copies one scenario with the given mode and returns an engine of the copy.
+
+    :param mode: one of COPY_MODES
+    :param name: name of the working schema, SQLite file or database, defaults to eflips_steadystate_<scenario_id>
+        (with .sqlite in the working directory for the SQLite file)
+    :param source: engine of the database url to copy from, e.g. the one of the pipeline. If it is None, an engine is
+        created for the copy and disposed afterwards.
+    :param kwargs: passed on to create_engine for the copy
+    """
+    if mode not in COPY_MODES:
+        raise ValueError(f"Unknown copy mode {mode}, choose one of {COPY_MODES}.")
+    name = name or f"eflips_steadystate_{scenario_id}"
+
+    if mode == "database":
+        return create_engine(clone_database(database_url, name), **kwargs)
+
+    own_source = source is None
+    if own_source:
+        source = create_engine(database_url)
+    try:
+        if mode == "schema":
+            counts = copy_scenario_to_schema(source, scenario_id, name)
+            engine = schema_engine(database_url, name, **kwargs)
+        else:
+            path = (
+                name
+                if name.endswith(".sqlite")
+                else os.path.join(os.getcwd(), f"{name}.sqlite")
+            )
+            counts = copy_scenario_to_sqlite(source, scenario_id, path)
+            engine = create_engine(f"sqlite:///{path}", **kwargs)
+    finally:
+        if own_source:
+            source.dispose()
+    print(
+        f"Copied {sum(counts.values())} rows of scenario {scenario_id} into {name} ({mode})."
+    )
+    return engine